@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+# parts of pygchem (Python interface for GEOS-Chem Chemistry Transport Model)
+#
+# Copyright (C) 2014 Benoît Bovy
+# see license.txt for more details
+#
+
+"""
+On-disk cache of parsed HEMCO configuration files.
+
+Each cache entry is a compressed binary snapshot of the object (e.g., an
+:class:`emissions.Emissions` object) created from a configuration file.
+Entries are keyed by the path, size, modification time and content hash of
+the file, so that any change to the file invalidates its entry. The total
+size of the cache is bounded: least recently used entries are evicted
+first.
+
+The cache is opt-in: nothing is read from or written to :data:`CACHE_DIR`
+unless it is explicitly requested (e.g., ``Emissions.load(filename,
+use_cache=True)``).
+
+"""
+
+import os
+import hashlib
+import tempfile
+import warnings
+import zlib
+import cPickle as pickle
+
+import pyhemco
+
+
+# default cache directory (may be set by the 'PYHEMCO_CACHE_DIR'
+# environment variable)
+CACHE_DIR = os.environ.get('PYHEMCO_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'),
+                                        '.pyhemco', 'cache'))
+
+# maximum total size of the cache entries (bytes)
+CACHE_MAX_SIZE = 256 * 1024 * 1024
+
+# set to False to disable the cache globally (even when requested)
+ENABLED = True
+
+# increase when the layout of cached objects changes (in a release)
+CACHE_FORMAT = 1
+
+CACHE_SUFFIX = '.pkz'
+
+
+def file_key(filename):
+    """
+    Return the key (path, size, modification time, content hash) of the
+    file `filename`.
+    """
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(chunk)
+    return (path, stat.st_size, stat.st_mtime, sha1.hexdigest())
+
+
+def _entry_path(path, cache_dir, tag=None):
+    """Return the path to the cache entry of the file at `path`."""
+    name = hashlib.sha1(path.encode('utf-8'))
+    if tag is not None:
+        name.update(repr(tag))
+    return os.path.join(cache_dir, name.hexdigest() + CACHE_SUFFIX)
+
+
+def _header(key, tag=None):
+    return (CACHE_FORMAT, pyhemco.__version__, key, tag)
+
+
+def get(filename, cache_dir=None, key=None, tag=None):
+    """
+    Return the cached object created from the file `filename`, or None if
+    no valid cache entry is found.
+
+    Parameters
+    ----------
+    filename : string
+        Name of (path to) the file.
+    cache_dir : string or None
+        Cache directory (default: :data:`CACHE_DIR`).
+    key : tuple or None
+        Key of the file, if already computed (see :func:`file_key`).
+    tag : object or None
+        Any object with a stable representation (e.g., a tuple of options)
+        that distinguishes different objects created from a same file.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    key = key or file_key(filename)
+    entry = _entry_path(key[0], cache_dir, tag)
+    if not os.path.exists(entry):
+        return None
+
+    try:
+        with open(entry, 'rb') as f:
+            if pickle.load(f) != _header(key, tag):
+                return None
+            obj = pickle.loads(zlib.decompress(f.read()))
+    except Exception:
+        # corrupted or incompatible entry
+        _remove(entry)
+        return None
+
+    # mark the entry as recently used
+    try:
+        os.utime(entry, None)
+    except OSError:
+        pass
+    return obj
+
+
+def put(filename, obj, cache_dir=None, max_size=None, key=None, tag=None):
+    """
+    Save a snapshot of the object `obj` created from the file `filename`
+    in the cache, then evict the least recently used entries if the cache
+    exceeds its maximum size.
+
+    Parameters
+    ----------
+    filename : string
+        Name of (path to) the file.
+    obj : object
+        Any object that can be pickled.
+    cache_dir : string or None
+        Cache directory (default: :data:`CACHE_DIR`).
+    max_size : int or None
+        Maximum size of the cache in bytes (default: :data:`CACHE_MAX_SIZE`).
+    key : tuple or None
+        Key of the file, if already computed (see :func:`file_key`). Should
+        be computed before `obj` is created from the file.
+    tag : object or None
+        See :func:`get`.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    key = key or file_key(filename)
+    entry = _entry_path(key[0], cache_dir, tag)
+
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    # write to a temporary file first so that concurrent readers never see
+    # a partial entry
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(_header(key, tag), f, pickle.HIGHEST_PROTOCOL)
+            f.write(zlib.compress(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)))
+        os.rename(tmp_path, entry)
+    except Exception:
+        _remove(tmp_path)
+        raise
+
+    evict(cache_dir, max_size, keep=entry)
+
+
+def evict(cache_dir=None, max_size=None, keep=None):
+    """
+    Remove the least recently used cache entries until the total size of
+    the cache is not larger than `max_size` bytes. The entry `keep` (path)
+    is never removed.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    if max_size is None:
+        max_size = CACHE_MAX_SIZE
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(CACHE_SUFFIX):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        if path == keep:
+            continue
+        _remove(path)
+        total_size -= size
+
+
+def clear(cache_dir=None):
+    """Remove all entries in the cache."""
+    evict(cache_dir, max_size=0)
+
+
+def load(filename, loader, cache_dir=None, max_size=None, tag=None):
+    """
+    Return the object created by `loader(filename)`, using the cache
+    whenever possible.
+
+    A valid cache entry is deserialized instead of calling `loader`.
+    Otherwise, the object returned by `loader` is saved in the cache.
+    Failures when saving the object only issue a warning. Objects created
+    with different options from a same file must be given different `tag`
+    values (see :func:`get`).
+    """
+    key = file_key(filename)
+    obj = get(filename, cache_dir=cache_dir, key=key, tag=tag)
+    if obj is not None:
+        return obj
+
+    obj = loader(filename)
+    try:
+        put(filename, obj, cache_dir=cache_dir, max_size=max_size, key=key,
+            tag=tag)
+    except Exception as err:
+        warnings.warn("Could not save '{0}' in the cache: {1}"
+                      .format(filename, err))
+    return obj
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+# parts of pygchem (Python interface for GEOS-Chem Chemistry Transport Model)
+#
+# Copyright (C) 2014 Benoît Bovy
+# see license.txt for more details
+#
+
+"""
+Command-line interface (``pyhemco`` script).
+
+Validate and convert (re-save) many HEMCO configuration files at once.
+Each file is read, its scale factor and extension IDs are checked (or
+resolved) and it is written again, the files being distributed across a
+pool of processes. A JSON summary with the timings and the errors of each
+file is reported.
+
+Examples
+--------
+Validate all configuration files of a directory, using 4 processes::
+
+    $ pyhemco -j 4 runs/*/HEMCO_Config
+
+Re-save them into another directory and write the summary into a file::
+
+    $ pyhemco -o converted --summary summary.json runs/*/HEMCO_Config
+
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import traceback
+import multiprocessing
+
+import pyhemco
+import pyhemco.emissions   # also required by pyhemco.io
+from pyhemco.io import read_config_file, write_config_file
+
+
+def process_file(task):
+    """
+    Read, check and write one configuration file.
+
+    Parameters
+    ----------
+    task : tuple
+        (path to the input file, path to the output file or None,
+        resolve_id). If no output file is given, the file is written into
+        a temporary file that is then removed.
+
+    Returns
+    -------
+    A dictionary with the input and output paths, the status of the
+    conversion ('ok'), the error message and traceback (if any) and the
+    time spent in each step (seconds).
+    """
+    path, output, resolve_id = task
+    result = {'path': path, 'output': output, 'ok': False,
+              'error': None, 'traceback': None, 'timings': {}}
+    timings = result['timings']
+    start = time.time()
+    step = 'read'
+
+    try:
+        t0 = time.time()
+        emis_setup = read_config_file(path)
+        timings['read'] = time.time() - t0
+
+        step = 'check_id'
+        t0 = time.time()
+        if resolve_id:
+            emis_setup.resolve_id()
+        else:
+            emis_setup.check_id()
+        timings['check_id'] = time.time() - t0
+
+        step = 'write'
+        t0 = time.time()
+        if output is None:
+            fd, tmp_name = tempfile.mkstemp(prefix='pyhemco_')
+            os.close(fd)
+            try:
+                write_config_file(emis_setup, tmp_name)
+            finally:
+                os.remove(tmp_name)
+        else:
+            write_config_file(emis_setup, output)
+        timings['write'] = time.time() - t0
+
+        result['ok'] = True
+    except Exception as err:
+        result['error'] = "{0} ({1}): {2}".format(type(err).__name__, step,
+                                                  err)
+        result['traceback'] = traceback.format_exc()
+
+    timings['total'] = time.time() - start
+    return result
+
+
+def run(paths, output_dir=None, jobs=None, resolve_id=False):
+    """
+    Read, check and write configuration files in parallel.
+
+    Parameters
+    ----------
+    paths : list of strings
+        Paths to the configuration files.
+    output_dir : string or None
+        If given, directory where the files are written (with the same
+        base name). Otherwise, files are only validated.
+    jobs : int or None
+        Number of processes (default: number of CPUs).
+    resolve_id : bool
+        If True, resolve ID conflicts instead of reporting them as errors.
+
+    Returns
+    -------
+    A summary (dictionary) with the results of each file (see
+    :func:`process_file`), in the order of `paths`.
+    """
+    jobs = jobs or multiprocessing.cpu_count()
+    jobs = max(1, min(jobs, len(paths)))
+
+    tasks = []
+    for path in paths:
+        output = None
+        if output_dir is not None:
+            output = os.path.join(output_dir, os.path.basename(path))
+        tasks.append((path, output, resolve_id))
+
+    # the output files must be distinct
+    outputs = [task[1] for task in tasks if task[1] is not None]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError("Several input files have the same name: cannot "
+                         "write them into a same output directory")
+    if output_dir is not None and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    start = time.time()
+    if jobs == 1:
+        results = [process_file(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = pool.map(process_file, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    return {'version': pyhemco.__version__,
+            'jobs': jobs,
+            'n_files': len(results),
+            'n_failed': len([r for r in results if not r['ok']]),
+            'elapsed': time.time() - start,
+            'files': results}
+
+
+def main(argv=None):
+    """Entry point of the ``pyhemco`` script."""
+    parser = argparse.ArgumentParser(
+        prog='pyhemco',
+        description="Validate and re-save HEMCO configuration files. "
+                    "A JSON summary is reported.")
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help="HEMCO configuration file(s)")
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help="write the files into this directory "
+                             "(default: validate only)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of processes (default: number of CPUs)")
+    parser.add_argument('--resolve-id', action='store_true',
+                        help="resolve scale factor and extension ID "
+                             "conflicts instead of reporting them")
+    parser.add_argument('--summary', default=None, metavar='FILE',
+                        help="write the summary into FILE "
+                             "(default: standard output)")
+    args = parser.parse_args(argv)
+
+    try:
+        summary = run(args.paths, output_dir=args.output_dir,
+                      jobs=args.jobs, resolve_id=args.resolve_id)
+    except (ValueError, OSError) as err:
+        parser.error(str(err))
+
+    if args.summary is None:
+        json.dump(summary, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+
+    return 1 if summary['n_failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
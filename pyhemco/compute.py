@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+
+# parts of pygchem (Python interface for GEOS-Chem Chemistry Transport Model)
+#
+# Copyright (C) 2014 Benoît Bovy
+# see license.txt for more details
+#
+
+"""
+Computation of emissions from the emission settings (NumPy engine).
+
+Base emission fields are scaled by their scale factors and masks, then
+assembled by species, category and hierarchy, as described in the header
+of HEMCO configuration files. All operations are done on whole arrays, in
+preallocated buffers.
+
+Examples
+--------
+>>> grid = Grid.regular(1., 1.)
+>>> engine = EmissionEngine(grid)
+>>> emis = engine.compute(emis_setup, datetime.datetime(2005, 7, 1))
+>>> emis['NO'].shape
+(360, 180)
+
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+import pyhemco
+
+
+# operators of scale factors (config file values and API values)
+OPERATORS = {'1': 'mul', '*': 'mul', 'mul': 'mul',
+             '-1': 'div', '/': 'div', 'div': 'div',
+             '2': 'square', '**2': 'square', 'square': 'square',
+             '3': 'mirror', 'mirror': 'mirror'}
+
+
+class Grid(object):
+    """
+    A horizontal, longitude-latitude grid.
+
+    Parameters
+    ----------
+    lon : array-like
+        Longitudes of the grid box centers (degrees east).
+    lat : array-like
+        Latitudes of the grid box centers (degrees north).
+
+    Notes
+    -----
+    Gridded data (and computed emissions) have the shape (nlon, nlat).
+    """
+
+    def __init__(self, lon, lat):
+        self.lon = np.asarray(lon, dtype='f8')
+        self.lat = np.asarray(lat, dtype='f8')
+
+    @classmethod
+    def regular(cls, dlon, dlat):
+        """Return a global grid with a resolution of `dlon` x `dlat`."""
+        lon = np.arange(-180. + dlon / 2., 180., dlon)
+        lat = np.arange(-90. + dlat / 2., 90., dlat)
+        return cls(lon, lat)
+
+    @property
+    def shape(self):
+        return (self.lon.size, self.lat.size)
+
+    def window(self, lon1, lat1, lon2, lat2):
+        """
+        Return a boolean array which is True for the grid boxes whose center
+        is inside the window Lon1/Lat1 (lower left corner) - Lon2/Lat2
+        (upper right corner). The window may cross the date line
+        (`lon1` > `lon2`).
+        """
+        if lon1 <= lon2:
+            in_lon = (self.lon >= lon1) & (self.lon <= lon2)
+        else:
+            in_lon = (self.lon >= lon1) | (self.lon <= lon2)
+        in_lat = (self.lat >= lat1) & (self.lat <= lat2)
+        return np.logical_and.outer(in_lon, in_lat)
+
+    def __repr__(self):
+        return '<{0}: {1}x{2}>'.format(self.__class__.__name__, *self.shape)
+
+
+def operator(gc_field):
+    """
+    Return the operator ('mul', 'div', 'square' or 'mirror') of a scale
+    factor or mask (:class:`emissions.GCField` object).
+    """
+    sf_attr = gc_field.attributes[pyhemco.emissions.SF_ATTR_NAME]
+    if sf_attr.get('mirror'):
+        return 'mirror'
+    try:
+        return OPERATORS[str(sf_attr.get('operator', 'mul'))]
+    except KeyError:
+        # TODO: raise a custom Exception
+        raise ValueError("Unknown operator '{0}' for scale factor '{1}'"
+                         .format(sf_attr.get('operator'), gc_field.name))
+
+
+def scalar_value(values, time):
+    """
+    Return the scalar value at `time` (datetime) of a scalar field.
+
+    `values` has 1 (uniform), 24 (hourly, 12am to 11pm), 7 (day of week,
+    Sunday to Saturday) or 12 (monthly) values.
+    """
+    values = np.ravel(values)
+    n = values.size
+    if n == 1:
+        return values[0]
+    elif n == 24:
+        return values[time.hour]
+    elif n == 7:
+        return values[(time.weekday() + 1) % 7]
+    elif n == 12:
+        return values[time.month - 1]
+    # TODO: raise a custom Exception
+    raise ValueError("Invalid number of scalar values: {0}".format(n))
+
+
+def apply_operator(out, data, op):
+    """
+    Apply in place to `out` the scale factor `data` (array or scalar) with
+    the operator `op` (see :func:`operator`).
+
+    Zeros are ignored by 'div' (the values of `out` are unchanged).
+    """
+    if op == 'mul':
+        np.multiply(out, data, out=out)
+    elif op == 'div':
+        if np.ndim(data):
+            np.divide(out, data, out=out, where=data != 0)
+        elif data != 0:
+            np.divide(out, data, out=out)
+    elif op == 'square':
+        np.multiply(out, data, out=out)
+        np.multiply(out, data, out=out)
+    elif op == 'mirror':
+        np.multiply(out, 1. - data, out=out)
+    else:
+        # TODO: raise a custom Exception
+        raise ValueError("Unknown operator '{0}'".format(op))
+    return out
+
+
+class Compositor(object):
+    """
+    Assemble the fields of one species and category, stacked by hierarchy.
+
+    Each level of the stack holds the (summed) fields of one hierarchy and
+    a validity mask (where these fields are defined). The level of the
+    highest hierarchy which is valid is selected for every grid box in a
+    single vectorized pass, i.e., higher hierarchies overwrite lower ones
+    where they are defined.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the fields.
+
+    Examples
+    --------
+    >>> comp = Compositor(grid.shape)
+    >>> comp.reset()
+    >>> values, valid = comp.add_level(1)
+    >>> values[...] = global_field; valid[...] = True
+    >>> values, valid = comp.add_level(10)
+    >>> values[...] = regional_field; valid[...] = region
+    >>> comp.composite(out)
+    >>> comp.contributions()[10]    # where the regional field is used
+
+    Notes
+    -----
+    Stacked arrays are allocated once and grown when needed.
+    """
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        self.hierarchies = []
+        self._values = np.empty((0,) + self.shape)
+        self._valid = np.empty((0,) + self.shape, dtype=bool)
+        self._top = np.empty(self.shape, dtype=np.intp)
+        self._defined = np.empty(self.shape, dtype=bool)
+        # indexes of the grid boxes, to gather the values of the top levels
+        self._boxes = np.ix_(*[np.arange(n) for n in self.shape])
+
+    def reset(self):
+        """Remove all levels."""
+        self.hierarchies = []
+
+    def add_level(self, hierarchy):
+        """
+        Add a level on top of the stack (hierarchies must be added in
+        increasing order).
+
+        Returns
+        -------
+        The arrays (values, valid) of the new level, to be filled in place.
+        """
+        if self.hierarchies and hierarchy <= self.hierarchies[-1]:
+            # TODO: raise a custom Exception
+            raise ValueError("Hierarchies must be added in increasing order")
+        n = len(self.hierarchies)
+        if n == len(self._values):
+            size = max(4, 2 * n)
+            values = np.empty((size,) + self.shape)
+            valid = np.empty((size,) + self.shape, dtype=bool)
+            values[:n] = self._values
+            valid[:n] = self._valid
+            self._values, self._valid = values, valid
+        self.hierarchies.append(hierarchy)
+        return self._values[n], self._valid[n]
+
+    def composite(self, out):
+        """
+        Assemble the levels into `out`: for each grid box, the value of the
+        highest valid level (0 where no level is valid).
+        """
+        n = len(self.hierarchies)
+        if not n:
+            out[...] = 0.
+            return out
+        values, valid = self._values[:n], self._valid[:n]
+        # index of the highest valid level (first valid in reverse order)
+        np.argmax(valid[::-1], axis=0, out=self._top)
+        np.subtract(n - 1, self._top, out=self._top)
+        np.logical_or.reduce(valid, axis=0, out=self._defined)
+        np.multiply(values[(self._top,) + self._boxes], self._defined,
+                    out=out)
+        return out
+
+    def hierarchy_map(self):
+        """
+        Return an array with the hierarchy of the level used in each grid box
+        by the last :meth:`composite` (-1 where no level is valid).
+        """
+        hierarchy_map = np.take(self.hierarchies, self._top)
+        hierarchy_map[~self._defined] = -1
+        return hierarchy_map
+
+    def contributions(self):
+        """
+        Return the contribution maps of the last :meth:`composite`, i.e.,
+        {hierarchy: boolean array True where the level is used}.
+        """
+        return OrderedDict(
+            (hierarchy, (self._top == i) & self._defined)
+            for i, hierarchy in enumerate(self.hierarchies))
+
+
+class EmissionEngine(object):
+    """
+    Compute emissions on a grid.
+
+    Parameters
+    ----------
+    grid : :class:`Grid` object
+        The grid of the computed emissions.
+    data_loader : callable or None
+        Called as ``data_loader(field, time)`` to get the data of the fields
+        which have no data (e.g., to read it from the field's file). If
+        None, all fields must have data.
+
+    Notes
+    -----
+    The work arrays are allocated once per engine: use the same engine to
+    compute emissions at several times. The grouping of the base emission
+    fields by species, category and hierarchy is kept as long as the
+    emission settings don't change (see :attr:`emissions.Emissions.version`).
+    """
+
+    def __init__(self, grid, data_loader=None):
+        self.grid = grid
+        self.data_loader = data_loader
+        shape = grid.shape
+        self._field = np.empty(shape)
+        self._valid = np.empty(shape, dtype=bool)
+        self._mask = np.empty(shape)
+        self._category = np.empty(shape)
+        self._windows = {}
+        self.compositor = Compositor(shape)
+        self._groups = None
+        self._groups_key = None
+
+    def field_data(self, gc_field, time):
+        """
+        Return the data of `gc_field` at `time`: a scalar for scalar fields,
+        an array of the shape of the grid for gridded fields.
+        """
+        data = gc_field.data
+        if data is None or np.size(data) == 0:
+            if self.data_loader is not None:
+                data = np.asarray(self.data_loader(gc_field, time))
+            if data is None or np.size(data) == 0:
+                # TODO: raise a custom Exception
+                raise ValueError("No data for field '{0}'"
+                                 .format(gc_field.name))
+        if np.ndim(data) <= 1:
+            return scalar_value(data, time)
+        if np.shape(data) != self.grid.shape:
+            # TODO: raise a custom Exception
+            raise ValueError("Data of field '{0}' has shape {1}, expected "
+                             "the shape of the grid {2}"
+                             .format(gc_field.name, np.shape(data),
+                                     self.grid.shape))
+        return data
+
+    def scale(self, gc_field, time, out, valid):
+        """
+        Compute the base emission field `gc_field` at `time`, with its scale
+        factors and masks applied (in this order), into the array `out`.
+
+        Returns
+        -------
+        True if the field has masks, in which case the boolean array `valid`
+        is set to True where the field is defined (i.e., inside the masks).
+        Otherwise, the field is defined everywhere and `valid` is not set.
+
+        Notes
+        -----
+        Masks are zero outside their mask window, so that a regional field
+        is defined only inside the window of its mask.
+        """
+        out[...] = self.field_data(gc_field, time)
+        masked = False
+        sf_name = pyhemco.emissions.SF_ATTR_NAME
+        for scal in gc_field.emission_scale_factors:
+            data = self.field_data(scal, time)
+            op = operator(scal)
+            is_mask = scal.is_mask()
+            mask_window = scal.attributes[sf_name].get('mask_window')
+            if is_mask and mask_window is not None:
+                data = np.multiply(data, self.window(mask_window),
+                                   out=self._mask)
+            apply_operator(out, data, op)
+            if is_mask:
+                if not masked:
+                    valid[...] = True
+                    masked = True
+                if op == 'mirror':
+                    np.logical_and(valid, np.less(data, 1.), out=valid)
+                else:
+                    np.logical_and(valid, np.greater(data, 0.), out=valid)
+        return masked
+
+    def window(self, mask_window):
+        """
+        Return the boolean array of a mask window Lon1/Lat1/Lon2/Lat2 (see
+        :meth:`Grid.window`), computed once per window.
+        """
+        key = tuple(mask_window)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = self.grid.window(*key)
+        return window
+
+    def groups(self, emis_setup):
+        """
+        Return the base emission fields of HEMCO Core, grouped by species,
+        category and hierarchy: {species: {category: {hierarchy: [fields]}}}
+        (species in the order of their first field, categories and
+        hierarchies in increasing order).
+        """
+        key = (id(emis_setup), emis_setup.version)
+        if self._groups_key == key:
+            return self._groups
+        bef_name = pyhemco.emissions.BEF_ATTR_NAME
+        groups = OrderedDict()
+        core = emis_setup.get_extension(0)
+        for field in core.base_emission_fields:
+            e_attr = field.attributes[bef_name]
+            categories = groups.setdefault(str(e_attr['species']), {})
+            hierarchies = categories.setdefault(e_attr['category'], {})
+            hierarchies.setdefault(e_attr['hierarchy'], []).append(field)
+        for species, categories in groups.items():
+            groups[species] = OrderedDict(
+                (cat, OrderedDict(sorted(categories[cat].items())))
+                for cat in sorted(categories))
+        self._groups = groups
+        self._groups_key = key
+        return groups
+
+    def assemble(self, hierarchies, time, out):
+        """
+        Assemble the fields of one species and category into `out`.
+
+        `hierarchies` is {hierarchy: [fields]} (in increasing order). Fields
+        of the same hierarchy are added, and overwrite the fields of lower
+        hierarchies where they are defined (see :class:`Compositor`).
+        """
+        comp = self.compositor
+        comp.reset()
+        field, valid = self._field, self._valid
+        for hierarchy, fields in hierarchies.items():
+            level, level_valid = comp.add_level(hierarchy)
+            level[...] = 0.
+            level_valid[...] = False
+            everywhere = False
+            for gc_field in fields:
+                if not self.scale(gc_field, time, field, valid):
+                    everywhere = True
+                elif not everywhere:
+                    level_valid |= valid
+                level += field
+            if everywhere:
+                level_valid[...] = True
+        return comp.composite(out)
+
+    def compute(self, emis_setup, time, out=None, contributions=None):
+        """
+        Compute the emissions of each species at `time` (datetime).
+
+        Parameters
+        ----------
+        emis_setup : :class:`emissions.Emissions` object
+            The emission settings (only HEMCO Core fields are used).
+        time : datetime
+            Time of the emissions (used for scalar fields with hourly,
+            day-of-week or monthly values, and given to `data_loader`).
+        out : dict or None
+            Arrays {species: array} where emissions are written (the arrays
+            of missing species are allocated and added).
+        contributions : dict or None
+            If given, the map of the hierarchy used in each grid box (see
+            :meth:`Compositor.hierarchy_map`) is set for each species and
+            category, i.e., {(species, category): array}.
+
+        Returns
+        -------
+        A dictionary {species: array}, i.e., the sum over all categories
+        of the assembled fields of each species.
+        """
+        result = OrderedDict()
+        for species, categories in self.groups(emis_setup).items():
+            total = None if out is None else out.get(species)
+            if total is None:
+                total = np.empty(self.grid.shape)
+                if out is not None:
+                    out[species] = total
+            total[...] = 0.
+            for category, hierarchies in categories.items():
+                total += self.assemble(hierarchies, time, self._category)
+                if contributions is not None:
+                    contributions[species, category] = \
+                        self.compositor.hierarchy_map()
+            result[species] = total
+        return result
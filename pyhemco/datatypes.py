@@ -11,6 +11,381 @@ Misc classes for generic data structures.
 
 """
 
+import copy
+import itertools
+import threading
+from thread import get_ident
+from functools import wraps
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+from collections import OrderedDict
+
+import numpy as np
+
+
+# placeholder of removed objects in the storage of collections
+_REMOVED = object()
+
+# no bound for ranges of values in sorted indexes
+_UNBOUNDED = object()
+
+# shared (never modified) mapping of collections without index: the
+# mappings of indexes are replaced rather than modified
+_NO_INDEX = {}
+
+
+def _key(obj):
+    """
+    Return the key of `obj` in the storage of collections: the object itself
+    (so that equal objects have the same key) or, if the object is not
+    hashable, its identity.
+    """
+    try:
+        hash(obj)
+    except TypeError:
+        return ('__id__', id(obj))
+    return obj
+
+
+def _attr_equals(attr_name, attr_val):
+    """Return a predicate testing if `attr_name` of an object is `attr_val`."""
+    return lambda obj: getattr(obj, attr_name) == attr_val
+
+
+def _attr_value(obj, key):
+    """
+    Return the value of the attribute `key` of `obj` (or the value
+    returned by `key(obj)` if `key` is callable).
+    """
+    if callable(key):
+        return key(obj)
+    return getattr(obj, key)
+
+
+class _RWLock(object):
+    """
+    A readers-writer lock: several threads may hold the lock for reading
+    at the same time, only one thread may hold it for writing. Waiting
+    writers have priority over new readers.
+
+    The lock is reentrant: a thread holding the lock (for reading or
+    writing) may acquire it again for reading, and a writer may acquire it
+    again for writing. A reader cannot acquire the lock for writing.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = {}
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        me = get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if me not in self._readers:
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._release_write()
+                return
+            self._readers[me] -= 1
+            if not self._readers[me]:
+                del self._readers[me]
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def acquire_write(self):
+        me = get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("Cannot write while reading (lock "
+                                   "held for reading by the same thread)")
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        with self._cond:
+            self._release_write()
+
+    def _release_write(self):
+        self._writer_depth -= 1
+        if not self._writer_depth:
+            self._writer = None
+            self._cond.notify_all()
+
+
+class _Locked(object):
+    """Context manager for a collection lock (no-op if no lock)."""
+
+    def __init__(self, lock, write):
+        self.lock = lock
+        self.write = write
+
+    def __enter__(self):
+        if self.lock is not None:
+            if self.write:
+                self.lock.acquire_write()
+            else:
+                self.lock.acquire_read()
+
+    def __exit__(self, *exc_info):
+        if self.lock is not None:
+            if self.write:
+                self.lock.release_write()
+            else:
+                self.lock.release_read()
+
+
+def _reading(method):
+    """Run `method` with the collection lock held for reading."""
+    @wraps(method)
+    def locked_method(self, *args, **kwargs):
+        lock = self._lock
+        if lock is None:
+            return method(self, *args, **kwargs)
+        lock.acquire_read()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_read()
+    return locked_method
+
+
+def _writing(method):
+    """Run `method` with the collection lock held for writing."""
+    @wraps(method)
+    def locked_method(self, *args, **kwargs):
+        lock = self._lock
+        if lock is None:
+            return method(self, *args, **kwargs)
+        lock.acquire_write()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_write()
+    return locked_method
+
+
+class _SortedIndex(object):
+    """
+    A sorted (secondary) index: the values of an attribute (or key function)
+    for all objects of a collection, in ascending order, so that objects can
+    be selected by ranges of values using bisection.
+    """
+
+    def __init__(self, key, objects):
+        self.key = key
+        pairs = sorted(((_attr_value(obj, key), obj) for obj in objects),
+                       key=lambda pair: pair[0])
+        self.values = [pair[0] for pair in pairs]
+        self.objects = [pair[1] for pair in pairs]
+
+    def add(self, obj):
+        value = _attr_value(obj, self.key)
+        i = bisect_right(self.values, value)
+        self.values.insert(i, value)
+        self.objects.insert(i, obj)
+
+    def add_many(self, objs):
+        pairs = zip(self.values, self.objects)
+        pairs.extend((_attr_value(obj, self.key), obj) for obj in objs)
+        pairs.sort(key=lambda pair: pair[0])
+        self.values = [pair[0] for pair in pairs]
+        self.objects = [pair[1] for pair in pairs]
+
+    def remove_many(self, ids):
+        """Remove the objects which identity is in `ids`."""
+        keep = [i for i, obj in enumerate(self.objects) if id(obj) not in ids]
+        self.values = [self.values[i] for i in keep]
+        self.objects = [self.objects[i] for i in keep]
+
+    def remove(self, obj):
+        value = _attr_value(obj, self.key)
+        lo = bisect_left(self.values, value)
+        hi = bisect_right(self.values, value)
+        candidates = range(lo, hi)
+        if not any(self.objects[i] is obj for i in candidates):
+            # value has been changed: search all objects
+            candidates = range(len(self.objects))
+        for i in candidates:
+            if self.objects[i] is obj:
+                del self.values[i]
+                del self.objects[i]
+                break
+
+    def range(self, lower=_UNBOUNDED, upper=_UNBOUNDED, include_lower=True,
+              include_upper=True):
+        """
+        Return the objects which value is between `lower` and `upper`
+        (no bound if not given), in the order of the values.
+        """
+        lo, hi = 0, len(self.values)
+        if lower is not _UNBOUNDED:
+            bisect = bisect_left if include_lower else bisect_right
+            lo = bisect(self.values, lower)
+        if upper is not _UNBOUNDED:
+            bisect = bisect_right if include_upper else bisect_left
+            hi = bisect(self.values, upper)
+        return self.objects[lo:hi]
+
+
+class Query(object):
+    """
+    Build conditions on the value of an attribute of objects (or on the
+    value returned by a key function), for selecting objects in a
+    collection with :meth:`ObjectCollection.filter`, :meth:`ObjectCollection.get`
+    or :meth:`ObjectCollection.get_object`.
+
+    Parameters
+    ----------
+    key : string or callable
+        Name of the attribute, or a function which accepts any object
+        in the collection as one argument and returns the value to compare
+        (see also :meth:`ObjectCollection.create_index`).
+
+    Notes
+    -----
+    Comparison operators (==, !=, <, <=, >, >=) and the methods
+    :meth:`isin` and :meth:`between` return conditions, i.e., callables that
+    accept an object and return True or False. The conditions use the
+    index created for `key` in the collection, if any (all but !=):
+    ranges and comparisons require a sorted index.
+
+    Examples
+    --------
+    >>> col.create_index('fid', kind='sorted')
+    >>> col.filter(Query('fid').between(1, 50))
+    >>> col.filter(Query('fid') > 10, Query('name').isin(['A', 'B']))
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, value):
+        return QueryCondition(self.key, '==', value)
+
+    def __ne__(self, value):
+        return QueryCondition(self.key, '!=', value)
+
+    def __lt__(self, value):
+        return QueryCondition(self.key, '<', value)
+
+    def __le__(self, value):
+        return QueryCondition(self.key, '<=', value)
+
+    def __gt__(self, value):
+        return QueryCondition(self.key, '>', value)
+
+    def __ge__(self, value):
+        return QueryCondition(self.key, '>=', value)
+
+    def isin(self, values):
+        """Condition: the value is one of `values`."""
+        return QueryCondition(self.key, 'in', list(values))
+
+    def between(self, lower, upper, inclusive=True):
+        """
+        Condition: the value is between `lower` and `upper` (bounds are
+        included if `inclusive` is True).
+        """
+        return QueryCondition(self.key, 'between', (lower, upper, inclusive))
+
+    __hash__ = object.__hash__
+
+
+class QueryCondition(object):
+    """
+    A condition on the value of an attribute of objects, as returned by
+    :class:`Query` operators.
+    """
+
+    _compare = {
+        '==': lambda v, ref: v == ref,
+        '!=': lambda v, ref: v != ref,
+        '<': lambda v, ref: v < ref,
+        '<=': lambda v, ref: v <= ref,
+        '>': lambda v, ref: v > ref,
+        '>=': lambda v, ref: v >= ref,
+        'in': lambda v, ref: v in ref,
+        'between': lambda v, ref: (ref[0] <= v <= ref[1] if ref[2]
+                                   else ref[0] < v < ref[1]),
+    }
+
+    def __init__(self, key, op, value):
+        self.key = key
+        self.op = op
+        self.value = value
+
+    def __call__(self, obj):
+        return self._compare[self.op](_attr_value(obj, self.key), self.value)
+
+    def _lookup(self, collection):
+        """
+        Return the objects of `collection` that may satisfy the condition,
+        using the index of `collection` for the key (in any order), or None
+        if no index can be used.
+        """
+        op, value = self.op, self.value
+        sorted_index = collection._sorted_indexes.get(self.key)
+        if sorted_index is not None:
+            if op == '==':
+                return sorted_index.range(value, value)
+            elif op == 'in':
+                return [obj for v in _unique(value)
+                        for obj in sorted_index.range(v, v)]
+            elif op == 'between':
+                return sorted_index.range(value[0], value[1],
+                                          value[2], value[2])
+            elif op in ('<', '<='):
+                return sorted_index.range(upper=value,
+                                          include_upper=(op == '<='))
+            elif op in ('>', '>='):
+                return sorted_index.range(lower=value,
+                                          include_lower=(op == '>='))
+        hash_index = collection._indexes.get(self.key)
+        if hash_index is not None:
+            try:
+                if op == '==':
+                    return hash_index.get(value, [])
+                elif op == 'in':
+                    return [obj for v in _unique(value)
+                            for obj in hash_index.get(v, [])]
+            except TypeError:
+                # unhashable value
+                pass
+        return None
+
+    def __repr__(self):
+        return "<{0}: {1!r} {2} {3!r}>".format(self.__class__.__name__,
+                                               self.key, self.op, self.value)
+
+
+def _unique(values):
+    """Return the unique items of `values` (keep order)."""
+    unique = []
+    for v in values:
+        if v not in unique:
+            unique.append(v)
+    return unique
+
 
 class ObjectCollection(object):
     """
@@ -38,6 +413,20 @@ class ObjectCollection(object):
         Functions called after an object is (added to, removed from) the
         collection. Each function must accepts one argument that must be any
         instance of class `ref_class`.
+    fpre_many : (callable or None, callable or None)
+        Functions called before a batch of objects is (added to, removed
+        from) the collection (see :meth:`add_many` and :meth:`remove_many`).
+        Each function must accept one argument (a list of objects) and must
+        return the objects to add/remove. If not set, functions in `fpre`
+        are called for each object of the batch.
+    fpost_many : (callable or None, callable or None)
+        Functions called after a batch of objects is (added to, removed
+        from) the collection, with the list of objects as argument. If not
+        set, functions in `fpost` are called for each object of the batch.
+    fcopy : callable or None
+        Function used to copy objects (see :meth:`duplicate`). It must
+        accept one object as argument and return a new object (if None,
+        :func:`copy.copy` is used).
     read_only : bool
         If True, collection is read-only (will raise an exception when calling
         :meth:`add`, :meth:`remove` or :meth:`duplicate` methods).
@@ -45,6 +434,9 @@ class ObjectCollection(object):
         Specify explicitly the class expected for objects added to the
         collection (if None, the class will be determined from the first item
         found in `objects`).
+    concurrent : bool
+        If True, the collection can be shared between threads (see
+        :meth:`set_concurrent`).
     
     Notes
     -----
@@ -53,24 +445,237 @@ class ObjectCollection(object):
     using their index...), but they are not lists.
     
     An object cannot be inserted more than once in a collection.
+
+    Hash or sorted indexes can be created on attributes that are often used
+    for selection (see :meth:`create_index` and :class:`Query`).
+
+    Objects are stored in a list together with a map of their positions, so
+    that membership tests, removal and index lookups don't require to scan
+    the collection. Removed objects leave a placeholder in the list, which
+    is compacted when needed. Collections have no instance dictionary, as
+    many (small) collections may be created (e.g., the scale factors of
+    each base emission field).
+
+    Selections (:meth:`filter`, :meth:`get`, :meth:`get_all` and
+    :meth:`sorted`) return lazy views of the collection (see
+    :class:`CollectionView`).
     """
 
+    __slots__ = ('_ref_class', '_items', '_pos', '_n_removed', '_version',
+                 '_fpre_add', '_fpre_remove', '_fpost_add', '_fpost_remove',
+                 '_fpre_add_many', '_fpre_remove_many',
+                 '_fpost_add_many', '_fpost_remove_many',
+                 '_fcopy', '_ref_collection', '_read_only',
+                 '_indexes', '_sorted_indexes', '_lock', '_subscribers')
+
     def __init__(self, objects,
                  fpre=(None, None), fpost=(None, None),
-                 read_only=False, ref_class=None):
+                 read_only=False, ref_class=None,
+                 fpre_many=(None, None), fpost_many=(None, None),
+                 fcopy=None, concurrent=False):
 
         self._ref_class = ref_class
-        self._list = []
+        self._items = []
+        self._pos = {}
+        self._n_removed = 0
+        self._version = 0
         self._fpre_add, self._fpre_remove = fpre
         self._fpost_add, self._fpost_remove = fpost
+        self._fpre_add_many, self._fpre_remove_many = fpre_many
+        self._fpost_add_many, self._fpost_remove_many = fpost_many
+        self._fcopy = fcopy
         self._ref_collection = None
         self._read_only = False
+        self._indexes = _NO_INDEX
+        self._sorted_indexes = _NO_INDEX
+        self._lock = _RWLock() if concurrent else None
+        self._subscribers = ()
 
-        for obj in objects:
-            self.add(obj)
+        self.add_many(objects)
 
         self._read_only = read_only
 
+    @property
+    def _list(self):
+        """The (ordered) list of objects in the collection."""
+        if self._n_removed:
+            self._compact()
+        return self._items
+
+    def _writable_items(self):
+        """
+        Return the list of objects, to be modified in place. In concurrent
+        mode, the list is first copied (other threads may iterate over the
+        current list).
+        """
+        if self._lock is not None:
+            self._items = list(self._list)
+        return self._list
+
+    def _compact(self):
+        """Remove placeholders from the storage and update positions."""
+        self._items = [obj for obj in self._items if obj is not _REMOVED]
+        self._pos = dict((_key(obj), i) for i, obj in enumerate(self._items))
+        self._n_removed = 0
+
+    def _contains(self, obj):
+        key = _key(obj)
+        if key is not obj:
+            # not hashable: compare with all objects
+            return obj in self._list
+        return key in self._pos
+
+    def _position(self, obj):
+        """Return the index of `obj` (must be in the collection)."""
+        if self._n_removed:
+            self._compact()
+        key = _key(obj)
+        if key is not obj:
+            return self._items.index(obj)
+        return self._pos[key]
+
+    def _insert(self, obj, index=-1):
+        """Insert `obj` in the storage (no check, no callback)."""
+        self._version += 1
+        if index < -1:
+            index = max(0, len(self) + index)
+        items = self._writable_items()
+        if index == -1 or index >= len(self):
+            self._pos[_key(obj)] = len(items)
+            items.append(obj)
+        else:
+            items.insert(index, obj)
+            for i in range(index, len(items)):
+                self._pos[_key(items[i])] = i
+
+    def _discard(self, obj):
+        """Remove `obj` from the storage (no check, no callback)."""
+        key = _key(obj)
+        if key is not obj:
+            # not hashable: find the (equal) object in the collection
+            items = self._list
+            key = _key(items[items.index(obj)])
+        items = self._writable_items()
+        i = self._pos.pop(key)
+        self._version += 1
+        items[i] = _REMOVED
+        self._n_removed += 1
+        if self._lock is not None or self._n_removed > len(items) // 2:
+            self._compact()
+
+    @_reading
+    def __getstate__(self):
+        state = dict((attr, getattr(self, attr))
+                     for attr in ObjectCollection.__slots__
+                     if attr != '_pos')
+        state['_items'] = list(self._list)
+        state['_n_removed'] = 0
+        # locks can't be pickled: only keep the concurrent mode
+        state['_lock'] = self._lock is not None
+        # subscriptions are bound to the current objects (not pickled)
+        state['_subscribers'] = ()
+        return state
+
+    def __setstate__(self, state):
+        for attr, value in state.items():
+            setattr(self, attr, value)
+        self._pos = dict((_key(obj), i) for i, obj in enumerate(self._items))
+        self._lock = _RWLock() if state['_lock'] else None
+        self._subscribers = state.get('_subscribers', ())
+
+    def set_concurrent(self, concurrent=True):
+        """
+        Enable (or disable) the concurrent mode of the collection.
+
+        In concurrent mode, the collection can be shared between threads:
+        several threads can read the collection (iterate, select objects...)
+        at the same time, while modifications (:meth:`add`, :meth:`remove`,
+        ...) are done by one thread at a time, without reader. Iterators
+        over the collection are not affected by modifications done during
+        the iteration (but objects themselves are not protected).
+
+        Use :meth:`reading` or :meth:`writing` to run several operations
+        at once.
+
+        Notes
+        -----
+        The mode must be set before the collection is shared between
+        threads. Selections (views) use the lock of their reference
+        collection.
+        """
+        if concurrent and self._lock is None:
+            self._lock = _RWLock()
+        elif not concurrent:
+            self._lock = None
+
+    def reading(self):
+        """
+        Return a context manager which holds the lock of the collection for
+        reading (in concurrent mode, see :meth:`set_concurrent`).
+        """
+        return _Locked(self._lock, False)
+
+    def writing(self):
+        """
+        Return a context manager which holds the lock of the collection for
+        writing (in concurrent mode, see :meth:`set_concurrent`).
+        """
+        return _Locked(self._lock, True)
+
+    @property
+    def version(self):
+        """
+        Version of the collection, i.e., a counter which is incremented
+        each time objects are added to (removed from) the collection.
+
+        Compare it with a previously stored value to know whether the
+        collection has changed since (e.g., to invalidate a cache).
+        """
+        return self._version
+
+    def subscribe(self, callback):
+        """
+        Register `callback` to be called after objects are added to (removed
+        from) the collection.
+
+        Parameters
+        ----------
+        callback : callable
+            Called as ``callback(collection, event, objs)``, where `event` is
+            'add' or 'remove' and `objs` is the list of the objects that have
+            been added (removed).
+
+        Notes
+        -----
+        Callbacks are called in the order of subscription, once per
+        :meth:`add_many` (:meth:`remove_many`) call, while the collection is
+        locked for writing (in concurrent mode). Subscriptions are not kept
+        when the collection is pickled or copied.
+
+        See Also
+        --------
+        :meth:`unsubscribe`
+        """
+        self._subscribers = self._subscribers + (callback,)
+
+    def unsubscribe(self, callback):
+        """
+        Unregister `callback` (see :meth:`subscribe`).
+
+        Raises
+        ------
+        ValueError
+            If `callback` is not registered.
+        """
+        subscribers = list(self._subscribers)
+        subscribers.remove(callback)
+        self._subscribers = tuple(subscribers)
+
+    def _notify(self, event, objs):
+        """Call the subscribed callbacks (see :meth:`subscribe`)."""
+        for callback in self._subscribers:
+            callback(self, event, objs)
+
     @property
     def ref_collection(self):
         """
@@ -84,18 +689,12 @@ class ObjectCollection(object):
         """
         return self._ref_collection
 
-    def _create_subcollection(self, sel_objects):
+    def _create_view(self, *steps):
         """
-        Create a new collection of (selected) objects from this collection
-        and set the correct reference collection.
+        Create a view of (selected) objects from this collection, with the
+        selection steps `steps`, and set the correct reference collection.
         """
-        cls = self.__class__
-        selection = cls(objects=sel_objects)
-        if self._ref_collection is None:
-            selection._ref_collection = self
-        else:
-            selection._ref_collection = self._ref_collection
-        return selection
+        return CollectionView(self, steps)
 
     def _get_ref_collection_or_error(self, get=False):
         if self._ref_collection is None:
@@ -112,6 +711,7 @@ class ObjectCollection(object):
             raise ValueError("Operation not permitted on "
                              "read-only collections")
 
+    @_writing
     def add(self, obj, index=-1):
         """
         Add a new object to the collection.
@@ -145,24 +745,117 @@ class ObjectCollection(object):
                             "collection of only '{1}' objects"
                             .format(type(obj).__name__,
                                     self._ref_class.__name__))
-        if obj in self._list:
+        if self._contains(obj):
             raise ValueError("Not allowed to add an object which is already "
                              "in the collection")
-        if index == -1:
-            self._list.append(obj)
-        else:
-            self._list.insert(index, obj)
+        self._insert(obj, index)
+        self._index_add(obj, index)
 
         if self._fpost_add is not None:
             self._fpost_add(obj)
+        if self._subscribers:
+            self._notify('add', [obj])
 
-    def extend(self, objs):
+    @_writing
+    def add_many(self, objs, index=-1):
         """
-        add to the collection objects from iterable `objs`.
+        Add new objects to the collection.
+
+        Similar to :meth:`add` but the whole batch of objects is checked
+        before any object is added, and the storage and indexes of the
+        collection are updated only once.
+
+        Parameters
+        ----------
+        objs : iterable
+            the objects to add.
+        index : int
+            insert the objects at this index (if index = -1, objects will be
+            appended to the end of the collection).
+
+        Raises
+        ------
+        TypeError
+            If an object is not of the same class than all other objects
+            of the collection.
+        ValueError
+            If an object is already in the collection or is given more than
+            once (no object is added).
         """
+        objs = list(objs)
+        if self._fpre_add_many is not None:
+            objs = list(self._fpre_add_many(objs))
+        elif self._fpre_add is not None:
+            objs = [obj for obj in objs if self._fpre_add(obj)]
+        if not objs:
+            return
+
+        if self._ref_class is None:
+            self._ref_class = objs[0].__class__
+        self._check_read_only()
+        keys = set()
+        unhashable = []
         for obj in objs:
-            self.add(obj)
+            if not isinstance(obj, self._ref_class):
+                raise TypeError("Cannot add object of class '{0}' in a "
+                                "collection of only '{1}' objects"
+                                .format(type(obj).__name__,
+                                        self._ref_class.__name__))
+            key = _key(obj)
+            if key is obj:
+                duplicate = key in keys
+                keys.add(key)
+            else:
+                duplicate = obj in unhashable
+                unhashable.append(obj)
+            if duplicate or self._contains(obj):
+                raise ValueError("Not allowed to add an object which is "
+                                 "already in the collection")
+
+        self._version += 1
+        if index < -1:
+            index = max(0, len(self) + index)
+        append = index == -1 or index >= len(self)
+        items = self._writable_items()
+        if append:
+            start = len(items)
+            items.extend(objs)
+        else:
+            start = index
+            items[index:index] = objs
+        for i in range(start, len(items)):
+            if items[i] is not _REMOVED:
+                self._pos[_key(items[i])] = i
+
+        for attr_name, attr_index in self._indexes.items():
+            buckets = {}
+            for obj in objs:
+                bucket = attr_index.setdefault(_attr_value(obj, attr_name), [])
+                bucket.append(obj)
+                buckets[id(bucket)] = bucket
+            if not append:
+                # keep objects in the order of the collection
+                for bucket in buckets.values():
+                    bucket.sort(key=self._position)
+        for sorted_index in self._sorted_indexes.values():
+            sorted_index.add_many(objs)
+
+        if self._fpost_add_many is not None:
+            self._fpost_add_many(objs)
+        elif self._fpost_add is not None:
+            for obj in objs:
+                self._fpost_add(obj)
+        if self._subscribers:
+            self._notify('add', objs)
+
+    def extend(self, objs):
+        """
+        add to the collection objects from iterable `objs`
+        (see :meth:`add_many`).
+        """
+        self.add_many(objs)
 
+    @_writing
     def replace(self, new_obj):
         """
         Replace a given, selected object with
@@ -176,36 +869,288 @@ class ObjectCollection(object):
         self.remove()
         ref.add(new_obj, index=obj_index)
 
+    @_writing
     def duplicate(self, **kwargs):
         """
         Duplicate a given, selected object with changed attribute values
         in the reference collection.
+
+        Parameters
+        ----------
+        **kwargs : attr_name=value
+            Attributes to change in the copy of the object.
+
+        Returns
+        -------
+        The new object, inserted right after the selected object.
+
+        Notes
+        -----
+        The object is copied using the copy function of the reference
+        collection (see `fcopy` in :class:`ObjectCollection`). Attributes of
+        immutable objects like named tuples are changed with their
+        `_replace` method.
         """
         self._check_read_only()
         ref = self._get_ref_collection_or_error(get=True)
-        # TODO: object copy + change attributes with kwargs + call 'add' method
+        obj = self._list[0]
+        if hasattr(obj, '_replace'):
+            new_obj = obj._replace(**kwargs)
+        else:
+            new_obj = (ref._fcopy or copy.copy)(obj)
+            for attr_name, attr_val in kwargs.items():
+                setattr(new_obj, attr_name, attr_val)
+        ref.add(new_obj, index=self.index()[0] + 1)
+        return new_obj
 
+    @_writing
     def remove(self):
         """
         Remove selected objects in the reference collection.
         """
         self._check_read_only()
         ref = self._get_ref_collection_or_error()
-        for obj in self._list:
-            if ref._fpre_remove is not None:
-                proceed = ref._fpre_remove(obj)
-                if not proceed:
-                    continue
-            ref._list.remove(obj)
-            if ref._fpost_remove is not None:
-                ref._fpost_remove(obj)
+        ref.remove_many(self._list)
+
+    @_writing
+    def remove_many(self, objs):
+        """
+        Remove objects from the collection.
+
+        The whole batch of objects is checked before any object is removed,
+        and the storage and indexes of the collection are updated only once.
+
+        Parameters
+        ----------
+        objs : iterable
+            the objects to remove.
+
+        Raises
+        ------
+        ValueError
+            If an object is not in the collection (no object is removed).
+        """
+        self._check_read_only()
+        objs = list(objs)
+        if self._fpre_remove_many is not None:
+            objs = list(self._fpre_remove_many(objs))
+        elif self._fpre_remove is not None:
+            objs = [obj for obj in objs if self._fpre_remove(obj)]
+        if not objs:
+            return
+        positions = set()
+        for obj in objs:
+            if not self._contains(obj):
+                raise ValueError("Not allowed to remove an object which is "
+                                 "not in the collection")
+            positions.add(self._position(obj))
+
+        if len(positions) == 1:
+            self._discard(objs[0])
+            self._index_remove(objs[0])
+        else:
+            items = self._writable_items()
+            removed = set()
+            for i in positions:
+                removed.add(id(items[i]))
+                del self._pos[_key(items[i])]
+                items[i] = _REMOVED
+            self._version += 1
+            self._n_removed = len(positions)
+            self._compact()
+
+            for attr_index in self._indexes.values():
+                for value, bucket in attr_index.items():
+                    bucket[:] = [o for o in bucket if id(o) not in removed]
+                    if not bucket:
+                        del attr_index[value]
+            for sorted_index in self._sorted_indexes.values():
+                sorted_index.remove_many(removed)
+
+        if self._fpost_remove_many is not None:
+            self._fpost_remove_many(objs)
+        elif self._fpost_remove is not None:
+            for obj in objs:
+                self._fpost_remove(obj)
+        if self._subscribers:
+            self._notify('remove', objs)
+
+    @_writing
+    def create_index(self, attr_name, kind='hash'):
+        """
+        Create an index on the attribute `attr_name` of the objects in
+        the collection.
+
+        Parameters
+        ----------
+        attr_name : string or callable
+            Name of the attribute, or a key function which accepts any
+            object in the collection as one argument (the same key must
+            be given to :class:`Query`).
+        kind : {'hash', 'sorted'}
+            A hash index is used for equality and membership conditions
+            (values must be hashable). A sorted index is also used for
+            comparison and range conditions (see :class:`Query`), with
+            bisection (values must be comparable).
+
+        Notes
+        -----
+        The index is updated when objects are added to (removed from) the
+        collection, and it is used by :meth:`filter`, :meth:`get` and
+        :meth:`get_object` for the conditions given as `attr_name=value`
+        and for the :class:`Query` conditions on `attr_name`.
+
+        The index is not updated when the attribute of an object in the
+        collection is changed: call :meth:`reindex` after such changes.
+
+        See Also
+        --------
+        :meth:`drop_index`
+        :meth:`reindex`
+        """
+        if kind == 'hash':
+            index = {}
+            for obj in self._list:
+                index.setdefault(_attr_value(obj, attr_name), []).append(obj)
+            self._indexes = dict(self._indexes)
+            self._indexes[attr_name] = index
+        elif kind == 'sorted':
+            self._sorted_indexes = dict(self._sorted_indexes)
+            self._sorted_indexes[attr_name] = _SortedIndex(attr_name,
+                                                           self._list)
+        else:
+            raise ValueError("Invalid index kind '{}'".format(kind))
+
+    @_writing
+    def drop_index(self, attr_name):
+        """
+        Remove the index(es) on the attribute `attr_name`.
+        """
+        if (attr_name not in self._indexes and
+                attr_name not in self._sorted_indexes):
+            raise KeyError(attr_name)
+        self._indexes = dict(self._indexes)
+        self._indexes.pop(attr_name, None)
+        self._sorted_indexes = dict(self._sorted_indexes)
+        self._sorted_indexes.pop(attr_name, None)
 
+    @_writing
+    def reindex(self):
+        """
+        Rebuild all indexes of the collection (e.g., after an indexed
+        attribute of objects in the collection has been changed).
+        """
+        for attr_name in list(self._indexes):
+            self.create_index(attr_name)
+        for attr_name in list(self._sorted_indexes):
+            self.create_index(attr_name, kind='sorted')
+
+    def _index_add(self, obj, index=-1):
+        """Add `obj` (inserted at `index`) to the indexes."""
+        for attr_name, attr_index in self._indexes.items():
+            value = _attr_value(obj, attr_name)
+            bucket = attr_index.setdefault(value, [])
+            if index == -1 or index >= len(self) - 1:
+                bucket.append(obj)
+            else:
+                # keep objects in the order of the collection
+                bucket.append(obj)
+                bucket.sort(key=self._position)
+        for sorted_index in self._sorted_indexes.values():
+            sorted_index.add(obj)
+
+    def _index_remove(self, obj):
+        """Remove `obj` from the indexes."""
+        for attr_name, attr_index in self._indexes.items():
+            buckets = [attr_index.get(_attr_value(obj, attr_name), [])]
+            if not any(o is obj for o in buckets[0]):
+                # attribute has been changed: search all values
+                buckets = attr_index.values()
+            for bucket in buckets:
+                for i, o in enumerate(bucket):
+                    if o is obj:
+                        del bucket[i]
+                        break
+            for value in [v for v, b in attr_index.items() if not b]:
+                del attr_index[value]
+        for sorted_index in self._sorted_indexes.values():
+            sorted_index.remove(obj)
+
+    def _index_lookup(self, kwargs, conditions=()):
+        """
+        Return the objects found in the indexes for the smallest
+        selection among the conditions `kwargs` (attr_name=value) and the
+        :class:`Query` conditions in `conditions`, or None if no condition
+        can be looked up. Objects are returned in the order of the
+        collection.
+        """
+        selection = None
+        for attr_name, attr_val in kwargs.items():
+            attr_index = self._indexes.get(attr_name)
+            if attr_index is None:
+                continue
+            try:
+                bucket = attr_index.get(attr_val, [])
+            except TypeError:
+                # unhashable value
+                continue
+            if selection is None or len(bucket) < len(selection):
+                selection = bucket
+        ordered = True
+        for cond in conditions:
+            if not isinstance(cond, QueryCondition):
+                continue
+            found = cond._lookup(self)
+            if found is None:
+                continue
+            if selection is None or len(found) < len(selection):
+                selection = found
+                ordered = False
+        if not ordered and len(selection) > 1:
+            selection = sorted(selection, key=self._position)
+        return selection
+
+    @_reading
+    def to_columns(self, columns):
+        """
+        Export the attributes of the objects in the collection as columns
+        (NumPy arrays).
+
+        Parameters
+        ----------
+        columns : sequence
+            Each item is either an attribute name, a (column name, key) tuple
+            or a (column name, key, dtype) tuple, where key is an attribute
+            name or a function which accepts any object in the collection as
+            one argument (see :meth:`create_index`). If no dtype is given,
+            it is determined by NumPy from the values.
+
+        Returns
+        -------
+        An ordered dictionary of NumPy arrays, one for each column. The
+        i-th item of each array is the value for the i-th object of the
+        collection, so that a boolean mask or indexes computed on the
+        columns can be used to select the objects (e.g., with
+        ``[col[i] for i in np.flatnonzero(mask)]``).
+        """
+        objs = self._list
+        arrays = OrderedDict()
+        for column in columns:
+            if isinstance(column, basestring):
+                column = (column, column)
+            name, key = column[:2]
+            dtype = column[2] if len(column) > 2 else None
+            arrays[name] = np.array([_attr_value(obj, key) for obj in objs],
+                                    dtype=dtype)
+        return arrays
+
+    @_reading
     def index(self):
         """
         Get the indexes of selected objects in the reference collection.
         """
         ref = self._get_ref_collection_or_error()
-        return [ref._list.index(obj) for obj in self._list]
+        return [ref._position(obj) for obj in self._list]
 
     def sorted(self, key):
         """
@@ -221,7 +1166,7 @@ class ObjectCollection(object):
         
         Returns
         -------
-        A new :class:`ObjectCollection` instance.
+        A new collection (:class:`CollectionView` instance).
         
         Raises
         ------
@@ -232,12 +1177,9 @@ class ObjectCollection(object):
         :prop:`ref_collection`
         :func:`sorted`
         """
-        try:
-            sorted_objects = sorted(self._list, key=key)
-        except TypeError:
-            sorted_objects = sorted(self._list,
-                                    key=lambda obj: getattr(obj, key))
-        return self._create_subcollection(sorted_objects)
+        if not callable(key):
+            key = attrgetter(key)
+        return self._create_view(('sort', key))
 
     def filter(self, *args, **kwargs):
         """
@@ -248,20 +1190,31 @@ class ObjectCollection(object):
         *args : callable(s)
             Any callable(s) that accepts any object of `_ref_class` as
             argument and that returns True or False. Used to define custom
-            conditions (useful for advanced filtering). 
+            conditions (useful for advanced filtering), or conditions
+            built with :class:`Query` (e.g., ``Query('x') > 1``).
         **kwargs : attr_name=value
             Used to define simple conditions, i.e., if the value of the
             attribute specified by 'attr_name' equals 'value'.
             
         Returns
         -------
-        A new collection (:class:`ObjectCollection` instance) containing the
+        A new collection (:class:`CollectionView` instance) containing the
         selected objects.
         
         Notes
         -----
         If several args or kwargs are given, the returned selection satisfies
         all conditions (similar to the 'AND' operator).
+
+        Indexes (see :meth:`create_index`) are used for kwargs
+        conditions and :class:`Query` conditions on indexed attributes.
+
+        The selection is lazy: the conditions are evaluated only when the
+        returned collection is iterated, indexed or measured. The selection
+        follows the changes of the collection (it is evaluated again after
+        objects are added or removed). Use :meth:`CollectionView.copy` to
+        get a snapshot of the selected objects (what this method returned
+        before selections were lazy).
         
         See Also
         --------
@@ -269,13 +1222,7 @@ class ObjectCollection(object):
         :meth:`get_object`
         :prop:`ref_collection`
         """
-        selection = self._list
-        for func in args:
-            selection = filter(func, selection)
-        for attr_name, attr_val in kwargs.items():
-            selection = filter(lambda obj: getattr(obj, attr_name) == attr_val,
-                               selection)
-        return self._create_subcollection(selection)
+        return self._create_view(('filter', args, kwargs))
 
     def get_all(self):
         """
@@ -283,11 +1230,12 @@ class ObjectCollection(object):
 
         Returns
         -------
-        A new collection (:class:`ObjectCollection` instance) containing the
+        A new collection (:class:`CollectionView` instance) containing the
         selected objects.
         """
-        return self._create_subcollection(self._list)
+        return self._create_view()
 
+    @_reading
     def get(self, *args, **kwargs):
         """
         Select one object based on its attributes.
@@ -297,7 +1245,7 @@ class ObjectCollection(object):
         
         Returns
         -------
-        A new collection (:class:`ObjectCollection` instance) containing
+        A new collection (:class:`CollectionView` instance) containing
         the selected object.
         
         Raises
@@ -315,12 +1263,15 @@ class ObjectCollection(object):
         """
         # TODO: create specific exceptions.
         selection = self.filter(*args, **kwargs)
-        if len(selection._list) > 1:
+        # stop evaluating the selection after the 2nd object found
+        found = list(itertools.islice(selection._evaluate(), 2))
+        if len(found) > 1:
             raise ValueError("More than one object match the "
                              "selection criteria")
-        elif not selection._list:
+        elif not found:
             raise ValueError("No object match the selection criteria")
         else:
+            selection._set_cache(found)
             return selection
 
     def get_object(self, *args, **kwargs):
@@ -339,35 +1290,233 @@ class ObjectCollection(object):
         obj = selection._list[0]
         return obj
 
+    @_writing
     def __setitem__(self, index, new_obj):
         # not the most efficient, but also not the preferred way to
         # replace an object in the collection.
         del_obj = self._list[index]
         self.get(lambda obj: obj == del_obj).replace(new_obj)
 
+    @_reading
     def __getitem__(self, index):
         return self._list[index]
 
+    @_writing
     def __delitem__(self, index):
         # not the most efficient, but also not the preferred way to
         # remove an object from the collection.
         del_obj = self._list[index]
         self.get(lambda obj: obj == del_obj).remove()
 
+    @_reading
     def __len__(self):
-        return len(self._list)
+        return len(self._items) - self._n_removed
 
+    @_reading
     def __iter__(self):
         return iter(self._list)
 
+    @_reading
+    def __contains__(self, obj):
+        return self._contains(obj)
+
+    @_reading
     def __str__(self):
         return "Collection of {0} objects{1}: {2}" \
             .format(self._ref_class.__name__,
                     ' (selection)' if self._ref_collection is not None else '',
                     '\n'.join(str(obj) for obj in self._list))
 
+    @_reading
     def __repr__(self):
         return "<{0}{1}: {2}>"\
             .format(self.__class__.__name__,
                     ' (selection)' if self._ref_collection is not None else '',
                     list.__repr__(self._list))
+
+
+class CollectionView(ObjectCollection):
+    """
+    A lazy selection of objects in a collection, as returned by
+    :meth:`ObjectCollection.filter`, :meth:`ObjectCollection.get`,
+    :meth:`ObjectCollection.get_all` or :meth:`ObjectCollection.sorted`.
+
+    A view holds only its reference collection and a chain of selection
+    steps (filter conditions and sorting keys). The steps are evaluated
+    when the view is iterated, indexed or measured, and the result is kept
+    until the reference collection is changed. Selecting objects in a view
+    returns a new view with the extended chain of steps.
+
+    Parameters
+    ----------
+    ref_collection : :class:`ObjectCollection` object
+        The collection from which the view is derived (if it is a view, the
+        new view is derived from its reference collection).
+    steps : sequence of tuples
+        The selection steps, i.e., ('filter', args, kwargs) or
+        ('sort', key) (see :meth:`ObjectCollection.filter` and
+        :meth:`ObjectCollection.sorted`).
+
+    Notes
+    -----
+    Objects cannot be added to a view. A view is read-only if its reference
+    collection is read-only.
+
+    A view is not a snapshot: it reflects the current content of its
+    reference collection. Use :meth:`copy` to get a collection of the
+    objects selected at a given time.
+    """
+
+    __slots__ = ('_steps', '_cache', '_cache_version')
+
+    def __init__(self, ref_collection, steps=()):
+        if ref_collection._ref_collection is not None:
+            steps = tuple(ref_collection._steps) + tuple(steps)
+            ref_collection = ref_collection._ref_collection
+        self._ref_collection = ref_collection
+        self._steps = tuple(steps)
+        self._cache = None
+        self._cache_version = None
+
+    @property
+    def _ref_class(self):
+        return self._ref_collection._ref_class
+
+    @property
+    def _read_only(self):
+        return self._ref_collection._read_only
+
+    @property
+    def _indexes(self):
+        return {}
+
+    @property
+    def _sorted_indexes(self):
+        return {}
+
+    @property
+    def _lock(self):
+        return self._ref_collection._lock
+
+    @property
+    def _version(self):
+        return self._ref_collection._version
+
+    @property
+    def _subscribers(self):
+        return self._ref_collection._subscribers
+
+    def _evaluate(self):
+        """Return an iterator over the selected objects."""
+        if self._cache is not None:
+            if self._cache_version == self._ref_collection._version:
+                return iter(self._cache)
+        ref = self._ref_collection
+        objs = None
+        for step in self._steps:
+            if step[0] == 'filter':
+                args, kwargs = step[1:]
+                if objs is None:
+                    objs = ref._index_lookup(kwargs, args)
+                if objs is None:
+                    objs = ref._list
+                for func in args:
+                    objs = itertools.ifilter(func, objs)
+                for attr_name, attr_val in kwargs.items():
+                    objs = itertools.ifilter(_attr_equals(attr_name, attr_val),
+                                             objs)
+            elif step[0] == 'sort':
+                objs = sorted(ref._list if objs is None else objs,
+                              key=step[1])
+        if objs is None:
+            objs = ref._list
+        return iter(objs)
+
+    def _set_cache(self, objs):
+        self._cache = objs
+        self._cache_version = self._ref_collection._version
+
+    @property
+    @_reading
+    def _list(self):
+        """The (ordered) list of selected objects."""
+        if (self._cache is None or
+                self._cache_version != self._ref_collection._version):
+            self._set_cache(list(self._evaluate()))
+        return self._cache
+
+    def _contains(self, obj):
+        return obj in self._list
+
+    def _position(self, obj):
+        return self._list.index(obj)
+
+    def add(self, obj, index=-1):
+        # TODO: raise a custom Exception
+        raise ValueError("Cannot add an object to a selection of a "
+                         "collection")
+
+    def add_many(self, objs, index=-1):
+        # TODO: raise a custom Exception
+        raise ValueError("Cannot add objects to a selection of a "
+                         "collection")
+
+    def extend(self, objs):
+        self.add_many(objs)
+
+    @_writing
+    def remove_many(self, objs):
+        """
+        Remove objects of the selection from the reference collection
+        (see :meth:`ObjectCollection.remove_many`).
+        """
+        self._check_read_only()
+        objs = list(objs)
+        for obj in objs:
+            if not self._contains(obj):
+                raise ValueError("Not allowed to remove an object which is "
+                                 "not in the selection")
+        self._ref_collection.remove_many(objs)
+
+    def create_index(self, attr_name, kind='hash'):
+        # TODO: raise a custom Exception
+        raise ValueError("Cannot create an index on a selection of a "
+                         "collection")
+
+    def subscribe(self, callback):
+        # changes are made (and notified) by the reference collection
+        self._ref_collection.subscribe(callback)
+
+    def unsubscribe(self, callback):
+        self._ref_collection.unsubscribe(callback)
+
+    @_reading
+    def __len__(self):
+        return len(self._list)
+
+    def __getstate__(self):
+        raise TypeError("Cannot pickle a selection of a collection")
+
+    def _materialize(self, objs):
+        return ObjectCollection(objs, ref_class=self._ref_class,
+                                read_only=self._read_only)
+
+    def copy(self):
+        """
+        Return a snapshot of the selection, i.e., a new collection
+        (:class:`ObjectCollection` instance) of the selected objects that
+        is not updated when the reference collection is changed.
+        """
+        return self._materialize(self._list)
+
+    def __copy__(self):
+        # a plain collection of the selected objects
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self._materialize(copy.deepcopy(self._list, memo))
+
+    def set_concurrent(self, concurrent=True):
+        # TODO: raise a custom Exception
+        raise ValueError("Cannot set the concurrent mode of a selection of a "
+                         "collection (use the reference collection)")
@@ -17,11 +17,16 @@ Not yet operational.
 import os
 import sys
 from copy import copy, deepcopy
+from collections import OrderedDict
+from operator import attrgetter
 import numpy as np
 
+from pyhemco import cache
+from pyhemco.compute import EmissionEngine
 from pyhemco.timetools import strp_datetimeslicer
-from pyhemco.datatypes import ObjectCollection
-from pyhemco.io import read_config_file, write_config_file
+from pyhemco.datatypes import ObjectCollection, Query
+from pyhemco.io import (read_config_file, reload_config_file,
+                        write_config_file, update_config_file, RowFilter)
 
 BUILTIN_SETTINGS_PATH = 'path/to/default/settings/files'
 BEF_ATTR_NAME = 'emission_base'
@@ -34,6 +39,27 @@ SF_ATTR_NAME = 'emission_scale_factor'
 #-----------------------------------------------------------------------------
 
 
+def _intern(value):
+    """Intern `value` if it is a (byte) string."""
+    if type(value) is str:
+        return intern(value)
+    return value
+
+
+def _is_shared_view(data):
+    """
+    True if `data` is a read-only view of a whole array (see
+    :meth:`GCField.copy`).
+    """
+    if not isinstance(data, np.ndarray) or data.flags.writeable:
+        return False
+    base = data.base
+    return (isinstance(base, np.ndarray) and base.shape == data.shape and
+            base.strides == data.strides and base.dtype == data.dtype and
+            base.__array_interface__['data'][0] ==
+            data.__array_interface__['data'][0])
+
+
 class GCField(object):
     """
     A GEOS-Chem data field.
@@ -53,11 +79,28 @@ class GCField(object):
     data : array-like
         Field data.
     
+    Notes
+    -----
+    Fields are stored compactly (no instance dictionary, interned strings)
+    as settings may include a large number of fields. The absolute path
+    `filepath` is resolved (from the current working directory) when
+    `filename` is set.
+
+    Data may be shared between copies of a field (see :meth:`copy`): copies
+    get a read-only view of the data, while the data of the original field
+    stays writable. Use :meth:`writable_data` to modify data in place
+    without affecting the other fields.
+
     """
 
+    __slots__ = ('name', 'var_name', 'ndim', 'unit', '_filename', '_filepath',
+                 '_data', '_data_shared',
+                 'attributes', 'emission_scale_factors')
+
     def __init__(self, name, var_name='', ndim=0, unit='',
                  filename='', data=None, **kwargs):
-        data = data or []
+        if data is None:
+            data = []
         if isinstance(ndim,str):
             if ndim=='xy':
                 ndim=2
@@ -66,20 +109,106 @@ class GCField(object):
             else:
                 raise ValueError("unsupported ndim character:",ndim)
 
-        self.name = str(name)
-        self.var_name = str(var_name)
+        self.name = intern(str(name))
+        self.var_name = intern(str(var_name))
         self.ndim = int(ndim)
-        self.unit = str(unit)
+        self.unit = intern(str(unit))
         self.filename = filename
-        self.filepath = os.path.abspath(self.filename)
         self.data = np.array(data)
         self.attributes = dict()
         self.attributes.update(kwargs)
 
+    @property
+    def filename(self):
+        """Filename or path to the file where data is stored."""
+        return self._filename
+
+    @filename.setter
+    def filename(self, value):
+        self._filename = _intern(value)
+        self._filepath = _intern(os.path.abspath(value))
+
+    @property
+    def filepath(self):
+        """
+        Absolute path to the file where data is stored (resolved when
+        `filename` is set).
+        """
+        return self._filepath
+
+    @property
+    def data(self):
+        """
+        Field data (read-only if shared with copies of the field, see
+        :meth:`writable_data`).
+        """
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._data_shared = False
+
+    def writable_data(self):
+        """
+        Return the data of the field, ready to be modified in place.
+
+        If the data is shared with copies of the field, it is copied
+        first (copy-on-write), so that the other fields are not affected.
+        """
+        read_only = (isinstance(self._data, np.ndarray) and
+                     not self._data.flags.writeable)
+        if self._data_shared or read_only:
+            self._data = np.array(self._data)
+            self._data_shared = False
+        return self._data
+
+    def _shared_data(self):
+        """
+        Return the data to be shared with a copy of the field (a read-only
+        view of the data array). The data of this field is not modified but
+        will be copied by :meth:`writable_data`.
+        """
+        self._data_shared = True
+        if isinstance(self._data, np.ndarray):
+            view = self._data.view()
+            view.flags.writeable = False
+            return view
+        return self._data
+
     def copy(self, copy_data=False):
-        """Return a new copy of the Field."""
-        if copy_data:
-            return deepcopy(self)
+        """
+        Return a new copy of the Field.
+
+        Parameters
+        ----------
+        copy_data : bool or 'on_write'
+            If False, return a shallow copy (attributes and data are shared
+            with this field). If True, return a deep copy. If 'on_write',
+            field attributes and emission metadata are copied (except scale
+            factors, which are shared) and data is shared read-only between
+            the fields until one of them writes it (see
+            :meth:`writable_data`). The data of the copy is a read-only
+            view; the data of this field stays writable, but writing it
+            directly (rather than via :meth:`writable_data`) also changes
+            the data of the copy.
+        """
+        if copy_data == 'on_write':
+            new_field = copy(self)
+            new_field._data = self._shared_data()
+            new_field._data_shared = True
+            new_field.attributes = _copy_attributes(self.attributes)
+            e_attr = new_field.attributes.get(BEF_ATTR_NAME)
+            if e_attr is not None:
+                new_field.emission_scale_factors = e_attr['scale_factors']
+            return new_field
+        elif copy_data:
+            new_field = deepcopy(self)
+            data = new_field._data
+            if isinstance(data, np.ndarray) and not data.flags.writeable:
+                new_field._data = np.array(data)
+            new_field._data_shared = False
+            return new_field
         else:
             return copy(self)
 
@@ -105,6 +234,25 @@ class GCField(object):
             ismask = 'mask_window' in self.attributes[SF_ATTR_NAME].keys()
         return ismask
         
+    def __getstate__(self):
+        state = dict((attr, getattr(self, attr)) for attr in self.__slots__
+                     if hasattr(self, attr))
+        data = state.get('_data')
+        if _is_shared_view(data):
+            # pickle the shared array once (views are not memoized)
+            state['_data'] = data.base
+            state['_data_view'] = True
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        data_view = state.pop('_data_view', False)
+        for attr, value in state.items():
+            setattr(self, attr, value)
+        if data_view:
+            self._data = self._data.view()
+            self._data.flags.writeable = False
+
     def __str__(self):
         return 'GCField {}'.format(self.name or self.var_name)
 
@@ -117,6 +265,140 @@ class GCField(object):
 # HEMCO API classes and functions
 #-----------------------------------------------------------------------------
 
+class EmissionAttributes(object):
+    """
+    Emission metadata of a field (base class).
+
+    A compact record (no instance dictionary, interned strings) which can
+    be used like a dictionary: known metadata are stored in slots and any
+    other item in an extra dictionary. A slot which is not set is not a key
+    of the record.
+
+    Parameters
+    ----------
+    items : mapping or iterable of (key, value) pairs
+        Metadata items.
+    **kwargs
+        Metadata items.
+    """
+
+    __slots__ = ('_extra',)
+    _keys = ()
+    _interned = ('name', 'timestamp', 'species', 'operator')
+
+    def __init__(self, items=(), **kwargs):
+        self._extra = None
+        self.update(items, **kwargs)
+
+    def __getitem__(self, key):
+        if key in self._keys:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._keys:
+            if key in self._interned:
+                value = _intern(value)
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._keys:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def keys(self):
+        keys = [key for key in self._keys if hasattr(self, key)]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, items=(), **kwargs):
+        if hasattr(items, 'keys'):
+            items = [(key, items[key]) for key in items.keys()]
+        for key, value in list(items) + kwargs.items():
+            self[key] = value
+
+    def copy(self):
+        return self.__class__(self)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if not hasattr(other, 'keys'):
+            return NotImplemented
+        return dict(self.items()) == dict((key, other[key])
+                                          for key in other.keys())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        self._extra = None
+        self.update(state)
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(self.__class__.__name__, dict(self.items()))
+
+
+class BaseEmissionAttributes(EmissionAttributes):
+    """
+    Metadata of a base emission field (see :func:`base_emission_field`).
+    """
+    __slots__ = ('name', 'timestamp', 'species', 'category', 'hierarchy',
+                 'scale_factors')
+    _keys = __slots__
+
+
+class ScaleFactorAttributes(EmissionAttributes):
+    """
+    Metadata of a scale factor or a mask (see :func:`scale_factor` and
+    :func:`mask`).
+    """
+    __slots__ = ('name', 'timestamp', 'operator', 'fid', 'mask_window',
+                 'mirror')
+    _keys = __slots__
+
+
 def _add_emission_attr(gc_field, name, attr_name, attr_val, copy_field):
     """
     Adds an emission-specific attribute to `gc_field` (raises an error if
@@ -167,7 +449,149 @@ def is_scale_factor(gc_field, critical=False):
         raise ValueError("missing '{}' attribute".format(SF_ATTR_NAME))
     else:
         return etest
-        
+
+
+class EmissionAttr(object):
+    """
+    Key function that returns the value of an emission attribute of a
+    :class:`GCField` object (e.g., 'species', 'category' or 'hierarchy' for
+    base emission fields, 'fid' or 'operator' for scale factors and masks),
+    or None if the field has no such attribute.
+
+    Can be used to sort, index or query collections of emission fields.
+    Key functions for the same attribute are equal, so that an index
+    created with one key function is used by queries built with another.
+
+    Examples
+    --------
+    >>> fields = ext.base_emission_fields
+    >>> fields.create_index(EmissionAttr('hierarchy'), kind='sorted')
+    >>> fields.filter(Query(EmissionAttr('hierarchy')) > 10)
+    """
+
+    def __init__(self, attr_name):
+        self.attr_name = attr_name
+
+    def __call__(self, gc_field):
+        attributes = gc_field.attributes
+        e_attr = attributes.get(BEF_ATTR_NAME)
+        if e_attr is None:
+            e_attr = attributes.get(SF_ATTR_NAME)
+            if e_attr is None:
+                return None
+        return e_attr.get(self.attr_name)
+
+    def __eq__(self, other):
+        return (isinstance(other, EmissionAttr) and
+                other.attr_name == self.attr_name)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((EmissionAttr, self.attr_name))
+
+    def __repr__(self):
+        return "{0}({1!r})".format(self.__class__.__name__, self.attr_name)
+
+
+_FID = EmissionAttr('fid')
+
+
+def _id_conflicts(objs, get_id):
+    """
+    Return the objects of `objs` which have no ID or the ID of a previous
+    object (in one pass), and the set of the IDs in use.
+    """
+    used = set()
+    conflicts = []
+    for obj in objs:
+        obj_id = get_id(obj)
+        if obj_id is None or obj_id in used:
+            conflicts.append(obj)
+        else:
+            used.add(obj_id)
+    return conflicts, used
+
+
+def _id_errors(objs, get_id, id_name):
+    """Return the messages for the missing and duplicate IDs of `objs`."""
+    conflicts, used = _id_conflicts(objs, get_id)
+    missing = []
+    duplicates = OrderedDict()
+    for obj in conflicts:
+        obj_id = get_id(obj)
+        if obj_id is None:
+            missing.append(obj.name)
+        else:
+            duplicates.setdefault(obj_id, []).append(obj.name)
+    errors = []
+    if missing:
+        errors.append("Missing {0} for {1}".format(id_name,
+                                                    ", ".join(missing)))
+    for obj_id, names in duplicates.items():
+        errors.append("Duplicate {0} {1} ({2})".format(id_name, obj_id,
+                                                       ", ".join(names)))
+    return errors
+
+
+def _free_ids(used, start):
+    """Generate (lazily) the integers from `start` that are not in `used`."""
+    new_id = start
+    while True:
+        if new_id not in used:
+            yield new_id
+        new_id += 1
+
+
+def _resolve_ids(objs, get_id, start=1):
+    """
+    Return a list of (object, new ID) for the objects of `objs` which have
+    no ID or a duplicate ID. New IDs are free IDs from the lowest ID in use
+    (or from `start`).
+    """
+    conflicts, used = _id_conflicts(objs, get_id)
+    if not conflicts:
+        return []
+    new_ids = _free_ids(used, min(used) if used else start)
+    return [(obj, next(new_ids)) for obj in conflicts]
+
+
+def _scale_factor_collection(scale_factors):
+    """Return a new collection of scale factors for a base emission field."""
+    return ObjectCollection(scale_factors, ref_class=GCField,
+                            fpost=(_check_scale_factor, None))
+
+
+def _copy_attributes(attributes):
+    """
+    Copy the attributes of a field: emission metadata are copied, with a new
+    collection of (the same) scale factors.
+    """
+    new_attributes = {}
+    for key, value in attributes.items():
+        if isinstance(value, EmissionAttributes):
+            value = value.copy()
+            if 'scale_factors' in value:
+                value['scale_factors'] = _scale_factor_collection(
+                    value['scale_factors'])
+        else:
+            value = deepcopy(value)
+        new_attributes[key] = value
+    return new_attributes
+
+
+def _copy_on_write(gc_field):
+    return gc_field.copy(copy_data='on_write')
+
+
+def _check_base_emission_field(gc_field):
+    return is_base_emission_field(gc_field, critical=True)
+
+
+def _check_scale_factor(gc_field):
+    return is_scale_factor(gc_field, critical=True)
+
 
 def base_emission_field(gc_field, name, timestamp, species, category,
                         hierarchy, scale_factors=None, copy=False):
@@ -209,16 +633,15 @@ def base_emission_field(gc_field, name, timestamp, species, category,
     """
     scale_factors    = scale_factors or []
 
-    fpost_add = lambda gcf: is_scale_factor(gcf, critical=True)
-    scale_factors = ObjectCollection(scale_factors, ref_class=GCField,
-                                     fpost=(fpost_add, None))
+    scale_factors = _scale_factor_collection(scale_factors)
 
-    e_attr = {'name': str(name),
-              'timestamp': str(strp_datetimeslicer(timestamp)),
-              'species': species,
-              'category': int(category),
-              'hierarchy': int(hierarchy),
-              'scale_factors': scale_factors}
+    e_attr = BaseEmissionAttributes(
+        name=str(name),
+        timestamp=str(strp_datetimeslicer(timestamp)),
+        species=species,
+        category=int(category),
+        hierarchy=int(hierarchy),
+        scale_factors=scale_factors)
 
     e_field = _add_emission_attr(gc_field, name, BEF_ATTR_NAME,
                                  e_attr, copy)
@@ -261,10 +684,11 @@ def scale_factor(gc_field, name, timestamp, operator='*', copy=False,
     if fid is not None:
         fid = int(fid)
 
-    sf_attr = {'name': str(name),
-               'timestamp': str(strp_datetimeslicer(timestamp)),
-               'operator': operator,
-               'fid': fid}
+    sf_attr = ScaleFactorAttributes(
+        name=str(name),
+        timestamp=str(strp_datetimeslicer(timestamp)),
+        operator=operator,
+        fid=fid)
 
     e_field = _add_emission_attr(gc_field, name, SF_ATTR_NAME,
                                  sf_attr, copy)
@@ -307,12 +731,13 @@ def mask(gc_field, name, timestamp, mask_window=None, mirror=False,
     if fid is not None:
         fid = int(fid)
 
-    sf_attr = {'name': str(name),
-               'timestamp': str(strp_datetimeslicer(timestamp)),
-               'operator': 'mul',
-               'mask_window': mask_window,
-               'mirror': bool(mirror),
-               'fid': fid}
+    sf_attr = ScaleFactorAttributes(
+        name=str(name),
+        timestamp=str(strp_datetimeslicer(timestamp)),
+        operator='mul',
+        mask_window=mask_window,
+        mirror=bool(mirror),
+        fid=fid)
 
     e_field = _add_emission_attr(gc_field, name, SF_ATTR_NAME,
                                  sf_attr, copy)
@@ -320,7 +745,105 @@ def mask(gc_field, name, timestamp, mask_window=None, mirror=False,
         return e_field
 
 
-class EmissionExt(object):
+class _Versioned(object):
+    """
+    Version counter and change subscriptions of the emission settings
+    (extensions and global settings), propagated from their collections.
+    """
+
+    _version = 0
+    _subscribers = ()
+
+    @property
+    def version(self):
+        """
+        Version of the object, i.e., a counter which is incremented each time
+        a collection of fields (or extensions) under this object is changed.
+        """
+        return self._version
+
+    def subscribe(self, callback):
+        """
+        Register `callback` to be called after a collection of fields (or
+        extensions) under this object is changed.
+
+        Parameters
+        ----------
+        callback : callable
+            Called as ``callback(source, event, objs)``, where `source` is
+            the changed collection (or the object itself), `event` is 'add',
+            'remove' or 'modify' and `objs` is the list of the objects
+            concerned (see :meth:`datatypes.ObjectCollection.subscribe`).
+
+        Notes
+        -----
+        Subscriptions are not kept when the object is pickled or copied.
+        """
+        self._subscribers = self._subscribers + (callback,)
+
+    def unsubscribe(self, callback):
+        """Unregister `callback` (see :meth:`subscribe`)."""
+        subscribers = list(self._subscribers)
+        subscribers.remove(callback)
+        self._subscribers = tuple(subscribers)
+
+    def _on_change(self, source, event, objs):
+        self._version += 1
+        for callback in self._subscribers:
+            callback(source, event, objs)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_subscribers', None)
+        return state
+
+
+class _FieldRegistry(object):
+    """
+    Read-only collection of the fields attached to the emission settings
+    (each field once, in the order of attachment), with the number of
+    attachments of each field.
+    """
+
+    __slots__ = ('fields', 'counts')
+
+    def __init__(self):
+        self.fields = ObjectCollection([], ref_class=GCField, read_only=True)
+        self.counts = {}
+
+    def add(self, fields):
+        """Attach `fields`, return the fields that were not attached yet."""
+        new_fields = []
+        for field in fields:
+            count = self.counts.get(field, 0)
+            self.counts[field] = count + 1
+            if not count:
+                new_fields.append(field)
+        self._update(self.fields.add_many, new_fields)
+        return new_fields
+
+    def remove(self, fields):
+        """Detach `fields`, return the fields that are no more attached."""
+        old_fields = []
+        for field in fields:
+            count = self.counts.pop(field) - 1
+            if count:
+                self.counts[field] = count
+            else:
+                old_fields.append(field)
+        self._update(self.fields.remove_many, old_fields)
+        return old_fields
+
+    def _update(self, method, fields):
+        if fields:
+            self.fields._read_only = False
+            try:
+                method(fields)
+            finally:
+                self.fields._read_only = True
+
+
+class EmissionExt(_Versioned):
     """
     An extension of the Harvard Emissions Component (HEMCO).
     
@@ -337,6 +860,14 @@ class EmissionExt(object):
     eid : int or None
         Specify manually an ID to identify the extension. Note that 0
         corresponds to HEMCO Core.
+
+    Notes
+    -----
+    Extension settings (`settings`, given as keyword arguments or added with
+    :meth:`addSetting`) are kept in an ordered dictionary: they are written
+    in the order they have been read or added, which doesn't change when
+    the settings are copied, pickled or loaded from the cache (plain
+    dictionaries were written in an arbitrary order).
     """
 
     def __init__(self, name, enabled=True, base_emission_fields=None,
@@ -344,7 +875,6 @@ class EmissionExt(object):
         if eid is not None:
             eid = int(eid)
         base_emission_fields = base_emission_fields or []
-        is_bef = lambda gcfield: is_base_emission_field(gcfield, critical=True)
 
         self.eid = eid
         self.name = str(name)
@@ -352,9 +882,34 @@ class EmissionExt(object):
         self.species = species
         self._base_emission_fields = ObjectCollection(base_emission_fields,
                                                       ref_class=GCField,
-                                                      fpre=(is_bef, None))
-        self.settings = dict()
+                                                      fpre=(_check_base_emission_field,
+                                                            None),
+                                                      fcopy=_copy_on_write)
+        self.settings = OrderedDict()
         self.settings.update(kwargs)
+        self._subscribe_fields()
+
+    def _subscribe_fields(self):
+        """
+        Follow the changes of the base emission fields and of their scale
+        factors.
+        """
+        self._base_emission_fields.subscribe(self._on_change)
+        for field in self._base_emission_fields:
+            field.emission_scale_factors.subscribe(self._on_change)
+
+    def _on_change(self, source, event, objs):
+        if source is self._base_emission_fields:
+            for field in objs:
+                if event == 'add':
+                    field.emission_scale_factors.subscribe(self._on_change)
+                elif event == 'remove':
+                    field.emission_scale_factors.unsubscribe(self._on_change)
+        super(EmissionExt, self)._on_change(source, event, objs)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._subscribe_fields()
 
     def addSetting(self,setting_name,setting_val):
         self.settings[setting_name] = setting_val
@@ -386,7 +941,7 @@ class EmissionExt(object):
                                          str(self.eid))
 
 
-class Emissions(object):
+class Emissions(_Versioned):
     """
     Global emission settings.
     
@@ -411,6 +966,106 @@ class Emissions(object):
         self._extensions = ObjectCollection(extensions, ref_class=EmissionExt)
         self.description = str(description)
         self.name = str(self.description)
+        self.config_source = None
+        self._init_registries()
+
+    def _init_registries(self):
+        """
+        Register the base emission fields and scale factors of the
+        extensions, and follow the changes of the extensions, of their
+        fields and of the scale factors of these fields.
+        """
+        self._base_emission_fields = _FieldRegistry()
+        self._scale_factors = _FieldRegistry()
+        self._field_collections = set()
+        self._scale_factors.fields.create_index(_FID)
+        self._eids = None
+        self._extensions.subscribe(self._on_change)
+        for ext in self._extensions:
+            self._add_extension(ext)
+
+    def _add_extension(self, ext):
+        ext.subscribe(self._on_ext_change)
+        self._field_collections.add(id(ext.base_emission_fields))
+        self._register_fields(ext.base_emission_fields)
+
+    def _remove_extension(self, ext):
+        ext.unsubscribe(self._on_ext_change)
+        self._field_collections.discard(id(ext.base_emission_fields))
+        self._unregister_fields(ext.base_emission_fields)
+
+    def _register_fields(self, fields):
+        scale_factors = []
+        for field in self._base_emission_fields.add(fields):
+            field.emission_scale_factors.subscribe(
+                self._on_scale_factors_change)
+            scale_factors.extend(field.emission_scale_factors)
+        self._scale_factors.add(scale_factors)
+
+    def _unregister_fields(self, fields):
+        scale_factors = []
+        for field in self._base_emission_fields.remove(fields):
+            field.emission_scale_factors.unsubscribe(
+                self._on_scale_factors_change)
+            scale_factors.extend(field.emission_scale_factors)
+        self._scale_factors.remove(scale_factors)
+
+    def _on_change(self, source, event, objs):
+        if source is self._extensions:
+            self._eids = None
+            for ext in objs:
+                if event == 'add':
+                    self._add_extension(ext)
+                elif event == 'remove':
+                    self._remove_extension(ext)
+        super(Emissions, self)._on_change(source, event, objs)
+
+    def _on_ext_change(self, source, event, objs):
+        if id(source) not in self._field_collections:
+            # scale factors of a field are followed once (even if the
+            # field is attached to several extensions)
+            return
+        if event == 'add':
+            self._register_fields(objs)
+        elif event == 'remove':
+            self._unregister_fields(objs)
+        self._on_change(source, event, objs)
+
+    def _on_scale_factors_change(self, source, event, objs):
+        if event == 'add':
+            self._scale_factors.add(objs)
+        elif event == 'remove':
+            self._scale_factors.remove(objs)
+        self._on_change(source, event, objs)
+
+    def __getstate__(self):
+        state = super(Emissions, self).__getstate__()
+        # registries are rebuilt when unpickled
+        for attr in ('_base_emission_fields', '_scale_factors',
+                     '_field_collections', '_eids'):
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_registries()
+
+    def touch(self, objs=()):
+        """
+        Increment the version of the emission settings and notify the
+        subscribers (event 'modify', see :meth:`subscribe`) that the objects
+        `objs` (fields, extensions...) have been modified in place.
+
+        Notes
+        -----
+        Changes of the collections of extensions, base emission fields and
+        scale factors are followed automatically, but not the changes of
+        the attributes or data of these objects. Indexes by ID (see
+        :meth:`get_scale_factor` and :meth:`get_extension`) are rebuilt.
+        """
+        self._scale_factors.fields.reindex()
+        self._eids = None
+        self._on_change(self, 'modify', list(objs))
 
     @property
     def extensions(self):
@@ -436,15 +1091,20 @@ class Emissions(object):
         specific 'emission_base' field attribute).
         If a field is attached to several extensions, it appears only once
         in the collection.
-        
+
+        Notes
+        -----
+        The collection is updated when fields are attached to (detached
+        from) the extensions. Fields are in the order they have been
+        attached. This property used to return a new collection at each
+        access, with the fields in an arbitrary order: use
+        ``base_emission_fields.get_all().copy()`` to get a snapshot.
+
         See Also
         --------
         :func:`base_emission_field`
         """
-        bef = []
-        for ext in self.extensions:
-            bef.extend(ext.base_emission_fields._list)
-        return ObjectCollection(set(bef), ref_class=GCField, read_only=True)
+        return self._base_emission_fields.fields
 
     @property
     def scale_factors(self):
@@ -459,17 +1119,93 @@ class Emissions(object):
         If a scale factor is attached to several base emission fields, it
         appears only once in the collection.
 
+        Notes
+        -----
+        The collection is updated when scale factors are attached to
+        (detached from) the base emission fields. Scale factors are in the
+        order they have been attached.
+
         See Also
         --------
         :func:`scale_factor`
         """
-        scale_factors = []
-        for field in self.base_emission_fields:
-            e_attr = field.attributes['emission_base']
-            e_sf_list = e_attr.get('scale_factors', [])
-            scale_factors.extend(e_sf_list)
-        return ObjectCollection(set(scale_factors), ref_class=GCField,
-                                read_only=True)
+        return self._scale_factors.fields
+
+    def set_concurrent(self, concurrent=True):
+        """
+        Enable (or disable) the concurrent mode of the collections of
+        extensions and base emission fields, so that the emission settings
+        can be read by several threads while another thread edits them
+        (see :meth:`datatypes.ObjectCollection.set_concurrent`).
+        """
+        self.extensions.set_concurrent(concurrent)
+        for ext in self.extensions:
+            ext.base_emission_fields.set_concurrent(concurrent)
+        self._base_emission_fields.fields.set_concurrent(concurrent)
+        self._scale_factors.fields.set_concurrent(concurrent)
+
+    def get_scale_factor(self, fid):
+        """
+        Return the scale factor or mask which has the ID `fid`.
+
+        If several scale factors have the same ID, the first one (in the
+        order of :attr:`scale_factors`) is returned.
+
+        Raises
+        ------
+        KeyError
+            If no scale factor has the ID `fid`.
+
+        Notes
+        -----
+        Scale factors are indexed by ID. The index is updated when scale
+        factors are attached to (detached from) the base emission fields,
+        but not when the ID of a scale factor is changed in place: call
+        :meth:`touch` after such changes.
+        """
+        selection = self.scale_factors.filter(Query(_FID) == fid)._list
+        if not selection:
+            raise KeyError(fid)
+        return selection[0]
+
+    def get_extension(self, eid):
+        """
+        Return the extension which has the ID `eid`.
+
+        If several extensions have the same ID, the first one (in the order
+        of :attr:`extensions`) is returned.
+
+        Raises
+        ------
+        KeyError
+            If no extension has the ID `eid`.
+
+        Notes
+        -----
+        Extensions are indexed by ID in a private map (the collection of
+        :attr:`extensions` itself is not indexed). The map is rebuilt when
+        extensions are added or removed, when :meth:`touch` is called, and
+        when a lookup finds that the ID of an extension has been changed in
+        place. If the ID of an extension is changed in place to the ID of
+        another extension, call :meth:`touch` to get the first of them.
+        """
+        ext = self._extension_index().get(eid)
+        if ext is None or ext.eid != eid:
+            # the ID of an extension may have been changed in place
+            self._eids = None
+            ext = self._extension_index().get(eid)
+            if ext is None:
+                raise KeyError(eid)
+        return ext
+
+    def _extension_index(self):
+        """Return the map {eid: first extension with this ID}."""
+        if self._eids is None:
+            eids = {}
+            for ext in self._extensions:
+                eids.setdefault(ext.eid, ext)
+            self._eids = eids
+        return self._eids
 
     def get_scalIDs(self):
         """
@@ -479,77 +1215,220 @@ class Emissions(object):
                 for sf in self.scale_factors]
         return fids
 
+    def to_table(self):
+        """
+        Export the metadata of all base emission fields, scale factors and
+        masks into a table of NumPy arrays, so that fields can be selected
+        or grouped using vectorized operations.
+
+        Returns
+        -------
+        A NumPy structured array with one row per field (base emission
+        fields in the order of the extensions, then scale factors and masks
+        in the order they are first used) and the columns:
+
+        'field' : the :class:`GCField` object (to map rows back to fields).
+        'kind' : 'base', 'scale' or 'mask'.
+        'name', 'species', 'operator' : strings ('' if not defined).
+        'eid', 'category', 'hierarchy', 'fid' : ints (-1 if not defined).
+        'start', 'end' : time span of the timestamp (datetime64[s]).
+        'mask_window' : Lon1/Lat1/Lon2/Lat2 (4 floats, NaN if not a mask).
+
+        Examples
+        --------
+        >>> table = emis.to_table()
+        >>> sel = (table['category'] == 1) & (table['hierarchy'] > 10)
+        >>> fields = table['field'][sel]
+        """
+        fields = []
+        eids = {}
+        for ext in self.extensions:
+            for field in ext.base_emission_fields:
+                if id(field) not in eids:
+                    eids[id(field)] = ext.eid
+                    fields.append(field)
+        seen = set()
+        for field in list(fields):
+            for sf in field.attributes[BEF_ATTR_NAME]['scale_factors']:
+                if id(sf) not in seen:
+                    seen.add(id(sf))
+                    fields.append(sf)
+
+        spans = {}
+
+        def span(field):
+            timestamp = EmissionAttr('timestamp')(field)
+            if timestamp not in spans:
+                spans[timestamp] = strp_datetimeslicer(timestamp).span()
+            return spans[timestamp]
+
+        def int_attr(attr_name):
+            key = EmissionAttr(attr_name)
+            return lambda field: -1 if key(field) is None else key(field)
+
+        def str_attr(attr_name):
+            key = EmissionAttr(attr_name)
+            return lambda field: str(key(field) if key(field) is not None
+                                     else '')
+
+        def kind(field):
+            if field.is_base():
+                return 'base'
+            return 'mask' if field.is_mask() else 'scale'
+
+        def mask_window(field):
+            window = EmissionAttr('mask_window')(field)
+            return list(window) if window else [np.nan] * 4
+
+        columns = [('field', lambda field: field, object),
+                   ('kind', kind, str),
+                   ('name', 'name', str),
+                   ('eid', lambda field: eids.get(id(field), -1), int),
+                   ('species', str_attr('species'), str),
+                   ('category', int_attr('category'), int),
+                   ('hierarchy', int_attr('hierarchy'), int),
+                   ('fid', int_attr('fid'), int),
+                   ('operator', str_attr('operator'), str),
+                   ('start', lambda field: span(field)[0], 'datetime64[s]'),
+                   ('end', lambda field: span(field)[1], 'datetime64[s]'),
+                   ('mask_window', mask_window, float)]
+        collection = ObjectCollection(fields, ref_class=GCField)
+        arrays = collection.to_columns(columns)
+
+        dtype = [(name, arr.dtype, (4,) if name == 'mask_window' else ())
+                 for name, arr in arrays.items()]
+        table = np.empty(len(fields), dtype=dtype)
+        for name, arr in arrays.items():
+            table[name] = arr.reshape(table[name].shape)
+        return table
+
     def check_id(self):
         """
         Check scale factors and extensions identifiants
         (missing ids or duplicates).
-        """
-        fids = self.get_scalIDs()
-        if None in fids or len(set(fids)) != len(fids):
-            # TODO: raise custom exception
-            raise ValueError("Missing or duplicate scale factor fid")
 
-        eids = [ext.eid for ext in self.extensions]
-        if None in eids or len(set(eids)) != len(eids):
-            # TODO: raise custom exception
-            raise ValueError("Missing or duplicate extension eid")
-        if 0 not in eids:
+        Raises
+        ------
+        ValueError
+            If some IDs are missing or duplicated, or if HEMCO Core (eid=0)
+            is not found. All conflicts are reported in the message.
+        """
+        errors = (_id_errors(self.scale_factors, _FID, 'scale factor fid') +
+                  _id_errors(self.extensions, attrgetter('eid'),
+                             'extension eid'))
+        if not self.extensions.filter(eid=0)._list:
+            errors.append("HEMCO Core (eid=0) not found in extensions")
+        if errors:
             # TODO: raise custom exception
-            raise ValueError("HEMCO Core (eid=0) not found in extensions")
+            raise ValueError("; ".join(errors))
 
     def resolve_id(self):
         """
         Automatically resolve scale factors and extensions ID conficts
         (add new ID(s) if not already set, update ID(s) if needed).
+
+        The first object (scale factor or extension) with a given ID keeps
+        its ID. Other objects with the same ID and objects without ID get
+        the lowest free IDs above the lowest ID in use.
+
+        Returns
+        -------
+        A list of (object, old ID, new ID) tuples for the resolved
+        conflicts.
         """
-        fids = self.get_scalIDs()
-        min_fid = min(i for i in fids if i is not None)
-        range_fids = range(min_fid, max(fids) + len(fids) + 1)
-        duplicate_fids = set([fid for fid in fids if fids.count(fid) > 1])
-        available_fids = sorted(set(range_fids) - set(fids))
-
-        inc = 0
-        first_dups = []
-        for sf in self.scale_factors:
-            fid = sf.attributes[SF_ATTR_NAME].get('fid')
-            if fid not in duplicate_fids and fid is not None:
-                continue
-            if fid not in first_dups and fid is not None:
-                first_dups.append(fid)
-                continue
-            sf.attributes[SF_ATTR_NAME]['fid'] = available_fids[inc]
-            inc += 1
-
-        eids = [ext.eid for ext in self.extensions]
-        min_eid = min(i for i in eids if i is not None)
-        range_eids = range(min_eid, max(eids) + len(eids) + 1)
-        duplicate_eids = set([eid for eid in eids if eids.count(eid) > 1])
-        available_eids = sorted(set(range_eids) - set(eids))
-
-        inc = 0
-        first_dups = []
-        for ext in self.extensions:
-            eid = ext.eid
-            if eid not in duplicate_eids and eid is not None:
-                continue
-            if eid not in first_dups and eid is not None:
-                first_dups.append(eid)
-                continue
-            ext.eid = available_eids[inc]
-            inc += 1
+        resolved = []
+        for sf, fid in _resolve_ids(self.scale_factors, _FID):
+            e_attr = sf.attributes[SF_ATTR_NAME]
+            resolved.append((sf, e_attr.get('fid'), fid))
+            e_attr['fid'] = fid
+        for ext, eid in _resolve_ids(self.extensions, attrgetter('eid'),
+                                     start=0):
+            resolved.append((ext, ext.eid, eid))
+            ext.eid = eid
+
+        self.touch(obj for obj, old_id, new_id in resolved)
+        return resolved
 
     @classmethod
-    def load(cls, filename):
+    def load(cls, filename, use_cache=False, species=None, enabled_only=False,
+             categories=None, time_window=None):
         """
         Load emission settings from an HEMCO-formatted input file given by
         `filename`.
-        
+
+        If `use_cache` is True (and the cache is enabled, see
+        :mod:`pyhemco.cache`), a snapshot of the settings is saved on disk
+        (in :data:`pyhemco.cache.CACHE_DIR`) after the file is parsed, and
+        is loaded instead of parsing the file again as long as the file
+        doesn't change. The cache is not used by default: the file is
+        always parsed and nothing is written on disk.
+
+        The other parameters allow to load only a subset of the base
+        emission fields (the rows of the file that are filtered out are
+        skipped before any field is created):
+
+        species : list of strings or None
+            Load only the base emission fields of these species.
+        enabled_only : bool
+            If True, load the base emission fields of enabled extensions
+            only.
+        categories : (int, int) or None
+            Load only the base emission fields with a category within this
+            range (bounds included).
+        time_window : (datetime, datetime) or None
+            Load only the base emission fields with a time stamp overlapping
+            this window (see :class:`pyhemco.io.RowFilter`).
+
+        Scale factors and masks are loaded only if they are used by the
+        loaded base emission fields.
+
         See Also
         --------
         :func:`load_emissions_file`
-        """        
-        cls = read_config_file( filename )
-        return cls
+        """
+        row_filter = None
+        if (species, categories, time_window) != (None, None, None):
+            row_filter = RowFilter(species=species, categories=categories,
+                                   time_window=time_window)
+        read_all = not enabled_only
+
+        def loader(filename):
+            return read_config_file(filename, read_all=read_all,
+                                    row_filter=row_filter)
+
+        if use_cache and cache.ENABLED:
+            tag = None
+            if row_filter is not None or enabled_only:
+                tag = (read_all, row_filter and row_filter.key())
+            return cache.load(filename, loader, tag=tag)
+        return loader(filename)
+
+    def reload(self, filename=None):
+        """
+        Update the emission settings with the current content of the
+        HEMCO-formatted input file from which they have been loaded (or the
+        file given by `filename`).
+
+        Only the rows of the file that have changed are applied. Fields and
+        extensions that are not affected by the changes are kept as is
+        (including their data).
+
+        Returns
+        -------
+        A dictionary with the keys of the 'added', 'modified' and 'removed'
+        rows.
+
+        See Also
+        --------
+        :func:`pyhemco.io.reload_config_file`
+        """
+        changes = reload_config_file(self, filename)
+        if any(changes.values()):
+            # settings and objects modified in place
+            rows = self.config_source.rows
+            self.touch(rows[key].obj for key in changes['modified']
+                       if rows[key].obj is not None)
+        return changes
 
     @classmethod
     def builtin(cls, settings):
@@ -563,30 +1442,67 @@ class Emissions(object):
         settings_file = os.path.join(BUILTIN_SETTINGS_PATH, settings)
         return cls.load(settings_file)
 
-    def save(self, filename, resolve_id=False):
+    def save(self, filename, resolve_id=False, incremental=False):
         """
         Save emission settings to an HEMCO-formatted input file given by
         `filename`.
+
+        If `incremental` is True and the settings have been loaded from a
+        file, only the rows of the fields, scale factors, extensions and
+        settings that have been added, removed or modified since then are
+        rewritten. The rest of the file (including comments and layout) is
+        kept as is.
+
+        See Also
+        --------
+        :func:`pyhemco.io.update_config_file`
         """
         # TODO: (not yet implemented)
         if resolve_id:
             self.resolve_id()
         else:
             self.check_id()
-            
-        write_config_file ( self, filename )
 
-    def compute_emissions(self, time, grid):
+        if incremental and self.config_source is not None:
+            update_config_file(self, filename)
+        else:
+            write_config_file ( self, filename )
+
+    def compute_emissions(self, time, grid, data_loader=None):
         """
-        Call here the Python-wrapped FORTRAN routine to calculate emissions
-        at particular time(s) and with a given grid.
-        
+        Calculate the emissions of each species at a particular time and
+        with a given grid.
+
+        Base emission fields of HEMCO Core are scaled by their scale factors
+        and masks, then assembled: within a category, fields of higher
+        hierarchy overwrite fields of lower hierarchy where they are defined
+        (inside their masks), and categories are added.
+
+        Parameters
+        ----------
+        time : datetime
+            Time of the emissions.
+        grid : :class:`compute.Grid` object
+            Grid of the emissions (data of gridded fields must have the
+            shape of this grid).
+        data_loader : callable or None
+            Called as ``data_loader(field, time)`` to get the data of fields
+            which have no data.
+
         Returns
         -------
-        :class:`GCField` object
+        An ordered dictionary {species: :class:`GCField` object}.
+
+        See Also
+        --------
+        :class:`compute.EmissionEngine` (to compute emissions at several
+        times with the same work arrays).
         """
-        # TODO: (not yet implemented)
-        pass
+        engine = EmissionEngine(grid, data_loader=data_loader)
+        return OrderedDict(
+            (species, GCField(species, var_name=species, ndim=2,
+                              unit='kg/m2/s', data=data))
+            for species, data in engine.compute(self, time).items())
 
     def __str__(self):
         return "GC-Emission settings: {0}".format(self.description)
@@ -594,7 +1510,7 @@ class Emissions(object):
     def __repr__(self):
         return repr(self)
 
-def load_emissions_file(filename):
+def load_emissions_file(filename, use_cache=False, **kwargs):
     """
     Load emission settings from a file.
     
@@ -602,12 +1518,18 @@ def load_emissions_file(filename):
     ----------
     filename : string
         Name of (path to) the HEMCO settings file.
+    use_cache : bool
+        If True, use the on-disk cache of parsed settings files (see
+        :meth:`Emissions.load`). Default: False.
+    **kwargs
+        Load-time filters `species`, `enabled_only`, `categories` and
+        `time_window` (see :meth:`Emissions.load`).
     
     Returns
     -------
     A :class:`Emissions` object.
     """
-    return Emissions.load(filename)
+    return Emissions.load(filename, use_cache=use_cache, **kwargs)
 
 
 def load_emissions_builtin(settings):
@@ -10,12 +10,414 @@
 Several input/output writing routines for pyHEMCO.
 """
 
+import os
 import sys
+import mmap
+import shutil
+import hashlib
+import tempfile
+from array import array
+from collections import namedtuple
+
 import pyhemco
+from pyhemco.timetools import strp_datetimeslicer
 
 SEPARATOR = '####################################################################################'
 COMMENT = '#'
 EXTSETTING_PREFIX = '--> '
+SECTION_BEGIN = 'BEGIN SECTION '
+SECTION_END = 'END SECTION '
+
+#-----------------------------------------------------------------------------
+# Configuration file events (see iter_config)
+#-----------------------------------------------------------------------------
+
+SettingEvent = namedtuple('SettingEvent',
+                          ['lineno', 'line', 'name', 'value'])
+BaseFieldEvent = namedtuple('BaseFieldEvent',
+                            ['lineno', 'line', 'section', 'eid', 'name',
+                             'srcfile', 'srcvar', 'srctime', 'srcdim',
+                             'srcunit', 'species', 'scalIDs', 'category',
+                             'hierarchy', 'data'])
+ScaleFactorEvent = namedtuple('ScaleFactorEvent',
+                              ['lineno', 'line', 'fid', 'name', 'srcfile',
+                               'srcvar', 'srctime', 'srcdim', 'srcunit',
+                               'operator', 'data'])
+MaskEvent = namedtuple('MaskEvent',
+                       ['lineno', 'line', 'fid', 'name', 'srcfile', 'srcvar',
+                        'srctime', 'srcdim', 'srcunit', 'operator', 'data',
+                        'mask_window'])
+ExtSwitchEvent = namedtuple('ExtSwitchEvent',
+                            ['lineno', 'line', 'eid', 'name', 'enabled',
+                             'species'])
+ExtSettingEvent = namedtuple('ExtSettingEvent',
+                             ['lineno', 'line', 'eid', 'name', 'value'])
+
+#-----------------------------------------------------------------------------
+# Configuration file source (see read_config_file and reload_config_file)
+#-----------------------------------------------------------------------------
+
+class SourceRow(object):
+    """
+    A row of a configuration file (event, without the line text), the
+    object (field, extension or None) created from it and the state of the
+    object when it was read (see :func:`row_state`).
+    """
+    __slots__ = ('event', 'obj', 'state')
+
+    def __init__(self, event, obj=None, state=None):
+        self.event = event
+        self.obj   = obj
+        self.state = state
+
+    @property
+    def values(self):
+        """Row values, regardless of the position of the row in the file."""
+        return self.event[2:]
+
+class ConfigSource(object):
+    """
+    Sections and rows of a HEMCO configuration file, as read into an
+    emissions setup.
+
+    Sections are given as a dictionary {section name: (begin, end, digest)}
+    where begin and end are the line numbers of the 'BEGIN SECTION' and
+    'END SECTION' lines and digest is a hash of the non-empty lines in
+    between and of their position in the section.
+    Rows are given as a dictionary {key: :class:`SourceRow` object}. Keys
+    don't depend on the position of the rows in the file: (section,
+    identifier, occurrence), where the identifier is the setting name, the
+    (ExtNr, name) of base fields, the ScalID of scale factors and masks,
+    the ExtNr of extension switches or the (ExtNr, setting name) of
+    extension settings.
+
+    The options used to read the file (read_all, row_filter, see
+    :func:`read_config_file`) are also recorded.
+    """
+
+    def __init__( self, filename, read_all=True, row_filter=None ):
+        self.filename   = os.path.abspath(filename)
+        self.read_all   = read_all
+        self.row_filter = row_filter
+        self.sections   = {}
+        self.rows       = {}
+
+    def index( self, lines ):
+        """
+        Records the span and digest of each section of the given lines (all
+        the lines of the file, or a :class:`ConfigFile` object). Empty lines
+        are not hashed, so that both give the same digests.
+        """
+        section = None
+        last    = 0
+        for lineno, line in _numbered_lines( lines ):
+            sline = line.strip()
+            if not sline:
+                continue
+            last = lineno
+            if sline.startswith(SECTION_BEGIN):
+                section = sline[len(SECTION_BEGIN):].strip()
+                begin   = lineno
+                digest  = hashlib.sha1()
+            elif sline.startswith(SECTION_END) and section is not None:
+                self.sections[section] = (begin, lineno, digest.hexdigest())
+                section = None
+            elif section is not None:
+                digest.update(str(lineno - begin) + ':')
+                digest.update(line.rstrip('\r\n'))
+                digest.update('\n')
+        if section is not None:
+            self.sections[section] = (begin, last+1, digest.hexdigest())
+
+    def track( self, lines ):
+        """
+        Returns the given lines as a list, after recording the span and
+        digest of each section (see :meth:`index`).
+        """
+        lines = list(lines)
+        self.index( lines )
+        return lines
+
+    def add( self, event, counts ):
+        """
+        Records the row of the given event and returns it. counts holds the
+        number of rows already recorded for each identifier.
+        """
+        key = row_key( event, counts )
+        row = SourceRow( event._replace(line=None) )
+        self.rows[key] = row
+        return row
+
+    def section_rows( self, section ):
+        """Returns the (key, row) items of a section, ordered by line."""
+        items = [item for item in self.rows.items() if item[0][0] == section]
+        return sorted(items, key=lambda item: item[1].event.lineno)
+
+def field_state( field ):
+    """
+    Returns the values of a field (:class:`GCField` object) that are written
+    in its configuration file row, for comparison.
+    """
+    if field.is_base():
+        attrs = dict(field.attributes[pyhemco.emissions.BEF_ATTR_NAME])
+        attrs['scale_factors'] = [
+            scal.attributes[pyhemco.emissions.SF_ATTR_NAME]['fid']
+            for scal in attrs['scale_factors'] ]
+    else:
+        attrs = dict(field.attributes[pyhemco.emissions.SF_ATTR_NAME])
+    if field.filename == '-':
+        data = list(field.data)
+    else:
+        data = None
+    return (field.name, field.filename, field.var_name, field.ndim,
+            field.unit, data, attrs)
+
+def ext_state( ext ):
+    """
+    Returns the values of an extension (:class:`EmissionExt` object) that
+    are written in its extension switch row, for comparison.
+    """
+    return (ext.eid, ext.name, ext.enabled, list(ext.species))
+
+def row_state( row ):
+    """
+    Returns the current state of the object of a row (:class:`SourceRow`
+    object), i.e., the values that are written in the row, or the value of
+    settings rows.
+    """
+    event = row.event
+    if isinstance(event, (SettingEvent, ExtSettingEvent)):
+        return str(event.value)
+    if row.obj is None:
+        return None
+    if isinstance(event, ExtSwitchEvent):
+        return ext_state( row.obj )
+    return field_state( row.obj )
+
+def row_key( event, counts ):
+    """
+    Returns the key (section, identifier, occurrence) of the row of the
+    given event (see :class:`ConfigSource`).
+    """
+    if isinstance(event, SettingEvent):
+        ident = ('SETTINGS', event.name)
+    elif isinstance(event, BaseFieldEvent):
+        ident = (event.section, (event.eid, event.name))
+    elif isinstance(event, ScaleFactorEvent):
+        ident = ('SCALE FACTORS', event.fid)
+    elif isinstance(event, MaskEvent):
+        ident = ('MASKS', event.fid)
+    elif isinstance(event, ExtSwitchEvent):
+        ident = ('EXTENSION SWITCHES', event.eid)
+    else:
+        ident = ('EXTENSION SWITCHES', (event.eid, event.name))
+    occurrence = counts.get(ident, 0)
+    counts[ident] = occurrence + 1
+    return ident + (occurrence,)
+
+#-----------------------------------------------------------------------------
+# Load-time row filters
+#-----------------------------------------------------------------------------
+
+class RowFilter(object):
+    """
+    Predicate on the rows of the base emissions and extension data sections,
+    evaluated on the parsed events before any field is created. A row is
+    kept if it satisfies all the given criteria.
+
+    Parameters
+    ----------
+    species : [list of strings]
+        (optional) Keep only the rows of these species.
+    categories : [(integer, integer)]
+        (optional) Keep only the rows with a category within this range
+        (bounds included).
+    time_window : [(datetime, datetime)]
+        (optional) Keep only the rows whose time stamp overlaps this window.
+        Rows are compared by the overall span of their time slices (see
+        :meth:`timetools.DatetimeSlicer.span`). Note that HEMCO uses the
+        closest time slice of a field for simulation times outside of its
+        time stamp, e.g., for climatologies: such rows are not kept.
+    """
+
+    def __init__( self, species=None, categories=None, time_window=None ):
+        if species is not None:
+            species = frozenset(species)
+        if categories is not None:
+            categories = tuple(int(cat) for cat in categories)
+        if time_window is not None:
+            time_window = tuple(time_window)
+        self.species     = species
+        self.categories  = categories
+        self.time_window = time_window
+        self._spans      = {}
+
+    def key( self ):
+        """Returns a hashable representation of the filter criteria."""
+        species = self.species
+        if species is not None:
+            species = tuple(sorted(species))
+        return (species, self.categories, self.time_window)
+
+    def __call__( self, event ):
+        if self.species is not None and event.species not in self.species:
+            return False
+        if self.categories is not None:
+            if not self.categories[0] <= event.category <= self.categories[1]:
+                return False
+        if self.time_window is not None:
+            # many rows share a same time stamp
+            span = self._spans.get(event.srctime)
+            if span is None:
+                span = strp_datetimeslicer(event.srctime).span()
+                self._spans[event.srctime] = span
+            if span[0] >= self.time_window[1] or span[1] <= self.time_window[0]:
+                return False
+        return True
+
+    def __getstate__( self ):
+        return (self.species, self.categories, self.time_window)
+
+    def __setstate__( self, state ):
+        self.species, self.categories, self.time_window = state
+        self._spans = {}
+
+#-----------------------------------------------------------------------------
+# Random-access configuration file reader
+#-----------------------------------------------------------------------------
+
+class ConfigFile(object):
+    """
+    Read-only, random-access view of the (non-empty) lines of a HEMCO
+    configuration file, backed by a memory-mapped file.
+
+    The offsets of the lines and the spans of the sections are indexed once,
+    when the file is opened. Lines are decoded only when they are accessed,
+    so that reading one section (or one row) doesn't require to decode the
+    rest of the file.
+
+    Instances can be used in place of the list of configuration file lines
+    ('cfg_lines') taken by :func:`iter_config_lines` (events then get the
+    line numbers of the rows in the file, see :meth:`numbered`),
+    :func:`read_settings`, :func:`read_base_emissions`,
+    :func:`read_extensions`, :func:`section_span` (sections are then located
+    using the index) and :func:`get_scale_factor` (rows are then looked up
+    by ScalID).
+
+    Parameters
+    ----------
+    filename : (string)
+        File name (full path) of HEMCO configuration file
+    """
+
+    def __init__( self, filename ):
+        self.filename = os.path.abspath(filename)
+        self._rows    = {}
+        with open( self.filename, 'rb' ) as cfg_file:
+            if os.fstat( cfg_file.fileno() ).st_size > 0:
+                self._map = mmap.mmap( cfg_file.fileno(), 0,
+                                       access=mmap.ACCESS_READ )
+            else:
+                self._map = ''
+        self._index()
+
+    def _index( self ):
+        """
+        Builds the line offset index (start, end and line number of each
+        non-empty line) and the section index.
+        """
+        offsets  = array('l')
+        ends     = array('l')
+        linenos  = array('l')
+        sections = {}
+        section  = None
+        buf      = self._map
+        size     = len(buf)
+        pos      = 0
+        lineno   = 0
+        while pos < size:
+            lineno += 1
+            nxt = buf.find('\n', pos)
+            if nxt < 0:
+                nxt = size
+            line = buf[pos:nxt].strip()
+            if line:
+                if line.startswith(SECTION_BEGIN):
+                    name = line[len(SECTION_BEGIN):].strip()
+                    if name in sections or name == section:
+                        msg = "Section " + name + " is defined more than once!"
+                        raise ValueError(msg)
+                    section = name
+                    first   = len(offsets) + 1
+                elif line.startswith(SECTION_END) and section is not None:
+                    sections[section] = (first, len(offsets))
+                    section = None
+                offsets.append(pos)
+                ends.append(nxt)
+                linenos.append(lineno)
+            pos = nxt + 1
+        if section is not None:
+            sections[section] = (first, len(offsets))
+        self._offsets = offsets
+        self._ends    = ends
+        self._linenos = linenos
+        self.sections = sections
+
+    def close( self ):
+        """Closes the memory-mapped file."""
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *args ):
+        self.close()
+
+    def __len__( self ):
+        return len(self._offsets)
+
+    def __getitem__( self, idx ):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("line index out of range")
+        line = self._map[self._offsets[idx]:self._ends[idx]]
+        return line.rstrip('\r\n')
+
+    def __iter__( self ):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def numbered( self ):
+        """
+        Generates the (line number, line) pairs of the lines, where line
+        numbers are the numbers of the lines in the file (empty lines
+        included, starting at 1).
+        """
+        for idx in range(len(self)):
+            yield self._linenos[idx], self[idx]
+
+    def row_index( self, start, end ):
+        """
+        Returns the index {first value of the row: line index} of the rows
+        of the section given by 'start' and 'end' (see :func:`section_span`),
+        e.g., the rows of scale factors by ScalID. If the same value is found
+        more than once, the first row is indexed. The index is built when
+        first needed, from the first value of the rows only.
+        """
+        if (start, end) not in self._rows:
+            rows = {}
+            first, last = section_span( self, start, end )
+            for idx in range(first, last):
+                line = self[idx].lstrip()
+                if line[0] == COMMENT:
+                    continue
+                rows.setdefault(int(line.split(None, 1)[0]), idx)
+            self._rows[(start, end)] = rows
+        return self._rows[(start, end)]
 
 #-----------------------------------------------------------------------------
 # HEMCO I/O functions
@@ -32,6 +434,69 @@ def find_substr_index( strings, substring ):
         raise ValueError(msg)
     return idx[0]
 
+def index_sections( cfg_lines ):
+    """
+    Returns the line spans of all sections found in a list of strings, in
+    a single pass through the list. Spans are given as a dictionary
+    {section name: (first, last)} where first is the index of the first line
+    after 'BEGIN SECTION <name>' and last is the index of the matching
+    'END SECTION <name>' line (or the number of lines if the section is not
+    closed). Raises an error if a section is defined more than once.
+    """
+    sections = {}
+    opened = {}
+    for i, line in enumerate(cfg_lines):
+        line = line.strip()
+        if line.startswith(SECTION_BEGIN):
+            name = line[len(SECTION_BEGIN):].strip()
+            if name in sections or name in opened:
+                msg = "Section " + name + " is defined more than once!"
+                raise ValueError(msg)
+            opened[name] = i+1
+        elif line.startswith(SECTION_END):
+            name = line[len(SECTION_END):].strip()
+            if name in opened:
+                sections[name] = (opened.pop(name), i)
+    for name, first in opened.items():
+        sections[name] = (first, len(cfg_lines))
+    return sections
+
+def _section_index( cfg_lines, sections=None ):
+    """
+    Returns the section index of cfg_lines: 'sections' if given, the index
+    of random-access readers (see :class:`ConfigFile`), or the index built by
+    :func:`index_sections` in a single pass through the lines. Functions
+    that look up several sections get the index once and pass it to
+    :func:`section_span`.
+    """
+    if sections is None:
+        sections = getattr(cfg_lines, 'sections', None)
+    if sections is None:
+        sections = index_sections( cfg_lines )
+    return sections
+
+def section_span( cfg_lines, start, end, sections=None ):
+    """
+    Returns the span (first, last) of the lines between the line that contains
+    'start' and the next line that contains 'end'. If a section index (as
+    returned by :func:`index_sections`) is given and 'start' matches one of
+    its sections, the span is taken from the index instead of scanning
+    cfg_lines. Random-access readers (see :class:`ConfigFile`) provide their
+    own section index.
+    """
+    if sections is None:
+        sections = getattr(cfg_lines, 'sections', None)
+    if sections is not None and start.startswith(SECTION_BEGIN):
+        name = start[len(SECTION_BEGIN):].strip()
+        if name in sections:
+            return sections[name]
+
+    idx = find_substr_index( cfg_lines, start) + 1
+    last = idx
+    while last < len(cfg_lines) and end not in cfg_lines[last]:
+        last = last+1
+    return idx, last
+
 def config_line_split( line, expLen=0, sep=' ' ):
     """
     Wrapper function to split line 'line' of the configuration file into substrings.
@@ -51,10 +516,410 @@ def config_line_split( line, expLen=0, sep=' ' ):
             raise ValueError(msg)       
     return spl
 
-def read_config_file( filename, description='' ):
+def setting_event( spl, lineno=None, line=None ):
+    """
+    Returns a :class:`SettingEvent` from the substrings 'spl' of a line of
+    the settings section.
+    """
+    dctname = spl[0].strip(':')
+    dctval  = spl[1]
+    
+    # autodetect true/false
+    if dctval.lower()=='true':
+        dctval=True
+    elif dctval.lower()=='false':
+        dctval=False
+    
+    return SettingEvent(lineno, line, dctname, dctval)
+
+def base_field_event( spl, prev_src, lineno=None, line=None,
+                      section='BASE EMISSIONS' ):
+    """
+    Returns a :class:`BaseFieldEvent` from the substrings 'spl' of a line of
+    the base emissions (or extension data) section. 'prev_src' is a
+    dictionary holding the file information of the previous field of each
+    extension, used (and updated) to resolve empty file names (-).
+    """
+    eid     = int(spl[0])
+    fldname = str(spl[1])
+    modspc  = str(spl[7])
+    
+    # Get file name. Use previous value if empty file name (-) is provided.
+    if str(spl[2]) != "-":
+        srcfile = str(spl[2])
+        srcvar  = str(spl[3])
+        srctime = str(spl[4])
+        srcdim  = str(spl[5])
+        srcunit = str(spl[6])
+    elif eid in prev_src:
+        srcfile, srcvar, srctime, srcdim, srcunit = prev_src[eid]
+    else:
+        msg = "Line " + str(line) + " has no file information to refer to!"
+        raise ValueError(msg)
+    
+    if str(spl[8]) == "-":
+        scalIDs = []
+    else:
+        scalIDs = [int(x) for x in spl[8].split('/')]
+    cat     = int(spl[9])
+    hier    = int(spl[10])
+    
+    # eventually extract scale factors from file
+    if srcvar == "-":
+        data = [float(x) for x in srcfile.split('/')]
+        srcfile = '-'
+    else:
+        data = []
+        
+    # default srctime:
+    if srctime == "-":
+        srctime = "*/*/*/*"
+    
+    prev_src[eid] = (srcfile, srcvar, srctime, srcdim, srcunit)
+    
+    return BaseFieldEvent(lineno, line, section, eid, fldname, srcfile,
+                          srcvar, srctime, srcdim, srcunit, modspc, scalIDs,
+                          cat, hier, data)
+
+def scale_factor_event( spl, isMask=False, lineno=None, line=None ):
+    """
+    Returns a :class:`ScaleFactorEvent` (or a :class:`MaskEvent` if isMask is
+    True) from the substrings 'spl' of a line of the scale factors (or
+    masks) section.
+    """
+    
+    # extract values
+    thisID  = int(spl[0])
+    fldname = spl[1]
+    srcfile = str(spl[2])
+    srcvar  = str(spl[3])
+    srctime = str(spl[4])
+    srcdim  = str(spl[5])
+    srcunit = str(spl[6])
+    oper    = str(spl[7])
+     
+    # mask fields must have 4 scale factors = mask regions
+    if isMask:
+        mask_window = [float(x) for x in spl[8].split('/')]
+        if len(mask_window) != 4:
+            msg = 'Illegal mask field windows: '+fldname+' ('+str(mask_window)+')'
+            raise ValueError(msg)
+                
+    # eventually extract scale factors from file
+    if srcvar == "-":
+        scalfactors = [float(x) for x in srcfile.split('/')]
+        srcfile = '-'
+    else:
+        scalfactors = []
+    
+    # default srctime:
+    if srctime == "-":
+        srctime = "*/*/*/*"
+    
+    if isMask:
+        return MaskEvent(lineno, line, thisID, fldname, srcfile, srcvar,
+                         srctime, srcdim, srcunit, oper, scalfactors,
+                         mask_window)
+    else:
+        return ScaleFactorEvent(lineno, line, thisID, fldname, srcfile, srcvar,
+                                srctime, srcdim, srcunit, oper, scalfactors)
+
+def ext_switch_event( spl, lineno=None, line=None ):
+    """
+    Returns a :class:`ExtSwitchEvent` from the substrings 'spl' of a line of
+    the extension switches section (split at ':').
+    """
+    spl0 = spl[0].split()
+    spl1 = spl[1].split()
+    ExtNr   = int(spl0[0])
+    ExtName = str(spl0[1])
+    onoff   = str(spl1[0])
+    species = spl1[1].split('/')
+    
+    return ExtSwitchEvent(lineno, line, ExtNr, ExtName,
+                          onoff.lower()=='on', species)
+
+def base_field_from_event( event ):
+    """
+    Returns a new base emission field (:class:`GCField` object) from a
+    :class:`BaseFieldEvent`. Scale factors are not linked to the field.
+    """
+    basefld = pyhemco.emissions.GCField(event.name,
+                                        filename=event.srcfile,
+                                        var_name=event.srcvar,
+                                        unit=event.srcunit,
+                                        ndim=event.srcdim,
+                                        data=event.data )        
+    pyhemco.emissions.base_emission_field(basefld, basefld.name, event.srctime, 
+                                          event.species, event.category,
+                                          event.hierarchy)
+    return basefld
+
+def scale_factor_from_event( event ):
+    """
+    Returns a new scale factor or mask (:class:`GCField` object) from a
+    :class:`ScaleFactorEvent` or a :class:`MaskEvent`.
+    """
+    scalfld = pyhemco.emissions.GCField(event.name,
+                                        filename=event.srcfile,
+                                        var_name=event.srcvar,
+                                        unit=event.srcunit,
+                                        ndim=event.srcdim,
+                                        data=event.data )
+    
+    if isinstance(event, MaskEvent):
+        pyhemco.emissions.mask(scalfld, scalfld.name, event.srctime,
+                               mask_window=event.mask_window, fid=event.fid)
+    else:
+        pyhemco.emissions.scale_factor(scalfld, scalfld.name, event.srctime,
+                                       operator=event.operator, fid=event.fid)
+    return scalfld
+
+def scale_factor_from_line( spl, isMask=False ):
+    """
+    Returns a GCField of the scale factor (or mask) defined by the substrings
+    'spl' of a line of the scale factors (or masks) section, as returned by
+    :func:`config_line_split`.
+    """
+    return scale_factor_from_event( scale_factor_event( spl, isMask=isMask ) )
+
+def _numbered_lines( lines, start=1 ):
+    """
+    Returns an iterator over the (line number, line) pairs of the given
+    lines. Random-access readers (see :class:`ConfigFile`) give their own
+    line numbers.
+    """
+    numbered = getattr(lines, 'numbered', None)
+    if numbered is not None:
+        return numbered()
+    return enumerate(lines, start)
+
+def iter_config_lines( lines, start=1 ):
+    """
+    Generates events from the lines of a HEMCO configuration file, one line
+    at a time.
+
+    Parameters
+    ----------
+    lines : iterable
+        Lines of the configuration file, or :class:`ConfigFile` object.
+    start : [integer]
+        Line number of the first line (not used for :class:`ConfigFile`
+        objects, which give the line numbers of their lines).
+
+    Returns
+    ----------
+    Iterator over :class:`SettingEvent`, :class:`BaseFieldEvent` (either
+    from the base emissions or the extension data section, see the 'section'
+    attribute), :class:`ScaleFactorEvent`, :class:`MaskEvent`,
+    :class:`ExtSwitchEvent` and :class:`ExtSettingEvent` objects, in the
+    order they are found in the file.
+
+    See Also
+    ----------
+    :func:`iter_config`
+    """
+    section  = None
+    prev_src = {}
+    eid      = None
+    
+    for lineno, line in _numbered_lines( lines, start ):
+        line = line.rstrip('\n')
+        sline = line.strip()
+        
+        # skip empty lines and detect section limits
+        if not sline:
+            continue
+        if sline.startswith(SECTION_BEGIN):
+            section  = sline[len(SECTION_BEGIN):].strip()
+            prev_src = {}
+            continue
+        if sline.startswith(SECTION_END):
+            section = None
+            continue
+        if section is None or line[0] == COMMENT:
+            continue
+        
+        if section == 'SETTINGS':
+            spl = config_line_split( line, sep=':', expLen=2 )
+            yield setting_event( spl, lineno, line )
+        
+        elif section in ('BASE EMISSIONS', 'EXTENSION DATA'):
+            spl = config_line_split( line, expLen=11 )
+            yield base_field_event( spl, prev_src, lineno, line, section )
+        
+        elif section == 'SCALE FACTORS':
+            spl = config_line_split( line, expLen=8 )
+            yield scale_factor_event( spl, False, lineno, line )
+        
+        elif section == 'MASKS':
+            spl = config_line_split( line, expLen=9 )
+            yield scale_factor_event( spl, True, lineno, line )
+        
+        elif section == 'EXTENSION SWITCHES':
+            spl = config_line_split( line, sep=':', expLen=2 )
+            if EXTSETTING_PREFIX in spl[0]:
+                if eid is None:
+                    msg = "Line " + line + " does not follow an extension switch!"
+                    raise ValueError(msg)
+                key = spl[0].split(EXTSETTING_PREFIX)[1]
+                yield ExtSettingEvent(lineno, line, eid, key, spl[1])
+            else:
+                event = ext_switch_event( spl, lineno, line )
+                eid = event.eid
+                yield event
+
+def iter_config( filename ):
+    """
+    Generates events from the HEMCO configuration file 'filename', reading
+    the file one line at a time (see :func:`iter_config_lines`).
+
+    The file is not loaded in memory, so that the iteration can be stopped
+    as soon as the information of interest is found, e.g., to get the files
+    needed by species NO:
+    
+    >>> [e.srcfile for e in iter_config(filename)
+    ...  if isinstance(e, BaseFieldEvent) and e.species == 'NO']
+    """
+    with open( filename ) as cfg_file:
+        for event in iter_config_lines( cfg_file ):
+            yield event
+
+def build_emissions( events, description='', read_all=True, source=None,
+                     row_filter=None ):
+    """
+    Creates an emissions setup from configuration file events.
+    
+    Parameters
+    ----------
+    events : iterable
+        Events, as generated by :func:`iter_config`.
+    description : (string)
+        Setup description
+    read_all : [boolean]
+        If True, reads all extensions data. Otherwise, reads only enabled
+        extensions.
+    source : :class:`ConfigSource` object
+        (optional) Records the rows of the events and the objects created
+        from them. Set as the 'config_source' of the setup.
+    row_filter : callable
+        (optional) Predicate on base field events (e.g., a :class:`RowFilter`
+        object). Fields are created only for the events that satisfy it.
+
+    Returns
+    ----------
+    emis_setup : :class:`Emissions` object.
+        Emissions setup object
+    """
+    
+    # create blank setup
+    emis_setup = pyhemco.emissions.Emissions( [], description=description )
+    emis_setup.config_source = source
+    
+    # create core extension. This one is needed by all setups.
+    core_ext = pyhemco.emissions.EmissionExt('Core', eid=0, enabled=True)
+    emis_setup.extensions.add(core_ext)
+    
+    # extensions whose base emissions need to be read, by extension id
+    read_exts = {}
+    pending_fields = {}
+    
+    # scale factors and masks are defined after the base emissions: link
+    # them to the base fields once all events are read.
+    scal_events = {}
+    scal_rows = {}
+    links = []
+    
+    counts = {}
+    row = None
+    
+    for event in events:
+        
+        if source is not None:
+            row = source.add( event, counts )
+        
+        if isinstance(event, SettingEvent):
+            core_ext.settings.update({event.name: event.value})
+        
+        elif isinstance(event, BaseFieldEvent):
+            if event.section == 'BASE EMISSIONS':
+                if event.eid != core_ext.eid:
+                    continue
+                thisext = core_ext
+            else:
+                thisext = read_exts.get(event.eid)
+            if row_filter is not None and not row_filter(event):
+                continue
+            if thisext is None:
+                # extension switch may not be read yet
+                pending_fields.setdefault(event.eid, []).append((event, row))
+                continue
+            basefld = base_field_from_event( event )
+            thisext.base_emission_fields.add(basefld)
+            links.append((basefld, event.scalIDs))
+            if row is not None:
+                row.obj = basefld
+        
+        elif isinstance(event, ScaleFactorEvent):
+            if not isinstance(scal_events.get(event.fid), ScaleFactorEvent):
+                scal_events[event.fid] = event
+                scal_rows[event.fid] = row
+        
+        elif isinstance(event, MaskEvent):
+            if event.fid not in scal_events:
+                scal_events[event.fid] = event
+                scal_rows[event.fid] = row
+        
+        elif isinstance(event, ExtSwitchEvent):
+            thisext = pyhemco.emissions.EmissionExt(event.name,
+                                                    enabled=event.enabled,
+                                                    eid=event.eid,
+                                                    species=event.species)
+            emis_setup.extensions.add(thisext)
+            if row is not None:
+                row.obj = thisext
+            if read_all or event.enabled:
+                read_exts[event.eid] = thisext
+                for field_event, field_row in pending_fields.pop(event.eid, []):
+                    basefld = base_field_from_event( field_event )
+                    thisext.base_emission_fields.add(basefld)
+                    links.append((basefld, field_event.scalIDs))
+                    if field_row is not None:
+                        field_row.obj = basefld
+        
+        elif isinstance(event, ExtSettingEvent):
+            thisext = read_exts.get(event.eid)
+            if thisext is not None:
+                thisext.addSetting(event.name, event.value)
+    
+    # link each scalID with the base fields
+    scal_table = {}
+    for basefld, scalIDs in links:
+        for thisID in scalIDs:
+            scalfield = scal_table.get(thisID)
+            if scalfield is None:
+                if thisID not in scal_events:
+                    msg='Cannot get scale factor with ID ' + str(thisID)
+                    raise ValueError(msg) 
+                scalfield = scale_factor_from_event( scal_events[thisID] )
+                scal_table[thisID] = scalfield
+                if scal_rows[thisID] is not None:
+                    scal_rows[thisID].obj = scalfield
+            basefld.emission_scale_factors.add(scalfield)
+    
+    # state of the objects as read, to detect changes (see update_config_file)
+    if source is not None:
+        for row in source.rows.values():
+            row.state = row_state( row )
+    
+    return emis_setup
+
+def read_config_file( filename, description='', read_all=True,
+                      row_filter=None ):
     """
     Reads emissions information from file 'filename' and saves it into an 
-    emissions class object ('emis_setup').
+    emissions class object ('emis_setup'). The file is memory-mapped (see
+    :class:`ConfigFile`) and parsed by :func:`iter_config_lines`.
     
     Parameters
     ----------
@@ -62,37 +927,581 @@ def read_config_file( filename, description='' ):
         File name (full path) of HEMCO configuration file
     description : (string)
         Setup description
+    read_all : [boolean]
+        If True, reads all extensions data. Otherwise, reads only enabled
+        extensions.
+    row_filter : callable
+        (optional) Predicate on base field events, e.g., a
+        :class:`RowFilter` object. Rows that don't satisfy it are skipped
+        before any field is created.
 
     Returns
     ----------
     emis_setup : :class:`Emissions` object.
         Emissions setup object
 
+    See Also
+    ----------
+    :func:`iter_config`
+    :func:`build_emissions`
+    :func:`reload_config_file`
+    :class:`ConfigFile`
+    :class:`RowFilter`
+
     History
     ----------
     20140217 ckeller: Initial version    
     """
+    source = ConfigSource( filename, read_all=read_all, row_filter=row_filter )
+    with ConfigFile( filename ) as cfg_file:
+        source.index( cfg_file )
+        return build_emissions( iter_config_lines( cfg_file ),
+                                description=description, read_all=read_all,
+                                source=source, row_filter=row_filter )
+
+def _source_info( event ):
+    """Returns the file information (and scalar data) of a field event."""
+    return (event.srcfile, event.srcvar, event.srcdim, event.srcunit,
+            tuple(event.data))
+
+def _patch_field( field, new_field, reset_data ):
+    """
+    Updates the metadata of field (in place) with the metadata of new_field.
+    The file information and data are updated only if reset_data is True.
+    Scale factors of base fields are not updated.
+    """
+    field.name = new_field.name
+    if reset_data:
+        field.filename = new_field.filename
+        field.var_name = new_field.var_name
+        field.ndim     = new_field.ndim
+        field.unit     = new_field.unit
+        field.data     = new_field.data
     
-    # create blank setup
-    emis_setup = pyhemco.emissions.Emissions( [], description=description )
+    if field.is_base():
+        e_attr = field.attributes[pyhemco.emissions.BEF_ATTR_NAME]
+        for k, v in new_field.attributes[pyhemco.emissions.BEF_ATTR_NAME].items():
+            if k != 'scale_factors':
+                e_attr[k] = v
+    else:
+        field.attributes[pyhemco.emissions.SF_ATTR_NAME] = \
+            new_field.attributes[pyhemco.emissions.SF_ATTR_NAME]
+
+def _link_scale_factors( basefld, scalIDs, scal_rows ):
+    """
+    (Re)links the scale factors scalIDs to the base field basefld, creating
+    the scale factors from their rows if needed.
+    """
+    scal_fields = basefld.emission_scale_factors
+    if len(scal_fields):
+        scal_fields.get_all().remove()
+    for thisID in scalIDs:
+        row = scal_rows[thisID]
+        if row.obj is None:
+            row.obj = scale_factor_from_event( row.event )
+        scal_fields.add(row.obj)
+
+def _remove_field( emis_setup, field ):
+    """Removes the base field 'field' from the extensions of emis_setup."""
+    for ext in emis_setup.extensions:
+        ext.base_emission_fields.filter(lambda fld: fld is field).remove()
+
+def reload_config_file( emis_setup, filename=None ):
+    """
+    Updates an emissions setup that has been read by :func:`read_config_file`
+    with the current content of its configuration file. 
     
-    # open file
-    cfg_lines = [line.rstrip('\n') for line in open(filename) if line.strip()]
+    Only the sections whose content has changed are parsed, and only the
+    rows that have changed in these sections are applied to the setup:
+    fields and extensions are updated in place, added or removed. Other
+    fields and extensions (including their data) are not modified, and
+    objects that have been added to the setup after it was read are kept.
     
-    # create core extension. This one is needed by all setups.
-    core_ext = pyhemco.emissions.EmissionExt('Core', eid=0, enabled=True)
-        
-    # read settings. Write them into settings section of core_ext.
-    read_settings( core_ext.settings, cfg_lines )
+    Parameters
+    ----------
+    emis_setup : :class:`Emissions` object.
+        Emissions setup object (as returned by :func:`read_config_file`)
+    filename : (string)
+        (optional) File name (full path) of HEMCO configuration file. Default
+        is the file from which the setup has been read.
+
+    Returns
+    ----------
+    changes : [dictionary]
+        Keys of the 'added', 'modified' and 'removed' rows (see
+        :class:`ConfigSource`).
+    """
+    old = emis_setup.config_source
+    if old is None:
+        raise ValueError("Emissions setup has not been read from a file!")
+    filename = filename or old.filename
     
-    # read core emissions (and corresponding scale factors)
-    emis_setup.extensions.add(core_ext)
-    read_base_emissions( emis_setup, cfg_lines, core_ext )
+    # index sections and compare them to the previous ones
+    source = ConfigSource( filename, read_all=old.read_all,
+                           row_filter=old.row_filter )
+    with open( filename ) as cfg_file:
+        lines = source.track( cfg_file )
     
-    # read extensions (and corresponding data & scale factors)
-    read_extensions( emis_setup, cfg_lines, read_all=True)
+    changed_sections = []
+    for section, (begin, end, digest) in source.sections.items():
+        old_span = old.sections.get(section)
+        if old_span is not None and old_span[2] == digest:
+            # unchanged section: keep rows, only shift line numbers
+            shift = begin - old_span[0]
+            for key, row in old.section_rows(section):
+                event = row.event._replace(lineno=row.event.lineno + shift)
+                source.rows[key] = SourceRow(event, row.obj, row.state)
+        else:
+            changed_sections.append(section)
+            counts = {}
+            for event in iter_config_lines( lines[begin-1:end], start=begin ):
+                key = row_key( event, counts )
+                row = SourceRow( event._replace(line=None) )
+                if key in old.rows:
+                    row.obj = old.rows[key].obj
+                source.rows[key] = row
     
-    return emis_setup
+    added    = [key for key in source.rows if key not in old.rows]
+    removed  = [key for key in old.rows if key not in source.rows]
+    modified = [key for key in source.rows if key in old.rows and 
+                source.rows[key].values != old.rows[key].values]
+    changes  = {'added': added, 'modified': modified, 'removed': removed}
+    changed  = set(added + modified)
+    
+    # scale factors and masks (scale factors have precedence), by ScalID 
+    scal_rows = {}
+    for key, row in source.section_rows('MASKS') + source.section_rows('SCALE FACTORS'):
+        if key[2] == 0:
+            scal_rows[key[1]] = row
+    old_scal_rows = {}
+    for key, row in old.section_rows('MASKS') + old.section_rows('SCALE FACTORS'):
+        if key[2] == 0:
+            old_scal_rows[key[1]] = row
+    
+    # check scale factors before applying any change
+    for key, row in source.rows.items():
+        if isinstance(row.event, BaseFieldEvent):
+            for thisID in row.event.scalIDs:
+                if thisID not in scal_rows:
+                    msg='Cannot get scale factor with ID ' + str(thisID)
+                    raise ValueError(msg) 
+    
+    # scale factors and masks are patched in place
+    for thisID, row in scal_rows.items():
+        old_row = old_scal_rows.get(thisID)
+        if old_row is None or old_row.obj is None:
+            continue
+        row.obj = old_row.obj
+        if row.values != old_row.values or type(row.event) != type(old_row.event):
+            reset_data = _source_info(row.event) != _source_info(old_row.event)
+            _patch_field( row.obj, scale_factor_from_event( row.event ),
+                          reset_data )
+    
+    # settings
+    core_ext = emis_setup.extensions.get_object(eid=0)
+    for key in removed:
+        if key[0] == 'SETTINGS' and key[2] == 0:
+            core_ext.settings.pop(key[1], None)
+    for key, row in source.section_rows('SETTINGS'):
+        if key in changed:
+            core_ext.settings.update({row.event.name: row.event.value})
+    
+    # extension switches and settings
+    for key in removed:
+        obj = old.rows[key].obj
+        if key[0] == 'EXTENSION SWITCHES' and obj is not None:
+            emis_setup.extensions.filter(lambda ext: ext is obj).remove()
+    read_exts = {core_ext.eid: core_ext}
+    for key, row in source.section_rows('EXTENSION SWITCHES'):
+        event = row.event
+        if isinstance(event, ExtSwitchEvent):
+            if row.obj is None:
+                row.obj = pyhemco.emissions.EmissionExt(event.name,
+                                                        enabled=event.enabled,
+                                                        eid=event.eid,
+                                                        species=event.species)
+                emis_setup.extensions.add(row.obj)
+            elif key in changed:
+                row.obj.name    = event.name
+                row.obj.enabled = event.enabled
+                row.obj.eid     = event.eid
+                row.obj.species = event.species
+            if source.read_all or event.enabled:
+                read_exts.setdefault(event.eid, row.obj)
+        elif key in changed and event.eid in read_exts:
+            read_exts[event.eid].addSetting(event.name, event.value)
+    for key in removed:
+        if key[0] == 'EXTENSION SWITCHES' and isinstance(key[1], tuple):
+            ext_row = source.rows.get(('EXTENSION SWITCHES', key[1][0], 0))
+            if ext_row is not None and ext_row.obj is not None:
+                ext_row.obj.settings.pop(key[1][1], None)
+    
+    # base fields
+    for key in removed:
+        obj = old.rows[key].obj
+        if key[0] in ('BASE EMISSIONS', 'EXTENSION DATA') and obj is not None:
+            _remove_field( emis_setup, obj )
+    for section in ('BASE EMISSIONS', 'EXTENSION DATA'):
+        prev_fields = {}
+        for key, row in source.section_rows(section):
+            event = row.event
+            if section == 'BASE EMISSIONS' and event.eid != core_ext.eid:
+                continue
+            thisext = read_exts.get(event.eid)
+            if thisext is None or (source.row_filter is not None and
+                                   not source.row_filter(event)):
+                # row is not read (anymore)
+                if row.obj is not None:
+                    _remove_field( emis_setup, row.obj )
+                    row.obj = None
+                continue
+            fields = thisext.base_emission_fields
+            if row.obj is None:
+                row.obj = base_field_from_event( event )
+                prev = prev_fields.get(event.eid)
+                if prev is None:
+                    index = 0
+                else:
+                    index = fields.filter(lambda field: field is prev).index()[0] + 1
+                fields.add(row.obj, index=index)
+                _link_scale_factors( row.obj, event.scalIDs, scal_rows )
+            elif key in changed:
+                reset_data = _source_info(event) != \
+                             _source_info(old.rows[key].event)
+                _patch_field( row.obj, base_field_from_event( event ),
+                              reset_data )
+                _link_scale_factors( row.obj, event.scalIDs, scal_rows )
+            prev_fields[event.eid] = row.obj
+    
+    # objects of the changed rows now match the file
+    for section in changed_sections + ['SCALE FACTORS', 'MASKS']:
+        for key, row in source.section_rows(section):
+            row.state = row_state( row )
+    
+    emis_setup.config_source = source
+    return changes
+
+def _base_field_row( event ):
+    """
+    Returns the row (without '-' file information) of a 
+    :class:`BaseFieldEvent`.
+    """
+    srcfile = event.srcfile
+    srcvar  = event.srcvar
+    srctime = event.srctime
+    if srcfile == '-':
+        srcfile = '/'.join([str(i) for i in event.data])
+        srctime = '-'
+    if event.scalIDs:
+        scalIDs = '/'.join([str(i) for i in event.scalIDs])
+    else:
+        scalIDs = '-'
+    return ' '.join([str(event.eid), event.name, srcfile, srcvar, srctime,
+                     event.srcdim, event.srcunit, event.species, scalIDs,
+                     str(event.category), str(event.hierarchy)])
+
+def _row_event( section, text, lineno, eid=None ):
+    """
+    Returns the event of the row 'text' of section 'section'. eid is the
+    extension of extension settings rows.
+    """
+    text = text.rstrip('\r\n')
+    if section == 'SETTINGS':
+        return setting_event( config_line_split( text, sep=':', expLen=2 ),
+                              lineno )
+    elif section in ('BASE EMISSIONS', 'EXTENSION DATA'):
+        return base_field_event( config_line_split( text, expLen=11 ), {},
+                                 lineno, section=section )
+    elif section == 'SCALE FACTORS':
+        return scale_factor_event( config_line_split( text, expLen=8 ),
+                                   False, lineno )
+    elif section == 'MASKS':
+        return scale_factor_event( config_line_split( text, expLen=9 ),
+                                   True, lineno )
+    spl = config_line_split( text, sep=':', expLen=2 )
+    if EXTSETTING_PREFIX in spl[0]:
+        key = spl[0].split(EXTSETTING_PREFIX)[1]
+        return ExtSettingEvent(lineno, None, eid, key, spl[1])
+    return ext_switch_event( spl, lineno )
+
+def update_config_file( emis_setup, filename=None, style='HEMCO' ):
+    """
+    Writes an emissions setup that has been read by :func:`read_config_file`
+    into its configuration file, by rewriting only the rows of the objects
+    that have been added, removed or modified since the setup was read (or
+    last saved by this function). 
+    
+    All other lines (including comments, blank lines and rows of objects
+    that have not been read, see :func:`read_config_file`) are copied
+    verbatim, and only the changed rows are formatted. Modified rows are
+    written in place. New rows are written after the row of the previous
+    field of the same extension, or at the end of their section. Rows that 
+    use the file information of a previous row (-) are written with their
+    own file information if the previous row has changed. The file is 
+    replaced at once (the new content is written into a temporary file that
+    is then renamed).
+    
+    Parameters
+    ----------
+    emis_setup : :class:`Emissions` object.
+        Emissions setup object (as returned by :func:`read_config_file`)
+    filename : (string)
+        (optional) File name (full path) of the file to write. Default is
+        the file from which the setup has been read.
+    style : (string)
+        file type. Only 'HEMCO' is supported.
+
+    Returns
+    ----------
+    changes : [dictionary]
+        Keys of the 'added', 'modified' and 'removed' rows (see
+        :class:`ConfigSource`).
+
+    See Also
+    ----------
+    :func:`write_config_file`
+        Write the whole setup.
+    """
+    source = emis_setup.config_source
+    if source is None:
+        raise ValueError("Emissions setup has not been read from a file!")
+    filename = os.path.abspath(filename or source.filename)
+    
+    # read the source file and check that it has not changed since it was read
+    check = ConfigSource( source.filename )
+    with open( source.filename ) as cfg_file:
+        lines = check.track( cfg_file )
+    if check.sections != source.sections:
+        msg = "File " + source.filename + " has changed since it was read!"
+        raise ValueError(msg)
+    
+    def section_anchor( section ):
+        # last non-empty line before the end of the section
+        if section not in source.sections:
+            msg = "No section " + section + " in " + source.filename + \
+                  ": the whole setup must be written"
+            raise ValueError(msg)
+        begin, end, _ = source.sections[section]
+        lineno = end - 1
+        while lineno > begin and not lines[lineno-1].strip():
+            lineno -= 1
+        return lineno
+    
+    # changed rows: {line number: row text} of modified rows, line numbers
+    # of removed rows and {line number: [(section, row text, object)]} of
+    # the rows to insert after a line.
+    replaced = {}
+    removed  = set()
+    inserted = {}
+    
+    def insert( lineno, section, text, obj=None ):
+        inserted.setdefault(lineno, []).append((section, text, obj))
+    
+    # settings
+    core_ext = emis_setup.extensions.get_object(eid=0)
+    names = set()
+    for key, row in source.section_rows('SETTINGS'):
+        name, lineno = row.event.name, row.event.lineno
+        names.add(name)
+        if name not in core_ext.settings:
+            removed.add(lineno)
+        elif str(core_ext.settings[name]) != row.state:
+            replaced[lineno] = str(name)+': '+str(core_ext.settings[name])
+    for k, v in core_ext.settings.items():
+        if k not in names:
+            insert( section_anchor('SETTINGS'), 'SETTINGS', str(k)+': '+str(v) )
+    
+    # extension switches and settings
+    exts = [ext for ext in emis_setup.extensions if ext.eid != 0]
+    ext_ids = set(id(ext) for ext in exts)
+    
+    def switch_row( ext ):
+        onoff = 'on' if ext.enabled else 'off'
+        return ' '.join([str(ext.eid), str(ext.name), ' :', onoff, 
+                         '/'.join(ext.species)])
+    
+    def setting_row( k, v ):
+        return '   '+EXTSETTING_PREFIX+str(k)+': '+str(v)
+    
+    ext_ends = {}
+    ext, ext_read, names = None, False, set()
+    for key, row in source.section_rows('EXTENSION SWITCHES') + [(None, None)]:
+        if row is None or isinstance(row.event, ExtSwitchEvent):
+            # new settings of the previous extension
+            if ext is not None and ext_read and id(ext) in ext_ids:
+                for k, v in ext.settings.items():
+                    if k not in names:
+                        insert( ext_ends[id(ext)], 'EXTENSION SWITCHES', 
+                                setting_row(k, v) )
+            if row is None:
+                break
+            ext, names = row.obj, set()
+            ext_read = source.read_all or row.event.enabled
+            lineno = row.event.lineno
+            ext_ends[id(ext)] = lineno
+            if id(ext) not in ext_ids:
+                removed.add(lineno)
+            elif ext_state(ext) != row.state:
+                replaced[lineno] = switch_row(ext)
+        else:
+            lineno = row.event.lineno
+            name = row.event.name
+            ext_ends[id(ext)] = lineno
+            names.add(name)
+            if id(ext) not in ext_ids:
+                removed.add(lineno)
+            elif not ext_read:
+                continue
+            elif name not in ext.settings:
+                removed.add(lineno)
+            elif str(ext.settings[name]) != row.state:
+                replaced[lineno] = setting_row(name, ext.settings[name])
+    for ext in exts:
+        if id(ext) not in ext_ends:
+            anchor = section_anchor('EXTENSION SWITCHES')
+            insert( anchor, 'EXTENSION SWITCHES', switch_row(ext), ext )
+            for k, v in ext.settings.items():
+                insert( anchor, 'EXTENSION SWITCHES', setting_row(k, v) )
+    
+    # base fields
+    for section, section_exts in (('BASE EMISSIONS', [core_ext]),
+                                  ('EXTENSION DATA', exts)):
+        current = {}
+        for ext in section_exts:
+            for field in ext.base_emission_fields:
+                current[id(field)] = ext
+        kept = {}
+        for key, row in source.section_rows(section):
+            if row.obj is None:
+                continue
+            lineno = row.event.lineno
+            ext = current.get(id(row.obj))
+            if ext is None or ext.eid != row.event.eid:
+                removed.add(lineno)
+                continue
+            kept[id(row.obj)] = lineno
+            if field_state(row.obj) != row.state:
+                replaced[lineno] = field2str( row.obj, style, ext )
+        for ext in section_exts:
+            anchor = None
+            for field in ext.base_emission_fields:
+                if id(field) in kept:
+                    anchor = kept[id(field)]
+                    continue
+                if anchor is None:
+                    anchor = section_anchor(section)
+                insert( anchor, section, field2str( field, style, ext ), field )
+    
+    # scale factors and masks
+    scal_fields = sorted_scale_factors( emis_setup )
+    current = dict((id(scal), scal) for scal in scal_fields)
+    kept = set()
+    for section in ('SCALE FACTORS', 'MASKS'):
+        for key, row in source.section_rows(section):
+            if row.obj is None:
+                continue
+            lineno = row.event.lineno
+            scal = current.get(id(row.obj))
+            if scal is None or scal.is_mask() != (section == 'MASKS'):
+                removed.add(lineno)
+                continue
+            kept.add(id(scal))
+            if field_state(scal) != row.state:
+                replaced[lineno] = field2str( scal, style )
+    for scal in scal_fields:
+        if id(scal) not in kept:
+            section = 'MASKS' if scal.is_mask() else 'SCALE FACTORS'
+            insert( section_anchor(section), section, field2str( scal, style ),
+                    scal )
+    
+    if not (replaced or removed or inserted) and filename == source.filename:
+        return {'added': [], 'modified': [], 'removed': []}
+    
+    # new content: [text, section, source row, object, kind of change]
+    rows_by_lineno = dict((row.event.lineno, row) for row in source.rows.values())
+    out = []
+    section = None
+    for lineno, line in enumerate(lines, 1):
+        sline = line.strip()
+        if sline.startswith(SECTION_BEGIN):
+            section = sline[len(SECTION_BEGIN):].strip()
+        elif sline.startswith(SECTION_END):
+            section = None
+        row = rows_by_lineno.get(lineno)
+        obj = row and row.obj
+        if lineno in replaced:
+            out.append([replaced[lineno]+'\n', section, row, obj, 'modified'])
+        elif lineno not in removed:
+            out.append([line, section, row, obj, None])
+        for isection, text, obj in inserted.get(lineno, []):
+            if not out[-1][0].endswith('\n'):
+                out[-1][0] += '\n'
+            out.append([text+'\n', isection, None, obj, 'added'])
+    
+    # rows that use the file information of a previous row which has changed
+    prev_src = {}
+    for entry in out:
+        text, section, row, obj, kind = entry
+        if section not in ('BASE EMISSIONS', 'EXTENSION DATA'):
+            prev_src = {}
+            continue
+        if kind is None:
+            if row is None:
+                continue
+            event = row.event
+            src = (event.srcfile, event.srcvar, event.srctime, event.srcdim,
+                   event.srcunit)
+            spl = config_line_split( text.rstrip('\r\n'), expLen=11 )
+            if spl[2] == '-' and prev_src.get(event.eid) != src:
+                entry[0] = _base_field_row( event ) + '\n'
+                entry[4] = 'fixed'
+        else:
+            event = _row_event( section, text, None )
+            src = (event.srcfile, event.srcvar, event.srctime, event.srcdim,
+                   event.srcunit)
+        prev_src[event.eid] = src
+    
+    # write into a temporary file, then replace the file
+    fd, tmp_name = tempfile.mkstemp( dir=os.path.dirname(filename), 
+                                     prefix='.'+os.path.basename(filename) )
+    try:
+        with os.fdopen( fd, 'w' ) as outfile:
+            outfile.write(''.join([entry[0] for entry in out]))
+        if os.path.exists( filename ):
+            shutil.copymode( filename, tmp_name )
+        os.rename( tmp_name, filename )
+    except:
+        if os.path.exists( tmp_name ):
+            os.remove( tmp_name )
+        raise
+    
+    # new source: shift the rows, parse and record the changed rows
+    new_source = ConfigSource( filename, read_all=source.read_all,
+                               row_filter=source.row_filter )
+    new_source.index( [entry[0] for entry in out] )
+    old_keys = dict((row.event.lineno, key) for key, row in source.rows.items())
+    changes = {'added': [], 'modified': [], 
+               'removed': [old_keys[lineno] for lineno in sorted(removed)]}
+    counts = {}
+    eid = None
+    for lineno, (text, section, row, obj, kind) in enumerate(out, 1):
+        if kind is None:
+            if row is None:
+                continue
+            row = SourceRow( row.event._replace(lineno=lineno), obj, row.state )
+        else:
+            event = _row_event( section, text, lineno, eid )
+            row = SourceRow( event, obj )
+            row.state = row_state( row )
+        if isinstance(row.event, ExtSwitchEvent):
+            eid = row.event.eid
+        key = row_key( row.event, counts )
+        new_source.rows[key] = row
+        if kind in changes:
+            changes[kind].append(key)
+    
+    emis_setup.config_source = new_source
+    return changes
 
 def write_config_file( emis_setup, filename, style='HEMCO' ):
     """
@@ -115,24 +1524,38 @@ def write_config_file( emis_setup, filename, style='HEMCO' ):
     TODO: Add ESMF writing capability.
     """
     
+    # scale factors and masks, sorted by ScalID, are computed only once
+    # for all sections.
+    scal_fields = sorted_scale_factors( emis_setup )
+    
     # open file
     outfile = open( filename, 'w' )
-    outfile.write('### HEMCO INPUT FILE ###\n')
-    outfile.write(' \n')
+    outfile.write('### HEMCO INPUT FILE ###\n \n')
         
-    # write file
+    # write file (each section is written at once)
     write_settings( emis_setup, outfile, style )
     write_base_emissions ( emis_setup, outfile, style )
-    write_scale_factors ( emis_setup, outfile, style )
-    write_masks ( emis_setup, outfile, style )
+    write_scale_factors ( emis_setup, outfile, style, scal_fields )
+    write_masks ( emis_setup, outfile, style, scal_fields )
     write_extensions( emis_setup, outfile, style )
     
     # close file
     outfile.write('### END OF HEMCO INPUT FILE ###\n')
     outfile.close()
 
+def _section_events( cfg_lines, section, start, end, sections=None ):
+    """
+    Generates the events of the lines between the line that contains 'start'
+    and the next line that contains 'end' (see :func:`section_span`), parsed
+    by :func:`iter_config_lines` as rows of the section 'section'.
+    """
+    first, last = section_span( cfg_lines, start, end, sections )
+    lines = [SECTION_BEGIN + section] + list( cfg_lines[first:last] )
+    return iter_config_lines( lines, start=first )
+
 def read_settings( settings, cfg_lines, 
-                   start="BEGIN SECTION SETTINGS", end="END SECTION SETTINGS" ):
+                   start="BEGIN SECTION SETTINGS", end="END SECTION SETTINGS",
+                   sections=None ):
     """
     Extracts the emission settings from cfg_lines and saves them into  
     the passed dictionary (settings).
@@ -142,58 +1565,31 @@ def read_settings( settings, cfg_lines,
     settings : [dictionary] 
         Dictionary where all the settings will be passed to.
     cfg_lines : [character]
-        List of configuration file lines
+        List of configuration file lines, or :class:`ConfigFile` object
     start : [character]
         Start scanning file from this line
     end : [character]
         Scan file up to this line
+    sections : [dictionary]
+        (optional) Section spans of cfg_lines, as returned by
+        :func:`index_sections`.
+
+    See Also
+    ----------
+    :func:`read_config_file`
+        Read the whole file.
 
     History
     ----------
     20140217 ckeller: Initial version    
     """    
-     
-    # identify start of settings section 
-    idx = find_substr_index( cfg_lines, start)
-    eof = len(cfg_lines)-1
-    
-    # read settings and add to emis_setup until end of settings reached. 
-    idx = idx+1
-    while True:
-
-        # exit loop?
-        if idx > eof:
-            break
-        if end in cfg_lines[idx]:
-            break        
- 
-        # split line
-        spl = config_line_split( cfg_lines[idx], sep=':', expLen=2)
-        
-        # empty list = this line is a comment
-        if len(spl) == 0:
-            idx=idx+1
-            continue
-            
-        # now extract values
-        dctname = spl[0].strip(':')
-        dctval  = spl[1]
-        
-        # autodetect true/false
-        if dctval.lower()=='true':
-            dctval=True
-        elif dctval.lower()=='false':
-            dctval=False
-        
-        # add to settings.
-        settings.update({dctname: dctval})
-        
-        # increase index
-        idx = idx+1
+    for event in _section_events( cfg_lines, 'SETTINGS', start, end,
+                                  sections ):
+        settings.update({event.name: event.value})
 
 def read_base_emissions( emis_setup, cfg_lines, extension,
                          start="BEGIN SECTION BASE EMISSIONS", end="END SECTION BASE EMISSIONS",
-                         read_all=True ):
+                         read_all=True, sections=None, scal_table=None ):
     """
     Extracts the base emissions from cfg_lines and saves them into  
     emissions class object ('emis_setup'). If an extension is given, only the base
@@ -207,124 +1603,75 @@ def read_base_emissions( emis_setup, cfg_lines, extension,
     emis_setup : :class:`Emissions` object.
         The emissions setup object (to be created & filled).
     cfg_lines : [character]
-        List of configuration file lines
+        List of configuration file lines, or :class:`ConfigFile` object
     start : [character]
         Start scanning file from this line
     end : [character]
         Scan file up to this line
-    extension: :class:`EmissionExt` object
-        Only read fields belonging to this extension
+    extension: :class:`EmissionExt` object or [:class:`EmissionExt` objects]
+        Only read fields belonging to this extension. If a list of extensions
+        is given, each field is dispatched to the extension it belongs to
+        within a single pass through the section.
     read_all : bool
         If False, reads only fields whose extension ID and species name match
         the extension entries.
+    sections : [dictionary]
+        (optional) Section spans of cfg_lines, as returned by
+        :func:`index_sections`.
+    scal_table : [dictionary]
+        (optional) Scale factors and masks by ScalID, as returned by
+        :func:`read_scale_factors`.
+
+    See Also
+    ----------
+    :func:`read_config_file`
+        Read the whole file.
 
     History
     ----------
     20140217 ckeller: Initial version    
     """   
     
-    # identify start of settings section 
-    idx = find_substr_index( cfg_lines, start)
-    eof = len(cfg_lines)-1
+    # scale factors and masks, by ScalID
+    if scal_table is None:
+        sections   = _section_index( cfg_lines, sections )
+        scal_table = read_scale_factors( cfg_lines, sections=sections )
     
-    # read settings and add to emis_setup until end of settings reached. 
-    idx = idx+1
-    while True:
-        
-        # exit loop?
-        if idx > eof:
-            break
-        if end in cfg_lines[idx]:
-            break        
-        
-        # split line
-        spl = config_line_split( cfg_lines[idx], expLen=11 )
-        
-        # empty list = this line is a comment
-        if len(spl) == 0:
-            idx=idx+1
-            continue
-         
-        # extract extension id, container name, and species ID
-        eid     = int(spl[0])
-        fldname = str(spl[1])
-        modspc  = str(spl[7])
+    # extensions that the fields may belong to, by extension id
+    if isinstance(extension, pyhemco.emissions.EmissionExt):
+        extensions = {extension.eid: extension}
+    else:
+        extensions = dict((ext.eid, ext) for ext in extension)
+    
+    for event in _section_events( cfg_lines, 'BASE EMISSIONS', start, end,
+                                  sections ):
         
         # Only consider data if it has the correct ExtNr and species ID!
-        if eid != extension.eid: 
-            idx=idx+1
+        thisext = extensions.get(event.eid)
+        if thisext is None:
             continue
-        if modspc not in extension.species and not read_all:
-            idx=idx+1
+        if event.species not in thisext.species and not read_all:
             continue        
         
-        # Get file name. Use previous value if empty file name (-) is provided.
-        if str(spl[2]) != "-":
-          srcfile = str(spl[2])
-          srcvar  = str(spl[3])
-          srctime = str(spl[4])
-          srcdim  = str(spl[5])
-          srcunit = str(spl[6])
-        
-        if str(spl[8]) == "-":
-            scalIDs = []
-        else:
-            scalIDs = [int(x) for x in spl[8].split('/')]
-        cat     = spl[9]
-        hier    = spl[10]
-        
-        # eventually extract scale factors from file
-        if srcvar == "-":
-            data = [float(x) for x in srcfile.split('/')]
-            srcfile = '-'
-        else:
-            data = []
-            
-        # default srctime:
-        if srctime == "-":
-            srctime = "*/*/*/*"
-                    
-        # add field information, incl. metadata and scale factor ids
-        basefld = pyhemco.emissions.GCField(fldname,
-                                            filename=srcfile,
-                                            var_name=srcvar,
-                                            unit=srcunit,
-                                            ndim=srcdim,
-                                            data=data )        
-        pyhemco.emissions.base_emission_field(basefld, basefld.name, srctime, 
-                                              modspc, cat, hier)
-
         # add to the setup 
-        extension.base_emission_fields.add(basefld)
+        basefld = base_field_from_event( event )
+        thisext.base_emission_fields.add(basefld)
                 
-        # add/link scale factors scalIDs
-        fids = emis_setup.get_scalIDs()
-        
-        # link each scalID with the base field
-        for thisID in scalIDs:    
-
-            # eventually read scale factor
-            if thisID not in fids:
-                scalfield = get_scale_factor ( cfg_lines, scalID=thisID )
-                
-                if scalfield is None:
-                    scalfield = get_scale_factor ( cfg_lines, scalID=thisID, start="BEGIN SECTION MASKS", 
-                                                   end="END SECTION MASKS", isMask=True )
-                    
-                if scalfield is None:
-                    msg='Cannot get scale factor with ID ' + str(thisID)
-                    raise ValueError(msg) 
-            else:                
-                filter_scal = lambda field: field.attributes[pyhemco.emissions.SF_ATTR_NAME]['fid'] == thisID
-                scalfield = emis_setup.scale_factors.filter(filter_scal).get_object()
-            
+        # link each scalID with the base field. Already registered scale
+        # factors take precedence over the ones defined in cfg_lines.
+        for thisID in event.scalIDs:    
+            try:
+                scalfield = emis_setup.get_scale_factor(thisID)
+            except KeyError:
+                scalfield = scal_table.get(thisID)
+            if scalfield is None:
+                msg='Cannot get scale factor with ID ' + str(thisID)
+                raise ValueError(msg) 
             basefld.emission_scale_factors.add(scalfield)
-            
-        # increase line index
-        idx = idx+1
         
 def get_scale_factor( cfg_lines, scalID, start="BEGIN SECTION SCALE FACTORS", 
-                      end="END SECTION SCALE FACTORS", isMask=False ):
+                      end="END SECTION SCALE FACTORS", isMask=False, sections=None,
+                      scal_table=None ):
     """
     Returns a GCField of the scale factor with scale factor ID scalID. All scale
     factor information are extracted from cfg_lines.
@@ -332,104 +1679,102 @@ def get_scale_factor( cfg_lines, scalID, start="BEGIN SECTION SCALE FACTORS",
     Parameters
     ----------
     cfg_lines : [character]
-        List of configuration file lines
+        List of configuration file lines, or :class:`ConfigFile` object
+        (the row is then looked up by ScalID, see
+        :meth:`ConfigFile.row_index`).
     scalID: [integer]
         scale factor ID of interest
+    start : [character]
+        Start scanning file from this line
+    end : [character]
+        Scan file up to this line
+    isMask : [boolean]
+        If True, the rows between start and end are masks.
+    sections : [dictionary]
+        (optional) Section spans of cfg_lines, as returned by
+        :func:`index_sections`.
+    scal_table : [dictionary]
+        (optional) Scale factors and masks by ScalID, as returned by
+        :func:`read_scale_factors`. The scale factor is then looked up in
+        the table (cfg_lines, start, end and sections are not used).
 
     Returns
     ----------
-    scalfld : :class:`GCField` object.
+    scalfld : :class:`GCField` object, or None if there is no such scale
+        factor.
+
+    See Also
+    ----------
+    :func:`read_scale_factors`
+        Read all scale factors and masks at once.
 
     History
     ----------
     20140217 ckeller: Initial version    
     """   
     
-    scalfld = None
-     
-    # identify start of settings section
-    eof = len(cfg_lines)-1
-    idx = find_substr_index( cfg_lines, start)
+    if scal_table is not None:
+        scalfld = scal_table.get( scalID )
+        if scalfld is None or scalfld.is_mask() != isMask:
+            return None
+        return scalfld
     
-    # read settings and add to emis_setup until end of settings reached. 
-    idx = idx+1
-    while True:
-        
-        # exit loop?
-        if idx > eof:
-            break
-        if end in cfg_lines[idx]:
-            break        
-        
-        # split line
-        if isMask:
-            expLen=9
-        else:
-            expLen=8
+    if isMask:
+        section = 'MASKS'
+        expLen  = 9
+    else:
+        section = 'SCALE FACTORS'
+        expLen  = 8
+     
+    # random-access readers locate the row directly
+    if hasattr( cfg_lines, 'row_index' ):
+        idx = cfg_lines.row_index( start, end ).get( scalID )
+        if idx is None:
+            return None
         spl = config_line_split( cfg_lines[idx], expLen=expLen )
-        
-        # empty list = this line is a comment
-        if len(spl) == 0:
-            idx=idx+1
-            continue
- 
-        # get scale factor ID
-        thisID = int(spl[0])
- 
-        # skip if this scale factor ID is not used
-        if scalID != thisID:
-            idx=idx+1
-            continue
- 
-        # extract values
-        fldname = spl[1]
-        srcfile = str(spl[2])
-        srcvar  = str(spl[3])
-        srctime = str(spl[4])
-        srcdim  = str(spl[5])
-        srcunit = str(spl[6])
-        oper    = str(spl[7])
-         
-        # mask fields must have 4 scale factors = mask regions
-        if isMask:
-            mask_window = [float(x) for x in spl[8].split('/')]
-            scalfactors = []
-            if len(mask_window) != 4:
-                msg = 'Illegal mask field windows: '+fldname+' ('+str(mask_window)+')'
-                raise ValueError(msg)
-                    
-        # eventually extract scale factors from file
-        if srcvar == "-":
-            scalfactors = [float(x) for x in srcfile.split('/')]
-            srcfile = '-'
-        else:
-            scalfactors = []
-        
-        # default srctime:
-        if srctime == "-":
-            srctime = "*/*/*/*"
-        
-        # add field information, incl. metadata
-        scalfld = pyhemco.emissions.GCField(fldname,
-                                            filename=srcfile,
-                                            var_name=srcvar,
-                                            unit=srcunit,
-                                            ndim=srcdim,
-                                            data=scalfactors )
-        
-        if isMask:
-            pyhemco.emissions.mask(scalfld, scalfld.name, srctime, mask_window=mask_window, fid=thisID)
-        else:
-            pyhemco.emissions.scale_factor(scalfld, scalfld.name, srctime, operator=oper, fid=thisID)
-        
-        # stop here if scalID is defined
-        break
+        return scale_factor_from_line( spl, isMask=isMask )
     
-    return scalfld
+    for event in _section_events( cfg_lines, section, start, end, sections ):
+        if event.fid == scalID:
+            return scale_factor_from_event( event )
+    
+    return None
 
+def read_scale_factors( cfg_lines, sections=None ):
+    """
+    Reads all scale factors and masks from cfg_lines at once.
+    
+    Parameters
+    ----------
+    cfg_lines : [character]
+        List of configuration file lines, or :class:`ConfigFile` object
+    sections : [dictionary]
+        (optional) Section spans of cfg_lines, as returned by
+        :func:`index_sections`.
+
+    Returns
+    ----------
+    scal_table : [dictionary]
+        {ScalID: :class:`GCField` object} lookup table of all scale factors
+        and masks. If the same ScalID is used more than once, the first
+        scale factor is used, and scale factors have precedence over masks.
+    """
+    
+    scal_table = {}
+    sections   = _section_index( cfg_lines, sections )
+    
+    for section in ('SCALE FACTORS', 'MASKS'):
+        for event in _section_events( cfg_lines, section,
+                                      SECTION_BEGIN + section,
+                                      SECTION_END + section, sections ):
+            if event.fid not in scal_table:
+                scal_table[event.fid] = scale_factor_from_event( event )
+    
+    return scal_table
 
 def read_extensions( emis_setup, cfg_lines, start="BEGIN SECTION EXTENSION SWITCHES", 
-                     end="END SECTION EXTENSION SWITCHES", read_all=False ):
+                     end="END SECTION EXTENSION SWITCHES", read_all=False, sections=None,
+                     scal_table=None ):
     """
     Extracts the HEMCO extension switches from cfg_lines and registers the base 
     emission fields of all enabled extensions.
@@ -439,81 +1784,80 @@ def read_extensions( emis_setup, cfg_lines, start="BEGIN SECTION EXTENSION SWITC
     emis_setup : :class:`Emissions` object.
         The emissions setup object (to be created & filled).
     cfg_lines : [character]
-        List of configuration file lines.
+        List of configuration file lines, or :class:`ConfigFile` object
     start : [character]
         Start scanning file from this line
     end : [character]
         Scan file up to this line
     read_all : [boolean]
         If True, reads all extensions data. Otherwise, reads only enabled extensions.
+    sections : [dictionary]
+        (optional) Section spans of cfg_lines, as returned by
+        :func:`index_sections`.
+    scal_table : [dictionary]
+        (optional) Scale factors and masks by ScalID, as returned by
+        :func:`read_scale_factors`.
+
+    See Also
+    ----------
+    :func:`read_config_file`
+        Read the whole file.
 
     History
     ----------
     20140217 ckeller: Initial version
     """   
-    # identify start of settings section 
-    idx = find_substr_index( cfg_lines, start)
-    eof = len(cfg_lines)-1
+    # extensions whose base emissions need to be read
+    read_exts = []
+    thisext   = None
+    sections  = _section_index( cfg_lines, sections )
     
-    # read settings and add to emis_setup until end of settings reached. 
-    idx = idx+1
-    while True:
+    for event in _section_events( cfg_lines, 'EXTENSION SWITCHES', start, end,
+                                  sections ):
         
-        # exit loop?
-        if idx > eof:
-            break
-        if end in cfg_lines[idx]:
-            break        
-        
-        # split line
-        spl = config_line_split( cfg_lines[idx], sep=':', expLen=2 )
-        
-        # empty list = this line is a comment
-        if len(spl) == 0:
-            idx=idx+1
-            continue
-        
-        # check for extension setting. Strip everything before (and including) the arrow
-        if (EXTSETTING_PREFIX in spl[0]):
-            if read_all or ExtUse:
-                key = spl[0].split(EXTSETTING_PREFIX)[1]
-                thisext.addSetting(key,spl[1])   
-            idx = idx+1
+        # extension setting of the previous extension
+        if isinstance(event, ExtSettingEvent):
+            if read_all or thisext.enabled:
+                thisext.addSetting(event.name, event.value)
             continue
         
-        # extract values
-        spl0 = spl[0].split()
-        spl1 = spl[1].split()
-        ExtNr   = int(spl0[0])
-        ExtName = str(spl0[1])
-        onoff   = str(spl1[0])
-        species = spl1[1].split('/')
-            
-        if onoff.lower()=='on':
-            ExtUse=True
-        else:
-            ExtUse=False
-                
         # create extension and add to emission setup
-        thisext = pyhemco.emissions.EmissionExt(ExtName, enabled=ExtUse, eid=ExtNr, species=species)
+        thisext = pyhemco.emissions.EmissionExt(event.name, enabled=event.enabled,
+                                                eid=event.eid, species=event.species)
         emis_setup.extensions.add(thisext)
                
-        # now read all base emissions belonging to this extension
-        if read_all or ExtUse:
-            read_base_emissions( emis_setup, cfg_lines, start="BEGIN SECTION EXTENSION DATA", 
-                                 end="END SECTION EXTENSION DATA", extension=thisext, read_all=read_all )
-        # increase line index
-        idx = idx+1
+        # base emissions belonging to this extension will be read below
+        if read_all or thisext.enabled:
+            read_exts.append(thisext)
+    
+    # now read all base emissions belonging to these extensions, in one pass
+    if read_exts:
+        read_base_emissions( emis_setup, cfg_lines, start="BEGIN SECTION EXTENSION DATA", 
+                             end="END SECTION EXTENSION DATA", extension=read_exts, 
+                             read_all=read_all, sections=sections, scal_table=scal_table )
+
+def section_header( section ):
+    """Returns the lines that start the section 'section'."""
+    return '\n' + SEPARATOR + '\n' + SECTION_BEGIN + section + '\n' + \
+        SEPARATOR + '\n'
+
+def section_footer( section ):
+    """Returns the lines that end the section 'section'."""
+    return '\n' + SECTION_END + section + '\n'
 
 def add_header( outfile, section ):
-    outfile.write('\n')
-    outfile.write(SEPARATOR+'\n')
-    outfile.write('BEGIN SECTION '+section+'\n')
-    outfile.write(SEPARATOR+'\n')
+    outfile.write(section_header( section ))
  
 def add_footer( outfile, section ):
-    outfile.write('\n')
-    outfile.write('END SECTION '+section+'\n') 
+    outfile.write(section_footer( section ))
+
+def sorted_scale_factors( emis_setup ):
+    """
+    Returns the list of the scale factors and masks of emis_setup, sorted by
+    ScalID (scale factors with the same ScalID are kept in the order of 
+    :attr:`Emissions.scale_factors`).
+    """
+    return sorted(emis_setup.scale_factors, key=lambda scal: scal.attributes[pyhemco.emissions.SF_ATTR_NAME]['fid'])
 
 def field2file( field, outfile, emis_setup, style, extension=None, 
                 prevFile=None, prevVar=None, prevTime=None ):
@@ -539,11 +1883,26 @@ def field2file( field, outfile, emis_setup, style, extension=None,
          (name, variable, time, unit, dimension) are set to invalid
          value (-). This causes HEMCO to use the same file data object
          for all fields.
+
+    See Also
+    ----------
+    :func:`field2str`
+
     History
     ----------
     20140224 ckeller: Initial version
     20140517 ckeller: Added previous file attributes  
     """
+    outfile.write(field2str( field, style, extension, prevFile, prevVar,
+                             prevTime ) + '\n')
+
+def field2str( field, style, extension=None, 
+               prevFile=None, prevVar=None, prevTime=None ):
+    """
+    Returns the configuration file row (without line break) of a GCField
+    object (field). See :func:`field2file` for a description of the 
+    parameters.
+    """
     
     # base field or scale field?
     if pyhemco.emissions.BEF_ATTR_NAME in field.attributes.keys():
@@ -619,9 +1978,8 @@ def field2file( field, outfile, emis_setup, style, extension=None,
         if 'mask_window' in attrs.keys():
             data = '/'.join(str(i) for i in attrs['mask_window'])
             fldstr = ' '.join([fldstr, data])
-                                
-    # write to file
-    outfile.write(fldstr+'\n')
+    
+    return fldstr
         
             
 def write_settings( emis_setup, outfile, style ):
@@ -643,13 +2001,14 @@ def write_settings( emis_setup, outfile, style ):
     20140224 ckeller: Initial version    
     """
     
-    add_header( outfile, 'SETTINGS')
     core_ext = emis_setup.extensions.get_object(name='Core')
     
+    lines = [section_header( 'SETTINGS' )]
     for k, v in core_ext.settings.items():
-        outfile.write(str(k)+': '+str(v)+'\n')
-        
-    add_footer( outfile, 'SETTINGS')  
+        lines.append(str(k)+': '+str(v)+'\n')
+    lines.append(section_footer( 'SETTINGS' ))
+    
+    outfile.write(''.join(lines))
 
 def write_base_emissions( emis_setup, outfile, style ):
     """
@@ -670,23 +2029,24 @@ def write_base_emissions( emis_setup, outfile, style ):
     20140224 ckeller: Initial version    
     """
     
-    add_header( outfile, 'BASE EMISSIONS')
-    outfile.write('# ExtNr Name sourceFile sourceVar sourceTime SrcDim SrcUnit Species ScalIDs Cat Hier\n')
+    lines = [section_header( 'BASE EMISSIONS' )]
+    lines.append('# ExtNr Name sourceFile sourceVar sourceTime SrcDim SrcUnit Species ScalIDs Cat Hier')
      
     core_ext = emis_setup.extensions.get_object(name='Core')
     prevFile = ''
     prevVar  = ''
     prevTime = ''
     for iField in core_ext.base_emission_fields:
-        field2file( iField, outfile, emis_setup, style, core_ext, prevFile, prevVar, prevTime )
+        lines.append(field2str( iField, style, core_ext, prevFile, prevVar, prevTime ))
         prevFile = str(iField.filename)
         prevVar  = str(iField.var_name)
         prevTime = str(iField.attributes[pyhemco.emissions.BEF_ATTR_NAME]['timestamp'])
-        
-    add_footer( outfile, 'BASE EMISSIONS')  
+    lines.append(section_footer( 'BASE EMISSIONS' ))
+    
+    outfile.write(lines[0] + '\n'.join(lines[1:-1]) + '\n' + lines[-1])
 
 
-def write_scale_factors( emis_setup, outfile, style ):
+def write_scale_factors( emis_setup, outfile, style, scal_fields=None ):
     """
     Write scale factor information into a configuration file.
     
@@ -699,23 +2059,28 @@ def write_scale_factors( emis_setup, outfile, style ):
     style : (string)
         file type. 'HEMCO' for a HEMCO-style file, 'ESMF' for 
         an ESMF-style file.
+    scal_fields : 
+        (optional) Scale factors and masks of emis_setup sorted by ScalID, 
+        as returned by :func:`sorted_scale_factors`.
 
     History
     ----------
     20140224 ckeller: Initial version    
     """
+    if scal_fields is None:
+        scal_fields = sorted_scale_factors( emis_setup )
     
-    add_header( outfile, 'SCALE FACTORS')
-    outfile.write('# ScalID Name sourceFile sourceVar sourceTime SrcDim SrcUnit Oper Scalar\n')
-    
-    for iField in emis_setup.scale_factors.sorted(key=lambda scal: scal.attributes[pyhemco.emissions.SF_ATTR_NAME]['fid']):
+    lines = [section_header( 'SCALE FACTORS' )]
+    lines.append('# ScalID Name sourceFile sourceVar sourceTime SrcDim SrcUnit Oper Scalar')
+    for iField in scal_fields:
         if not iField.is_mask():
-            field2file( iField, outfile, emis_setup, style )
-        
-    add_footer( outfile, 'SCALE FACTORS')  
+            lines.append(field2str( iField, style ))
+    lines.append(section_footer( 'SCALE FACTORS' ))
+    
+    outfile.write(lines[0] + '\n'.join(lines[1:-1]) + '\n' + lines[-1])
 
 
-def write_masks( emis_setup, outfile, style ):
+def write_masks( emis_setup, outfile, style, scal_fields=None ):
     """
     Write mask information into a configuration file.
     
@@ -728,20 +2093,25 @@ def write_masks( emis_setup, outfile, style ):
     style : (string)
         file type. 'HEMCO' for a HEMCO-style file, 'ESMF' for 
         an ESMF-style file.
+    scal_fields : 
+        (optional) Scale factors and masks of emis_setup sorted by ScalID, 
+        as returned by :func:`sorted_scale_factors`.
 
     History
     ----------
     20140224 ckeller: Initial version    
     """
+    if scal_fields is None:
+        scal_fields = sorted_scale_factors( emis_setup )
     
-    add_header( outfile, 'MASKS')
-    outfile.write('# ScalID Name sourceFile sourceVar sourceTime SrcDim SrcUnit Oper Lon1/Lat1/Lon2/Lat2\n')
-    
-    for iField in emis_setup.scale_factors.sorted(key=lambda scal: scal.attributes[pyhemco.emissions.SF_ATTR_NAME]['fid']):
+    lines = [section_header( 'MASKS' )]
+    lines.append('# ScalID Name sourceFile sourceVar sourceTime SrcDim SrcUnit Oper Lon1/Lat1/Lon2/Lat2')
+    for iField in scal_fields:
         if iField.is_mask():
-            field2file( iField, outfile, emis_setup, style )
-        
-    add_footer( outfile, 'MASKS')  
+            lines.append(field2str( iField, style ))
+    lines.append(section_footer( 'MASKS' ))
+    
+    outfile.write(lines[0] + '\n'.join(lines[1:-1]) + '\n' + lines[-1])
 
 
 def write_extensions( emis_setup, outfile, style ):
@@ -764,8 +2134,8 @@ def write_extensions( emis_setup, outfile, style ):
     """
     
     # Extension switches
-    add_header( outfile, 'EXTENSION SWITCHES')
-    outfile.write('# ExtNr ExtName     on/off Species\n')
+    lines = [section_header( 'EXTENSION SWITCHES' )]
+    lines.append('# ExtNr ExtName     on/off Species')
     for iExt in emis_setup.extensions:
         # skip core extension: all settings already added to sections settings.
         if iExt.eid == 0: 
@@ -776,21 +2146,23 @@ def write_extensions( emis_setup, outfile, style ):
             onoff='off'
         species = '/'.join(iExt.species)
         fldstr = ' '.join([str(iExt.eid), str(iExt.name), ' :', onoff, species])
-        outfile.write(fldstr+'\n')
+        lines.append(fldstr)
         for k, v in iExt.settings.items():
-            outfile.write('   '+EXTSETTING_PREFIX+str(k)+': '+str(v)+'\n')        
-    add_footer( outfile, 'EXTENSION SWITCHES')  
+            lines.append('   '+EXTSETTING_PREFIX+str(k)+': '+str(v))
+    lines.append(section_footer( 'EXTENSION SWITCHES' ))
+    outfile.write(lines[0] + '\n'.join(lines[1:-1]) + '\n' + lines[-1])
 
     # Extension data
-    add_header( outfile, 'EXTENSION DATA')
-    outfile.write('# ExtNr Name sourceFile sourceVar sourceTime SrcDim SrcUnit Species ScalIDs Cat Hier\n')
+    lines = [section_header( 'EXTENSION DATA' )]
+    lines.append('# ExtNr Name sourceFile sourceVar sourceTime SrcDim SrcUnit Species ScalIDs Cat Hier')
     for iExt in emis_setup.extensions:
         # skip core extension: all fields already added to section base emissions.
         if iExt.eid == 0:
             continue
         for iField in iExt.base_emission_fields:
-            field2file( iField, outfile, emis_setup, style, iExt )       
-    add_footer( outfile, 'EXTENSION DATA')      
+            lines.append(field2str( iField, style, iExt ))
+    lines.append(section_footer( 'EXTENSION DATA' ))
+    outfile.write(lines[0] + '\n'.join(lines[1:-1]) + '\n' + lines[-1])
       
 def strlist_to_fields(raw_vals, fields_spec, none_val=None):
     """
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pyhemco import cache
+from pyhemco import emissions
+
+
+EXAMPLE_CONFIG = os.path.join(os.path.dirname(__file__), os.pardir,
+                              os.pardir, 'examples', 'HEMCO_Config')
+
+def load_lines(filename):
+    with open(filename) as f:
+        return {'lines': f.read().splitlines(), 'loaded': time.time()}
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.filename = os.path.join(self.tmpdir, 'config')
+        self.write('line 1\nline 2\n')
+
+    def write(self, content):
+        with open(self.filename, 'w') as f:
+            f.write(content)
+
+    def test_get_put(self):
+        self.assertIsNone(cache.get(self.filename, cache_dir=self.cache_dir))
+        obj = load_lines(self.filename)
+        cache.put(self.filename, obj, cache_dir=self.cache_dir)
+        self.assertEqual(cache.get(self.filename, cache_dir=self.cache_dir),
+                         obj)
+
+        # any change in the file invalidates the entry
+        self.write('line 1\nline 3\n')
+        self.assertIsNone(cache.get(self.filename, cache_dir=self.cache_dir))
+
+    def test_load(self):
+        obj1 = cache.load(self.filename, load_lines, cache_dir=self.cache_dir)
+        obj2 = cache.load(self.filename, load_lines, cache_dir=self.cache_dir)
+        self.assertEqual(obj1, obj2)
+        self.write('line 1\n')
+        obj3 = cache.load(self.filename, load_lines, cache_dir=self.cache_dir)
+        self.assertEqual(obj3['lines'], ['line 1'])
+
+    def test_evict(self):
+        filenames = []
+        for i in range(3):
+            filename = os.path.join(self.tmpdir, 'config{0}'.format(i))
+            with open(filename, 'w') as f:
+                f.write('line {0}\n'.format(i) * 1000)
+            filenames.append(filename)
+            cache.load(filename, load_lines, cache_dir=self.cache_dir)
+        entry_size = max(os.path.getsize(os.path.join(self.cache_dir, name))
+                         for name in os.listdir(self.cache_dir))
+
+        # least recently used entry (config1) is evicted first
+        for filename, atime in zip(filenames, (10, 0, 20)):
+            entry = cache._entry_path(os.path.abspath(filename),
+                                      self.cache_dir)
+            os.utime(entry, (atime, atime))
+        cache.evict(self.cache_dir, max_size=2 * entry_size)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        self.assertIsNone(cache.get(filenames[1], cache_dir=self.cache_dir))
+
+        cache.clear(self.cache_dir)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+class TestEmissionsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'HEMCO_Config')
+        shutil.copy(EXAMPLE_CONFIG, self.filename)
+
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.default_cache_dir = cache.CACHE_DIR
+        cache.CACHE_DIR = self.cache_dir
+
+        # count the files actually parsed
+        self.parsed = []
+        self.read_config_file = emissions.read_config_file
+
+        def read_config_file(filename, **kwargs):
+            self.parsed.append(filename)
+            return self.read_config_file(filename, **kwargs)
+        emissions.read_config_file = read_config_file
+
+    def test_not_used_by_default(self):
+        emissions.Emissions.load(self.filename)
+        emissions.load_emissions_file(self.filename)
+        self.assertEqual(len(self.parsed), 2)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_load(self):
+        # miss: the file is parsed and saved in the cache
+        setup1 = emissions.Emissions.load(self.filename, use_cache=True)
+        self.assertEqual(len(self.parsed), 1)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        # hit: the file is not parsed again
+        setup2 = emissions.Emissions.load(self.filename, use_cache=True)
+        self.assertEqual(len(self.parsed), 1)
+        self.assertIsNot(setup2, setup1)
+        self.assertEqual(setup2.get_extension(0).settings,
+                         setup1.get_extension(0).settings)
+        self.assertEqual(
+            [field.name for field in setup2.base_emission_fields],
+            [field.name for field in setup1.base_emission_fields])
+
+        # a filtered load has its own entry
+        emissions.Emissions.load(self.filename, use_cache=True,
+                                 species=['CO'])
+        self.assertEqual(len(self.parsed), 2)
+
+        # invalidation: any change in the file is parsed
+        with open(self.filename) as f:
+            content = f.read()
+        with open(self.filename, 'w') as f:
+            f.write(content.replace('Verbose: false', 'Verbose: true'))
+        setup3 = emissions.Emissions.load(self.filename, use_cache=True)
+        self.assertEqual(len(self.parsed), 3)
+        self.assertTrue(setup3.get_extension(0).settings['Verbose'])
+        emissions.Emissions.load(self.filename, use_cache=True)
+        self.assertEqual(len(self.parsed), 3)
+
+    def tearDown(self):
+        emissions.read_config_file = self.read_config_file
+        cache.CACHE_DIR = self.default_cache_dir
+        shutil.rmtree(self.tmpdir)
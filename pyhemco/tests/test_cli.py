@@ -0,0 +1,48 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from pyhemco import cli
+from pyhemco.tests.test_io import CONFIG
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.valid = os.path.join(self.tmpdir, 'HEMCO_Config')
+        with open(self.valid, 'w') as cfg_file:
+            cfg_file.write(CONFIG)
+        self.invalid = os.path.join(self.tmpdir, 'HEMCO_Config_invalid')
+        with open(self.invalid, 'w') as cfg_file:
+            cfg_file.write(CONFIG.replace('1/1000 1 1', '1/999 1 1'))
+
+    def test_run(self):
+        output_dir = os.path.join(self.tmpdir, 'out')
+        summary = cli.run([self.valid, self.invalid], output_dir=output_dir,
+                          jobs=2)
+        self.assertEqual((summary['n_files'], summary['n_failed']), (2, 1))
+        valid, invalid = summary['files']
+        self.assertTrue(valid['ok'])
+        self.assertEqual(sorted(valid['timings'].keys()),
+                         ['check_id', 'read', 'total', 'write'])
+        self.assertTrue(os.path.exists(valid['output']))
+        self.assertFalse(invalid['ok'])
+        self.assertIn('999', invalid['error'])
+        self.assertFalse(os.path.exists(invalid['output']))
+
+    def test_main(self):
+        summary_file = os.path.join(self.tmpdir, 'summary.json')
+        self.assertEqual(cli.main(['-j', '1', '--summary', summary_file,
+                                   self.valid]), 0)
+        with open(summary_file) as f:
+            summary = json.load(f)
+        self.assertEqual(summary['n_failed'], 0)
+        self.assertIsNone(summary['files'][0]['output'])
+        self.assertEqual(cli.main(['-j', '1', '--summary', summary_file,
+                                   self.valid, self.invalid]), 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
@@ -0,0 +1,150 @@
+import datetime
+import unittest
+
+import numpy as np
+
+from pyhemco import emissions
+from pyhemco.compute import (Grid, EmissionEngine, Compositor,
+                             apply_operator, scalar_value)
+
+
+def base_field(name, species, category, hierarchy, data, scale_factors=()):
+    field = emissions.GCField(name, 'var', 'xy', 'kg/m2/s', 'base.nc',
+                              data=data)
+    emissions.base_emission_field(field, name, '2000/1/1/0', species,
+                                  category, hierarchy,
+                                  scale_factors=list(scale_factors))
+    return field
+
+
+def scale_factor(name, data, operator='1', fid=None):
+    field = emissions.GCField(name, 'var', 'xy', 'unitless', 'scal.nc',
+                              data=data)
+    emissions.scale_factor(field, name, '2000/1/1/0', operator=operator,
+                           fid=fid)
+    return field
+
+
+def mask(name, data, mirror=False, fid=None,
+         mask_window=(-180, -90, 180, 90)):
+    field = emissions.GCField(name, 'var', 'xy', 'unitless', 'mask.nc',
+                              data=data)
+    emissions.mask(field, name, '2000/1/1/0', mask_window=list(mask_window),
+                   mirror=mirror, fid=fid)
+    return field
+
+
+class TestCompute(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = Grid.regular(60., 45.)
+        self.time = datetime.datetime(2000, 1, 2, 3)
+        self.region = np.zeros(self.grid.shape)
+        self.region[1:3, 1:3] = 1.
+
+    def test_operators(self):
+        data = np.array([0., 2., 4.])
+        out = np.ones(3)
+        apply_operator(out, data, 'div')
+        np.testing.assert_array_equal(out, [1., 0.5, 0.25])
+        apply_operator(out, data, 'square')
+        np.testing.assert_array_equal(out, [0., 2., 4.])
+        apply_operator(out, np.array([0., 0.5, 1.]), 'mirror')
+        np.testing.assert_array_equal(out, [0., 1., 0.])
+
+        self.assertEqual(scalar_value([2.], self.time), 2.)
+        self.assertEqual(scalar_value(range(24), self.time), 3)
+        self.assertEqual(scalar_value(range(7), self.time), 0)   # sunday
+        self.assertEqual(scalar_value(range(12), self.time), 0)
+        with self.assertRaises(ValueError):
+            scalar_value(range(5), self.time)
+
+    def test_compute_emissions(self):
+        shape = self.grid.shape
+        fields = [
+            base_field('GLOBAL', 'NO', 1, 1, np.ones(shape),
+                       [scale_factor('TWO', [2.], fid=1)]),
+            base_field('REGIONAL', 'NO', 1, 2, np.full(shape, 5.),
+                       [mask('REGION', self.region, fid=2)]),
+            base_field('OTHER', 'NO', 2, 1, [1.],
+                       [scale_factor('HOURLY', range(24), fid=3)]),
+            base_field('CO', 'CO', 1, 1, np.ones(shape),
+                       [mask('OUTSIDE', self.region, mirror=True, fid=4)]),
+        ]
+        setup = emissions.Emissions([emissions.EmissionExt(
+            'Core', eid=0, base_emission_fields=fields)])
+
+        result = setup.compute_emissions(self.time, self.grid)
+        self.assertEqual(list(result), ['NO', 'CO'])
+        no = result['NO'].data
+        self.assertEqual(no.shape, shape)
+        self.assertEqual(no[0, 0], 2. + 3.)
+        self.assertEqual(no[1, 1], 5. + 3.)
+        self.assertEqual(result['CO'].data[1, 1], 0.)
+        self.assertEqual(result['CO'].data[0, 0], 1.)
+
+        # output arrays are reused
+        engine = EmissionEngine(self.grid)
+        out = {'NO': np.empty(shape)}
+        result = engine.compute(setup, self.time, out=out)
+        self.assertIs(result['NO'], out['NO'])
+        self.assertIn('CO', out)
+        np.testing.assert_array_equal(out['NO'], no)
+
+    def test_data_loader(self):
+        setup = emissions.Emissions([emissions.EmissionExt(
+            'Core', eid=0,
+            base_emission_fields=[base_field('FILE', 'NO', 1, 1, None)])])
+        with self.assertRaises(ValueError):
+            setup.compute_emissions(self.time, self.grid)
+        result = setup.compute_emissions(
+            self.time, self.grid,
+            data_loader=lambda field, time: np.full(self.grid.shape, 4.))
+        self.assertEqual(result['NO'].data.sum(), 4. * self.region.size)
+
+    def test_compositor(self):
+        comp = Compositor((2, 3))
+        for hierarchy in range(1, 7):
+            values, valid = comp.add_level(hierarchy)
+            values[...] = hierarchy
+            valid[...] = False
+            valid[0, hierarchy % 3] = hierarchy > 1
+        with self.assertRaises(ValueError):
+            comp.add_level(6)
+        out = np.empty((2, 3))
+        comp.composite(out)
+        np.testing.assert_array_equal(out, [[6., 4., 5.], [0., 0., 0.]])
+        np.testing.assert_array_equal(comp.hierarchy_map(),
+                                      [[6, 4, 5], [-1, -1, -1]])
+        contributions = comp.contributions()
+        self.assertEqual(list(contributions), range(1, 7))
+        self.assertEqual(contributions[2].sum(), 0)
+        self.assertTrue(contributions[4][0, 1])
+
+        comp.reset()
+        comp.composite(out)
+        self.assertEqual(out.sum(), 0.)
+
+    def test_mask_window(self):
+        # across the date line
+        window = self.grid.window(150, -30, -150, 30)
+        self.assertEqual(window.shape, self.grid.shape)
+        np.testing.assert_array_equal(np.nonzero(window),
+                                      [[0, 0, 5, 5], [1, 2, 1, 2]])
+
+        shape = self.grid.shape
+        fields = [
+            base_field('GLOBAL', 'NO', 1, 1, np.ones(shape)),
+            base_field('REGIONAL', 'NO', 1, 5, np.full(shape, 5.),
+                       [mask('WINDOW', [1.], fid=1,
+                             mask_window=(-60, -45, 60, 45))]),
+        ]
+        setup = emissions.Emissions([emissions.EmissionExt(
+            'Core', eid=0, base_emission_fields=fields)])
+        contributions = {}
+        no = EmissionEngine(self.grid).compute(
+            setup, self.time, contributions=contributions)['NO']
+        inside = self.grid.window(-60, -45, 60, 45)
+        np.testing.assert_array_equal(no, np.where(inside, 5., 1.))
+        np.testing.assert_array_equal(contributions['NO', 1],
+                                      np.where(inside, 5, 1))
@@ -1,8 +1,10 @@
-
+import copy
+import cPickle as pickle
+import threading
 import unittest
 from collections import namedtuple
 
-from pyhemco.datatypes import ObjectCollection
+from pyhemco.datatypes import ObjectCollection, CollectionView, Query
 
 
 class TestObjectCollection(unittest.TestCase):
@@ -31,6 +33,43 @@ class TestObjectCollection(unittest.TestCase):
         self.assertEqual(col._list,
                          [self.obj1, self.obj4, self.obj2, self.obj3])
 
+    def test_add_many(self):
+        batches = []
+        col = ObjectCollection([self.obj1],
+                               fpre_many=(lambda objs: objs[:2], None),
+                               fpost_many=(batches.append, batches.append))
+        with self.assertRaises(ValueError):
+            col.add_many([self.obj2, self.obj1b])
+        with self.assertRaises(ValueError):
+            col.add_many([self.obj2, self.obj2])
+        self.assertEqual(col._list, [self.obj1])
+        col.add_many([self.obj2, self.obj3, self.obj4], index=0)
+        self.assertEqual(col._list, [self.obj2, self.obj3, self.obj1])
+        self.assertEqual(col.get(x=1).index(), [2])
+
+        col.remove_many([self.obj2, self.obj1])
+        self.assertEqual(col._list, [self.obj3])
+        with self.assertRaises(ValueError):
+            col.remove_many([self.obj3, self.obj4])
+        self.assertEqual(batches, [[self.obj1], [self.obj2, self.obj3],
+                                   [self.obj2, self.obj1]])
+
+    def test_subscribe(self):
+        events = []
+        col = ObjectCollection([self.obj1])
+        version = col.version
+        col.subscribe(lambda c, event, objs: events.append((event, objs)))
+        col.add_many([self.obj2, self.obj3])
+        col.get(x=1).remove()
+        self.assertEqual(events, [('add', [self.obj2, self.obj3]),
+                                  ('remove', [self.obj1])])
+        self.assertGreater(col.version, version)
+        self.assertEqual(col.filter(x=2).version, col.version)
+
+        version = col.version
+        col.filter(x=2)._list
+        self.assertEqual(col.version, version)
+
     def test_filter(self):
         col = ObjectCollection(self.obj_list1)
         self.assertEqual(col.filter(x=1, z='1')._list,
@@ -69,8 +108,14 @@ class TestObjectCollection(unittest.TestCase):
         self.assertEqual(col._list,
                          [self.obj4, self.obj2, self.obj1])
 
-    # def test_duplicate(self):
-    #     self.fail()
+    def test_duplicate(self):
+        col = ObjectCollection(self.obj_list1)
+        new_obj = col.get(x=1).duplicate(z='1b')
+        self.assertEqual(col._list, [self.obj1, new_obj, self.obj2,
+                                     self.obj3])
+        self.assertEqual(new_obj, self.MyObject(x=1, y=1.0, z='1b'))
+        with self.assertRaises(ValueError):
+            col.get(x=2).duplicate()
 
     def test__check_read_only(self):
         col = ObjectCollection(self.obj_list1, read_only=True)
@@ -83,10 +128,160 @@ class TestObjectCollection(unittest.TestCase):
         self.assertEqual(col.filter(lambda obj: obj.y > 1.0).index(),
                          [1, 2])
 
+    def test_contains(self):
+        col = ObjectCollection(self.obj_list1 + [self.obj4])
+        self.assertIn(self.obj1b, col)
+        col.get(x=1).remove()
+        col.get(x=3).remove()
+        self.assertNotIn(self.obj1, col)
+        self.assertIn(self.obj4, col)
+        self.assertEqual(len(col), 2)
+        self.assertEqual(col.get(x=4).index(), [1])
+        col.add(self.obj1, index=0)
+        self.assertEqual(col._list, [self.obj1, self.obj2, self.obj4])
+
     def test_sorted(self):
         col_inv = ObjectCollection([self.obj3, self.obj2, self.obj1])
         self.assertEqual(col_inv.sorted('x')._list,
                          ObjectCollection(self.obj_list1)._list)
 
+    def test_view(self):
+        col = ObjectCollection(self.obj_list1)
+        calls = []
+
+        def pred(obj):
+            calls.append(obj)
+            return obj.x > 1
+
+        view = col.filter(pred).filter(lambda obj: obj.x < 3)
+        self.assertIsInstance(view, CollectionView)
+        self.assertIs(view.ref_collection, col)
+        self.assertEqual(calls, [])
+        self.assertIs(view.get_object(), self.obj2)
+        self.assertEqual(len(calls), 3)
+
+        # the view is re-evaluated after the reference collection changed
+        col.add(self.MyObject(x=2, y=0.0, z='4'), index=0)
+        self.assertEqual(len(view), 2)
+        self.assertEqual(view.sorted('y')._list[1], self.obj2)
+        self.assertEqual(view.index(), [0, 2])
+        with self.assertRaises(ValueError):
+            view.add(self.obj4)
+        with self.assertRaises(ValueError):
+            view.add_many([self.obj4])
+        with self.assertRaises(ValueError):
+            view.extend([self.obj4])
+        with self.assertRaises(ValueError):
+            view.remove_many([self.obj1])
+        view.remove_many([self.obj2])
+        self.assertNotIn(self.obj2, col)
+        self.assertEqual(len(view), 1)
+
+        # snapshot
+        snapshot = view.copy()
+        col.add(self.MyObject(x=2, y=1.0, z='5'))
+        self.assertEqual(len(view), 2)
+        self.assertEqual(len(snapshot), 1)
+
+        for view_copy in (copy.copy(view), copy.deepcopy(view)):
+            self.assertNotIsInstance(view_copy, CollectionView)
+            self.assertEqual(view_copy._list, view._list)
+            self.assertIsNone(view_copy.ref_collection)
+        with self.assertRaises(ValueError):
+            view.set_concurrent()
+
+    def test_create_index(self):
+        col = ObjectCollection(self.obj_list1)
+        col.create_index('z')
+        self.assertEqual(col.filter(z='2')._list, [self.obj2])
+        self.assertEqual(col.filter(z='5')._list, [])
+        self.assertIs(col.get_object(z='3', x=3), self.obj3)
+
+        col.add(self.obj4, index=1)
+        self.assertEqual(col.filter(z='4')._list, [self.obj4])
+        col.get(z='1').replace(self.obj1b._replace(z='2'))
+        self.assertEqual(col.filter(z='2')._list,
+                         [self.MyObject(x=1, y=1.0, z='2'), self.obj2])
+        self.assertEqual(col.filter(z='1')._list, [])
+        col.get(x=2).remove()
+        self.assertEqual(sorted(col._indexes['z']), ['2', '3', '4'])
+
+        col.drop_index('z')
+        self.assertEqual(col.filter(z='2')._list,
+                         [self.MyObject(x=1, y=1.0, z='2')])
+
+    def test_query(self):
+        col = ObjectCollection(self.obj_list1 + [self.obj4])
+        x = Query('x')
+        self.assertEqual(col.filter(x > 2)._list, [self.obj3, self.obj4])
+        self.assertEqual(col.filter(x.between(2, 3))._list,
+                         [self.obj2, self.obj3])
+        self.assertEqual(col.filter(Query('z').isin(['1', '4']))._list,
+                         [self.obj1, self.obj4])
+
+        col.create_index('x', kind='sorted')
+        col.create_index('z')
+        col.add(self.MyObject(x=0, y=5.0, z='4'), index=2)
+        self.assertEqual(col.filter(x >= 2, x != 4)._list,
+                         [self.obj2, self.obj3])
+        self.assertEqual(col.filter(x.between(0, 3, inclusive=False))._list,
+                         [self.obj1, self.obj2])
+        self.assertEqual(col.filter(x < 2).index(), [0, 2])
+        self.assertEqual(col.filter(Query('z').isin(['1', '4']))._list,
+                         [self.obj1, self.MyObject(x=0, y=5.0, z='4'),
+                          self.obj4])
+        col.filter(x <= 1).remove()
+        self.assertEqual(col._sorted_indexes['x'].values, [2, 3, 4])
+        self.assertIs(col.get_object(x == 3), self.obj3)
+        with self.assertRaises(ValueError):
+            col.create_index('x', kind='btree')
+
+    def test_to_columns(self):
+        col = ObjectCollection(self.obj_list1)
+        columns = col.to_columns(['x', ('double', lambda obj: obj.y * 2),
+                                  ('z', 'z', int)])
+        self.assertEqual(list(columns), ['x', 'double', 'z'])
+        self.assertEqual(columns['double'].tolist(), [2.0, 4.0, 6.0])
+        self.assertEqual(columns['z'].dtype.kind, 'i')
+        mask = columns['x'] > 1
+        self.assertEqual([col[i] for i in mask.nonzero()[0]],
+                         [self.obj2, self.obj3])
+
+    def test_concurrent(self):
+        col = ObjectCollection(self.obj_list1, concurrent=True)
+        col.create_index('x', kind='sorted')
+        errors = []
+
+        def read():
+            try:
+                for i in range(200):
+                    objs = list(col)
+                    self.assertNotIn(self.obj4, objs[:3])
+                    with col.reading():
+                        self.assertEqual(col.filter(Query('x') < 4).index(),
+                                         [0, 1, 2])
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=read) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for i in range(200):
+            col.add(self.obj4)
+            col.get(x=4).remove()
+            with col.writing():
+                col.add(self.obj4, index=0)
+                col.get(x=4).remove()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(col._list, self.obj_list1)
+
+        col = ObjectCollection([1, 2], concurrent=True)
+        col = pickle.loads(pickle.dumps(col, pickle.HIGHEST_PROTOCOL))
+        with col.writing():
+            col.add(3)
+            self.assertEqual(col.get(lambda i: i > 2).index(), [2])
+
     def tearDown(self):
         pass
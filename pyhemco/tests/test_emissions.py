@@ -0,0 +1,247 @@
+import os
+import copy
+import cPickle as pickle
+import unittest
+
+import numpy as np
+
+from pyhemco import emissions
+
+
+class TestGCField(unittest.TestCase):
+
+    def setUp(self):
+        self.scal = emissions.GCField('TOTFUEL', 'NOXscalar', 'xy',
+                                      'unitless', 'scalar.nc')
+        emissions.scale_factor(self.scal, 'TOTFUEL', '1985-2008/1/1/0',
+                               operator='1', fid=1)
+        self.field = emissions.GCField('GEIA_NO', 'NO', 'xy', 'kg/m2/s',
+                                       'geia.nc')
+        emissions.base_emission_field(self.field, 'GEIA_NO', '1985/1-12/1/0',
+                                      'NO', 1, 2, scale_factors=[self.scal])
+
+    def test_slots(self):
+        self.assertFalse(hasattr(self.field, '__dict__'))
+        self.assertEqual(self.field.filepath, os.path.abspath('geia.nc'))
+        self.field.filename = 'other.nc'
+        self.assertEqual(self.field.filepath, os.path.abspath('other.nc'))
+
+        # the path is resolved when the file name is set
+        filepath = self.field.filepath
+        cwd = os.getcwd()
+        os.chdir(os.path.dirname(cwd))
+        try:
+            self.assertEqual(self.field.filepath, filepath)
+            self.assertEqual(copy.deepcopy(self.field).filepath, filepath)
+        finally:
+            os.chdir(cwd)
+        with self.assertRaises(AttributeError):
+            self.field.other_attribute = 1
+
+    def test_emission_attributes(self):
+        e_attr = self.field.attributes[emissions.BEF_ATTR_NAME]
+        self.assertEqual(e_attr['hierarchy'], 2)
+        self.assertEqual(e_attr.get('fid'), None)
+        self.assertNotIn('fid', e_attr)
+        self.assertEqual(sorted(e_attr.keys()),
+                         ['category', 'hierarchy', 'name', 'scale_factors',
+                          'species', 'timestamp'])
+        e_attr['comment'] = 'test'
+        self.assertEqual(dict(e_attr)['comment'], 'test')
+
+        sf_attr = self.scal.attributes[emissions.SF_ATTR_NAME]
+        self.assertEqual(sf_attr, {'name': 'TOTFUEL',
+                                   'timestamp': '1985-2008/1/1/0',
+                                   'operator': '1', 'fid': 1})
+        self.assertFalse(self.scal.is_mask())
+        self.assertIs(sf_attr['name'], self.scal.name)
+
+    def test_copy(self):
+        for new_field in (pickle.loads(pickle.dumps(self.field, 2)),
+                          self.field.copy(copy_data=True)):
+            self.assertEqual(new_field.name, 'GEIA_NO')
+            e_attr = new_field.attributes[emissions.BEF_ATTR_NAME]
+            self.assertEqual(e_attr['timestamp'], '1985/1-12/1/0')
+            self.assertIsInstance(e_attr, emissions.BaseEmissionAttributes)
+            self.assertEqual(
+                new_field.emission_scale_factors[0].attributes,
+                self.scal.attributes)
+        self.assertIs(copy.copy(self.field).attributes, self.field.attributes)
+
+    def test_copy_on_write(self):
+        self.field.data = np.zeros((10, 10))
+        new_field = self.field.copy(copy_data='on_write')
+        self.assertIs(new_field.data.base, self.field.data)
+        with self.assertRaises(ValueError):
+            new_field.data[0, 0] = 1.
+
+        e_attr = new_field.attributes[emissions.BEF_ATTR_NAME]
+        e_attr['hierarchy'] = 10
+        self.assertEqual(
+            self.field.attributes[emissions.BEF_ATTR_NAME]['hierarchy'], 2)
+        self.assertIsNot(new_field.emission_scale_factors,
+                         self.field.emission_scale_factors)
+        self.assertIs(new_field.emission_scale_factors[0], self.scal)
+
+        new_field.writable_data()[0, 0] = 1.
+        self.assertEqual(new_field.data[0, 0], 1.)
+        self.assertEqual(self.field.data[0, 0], 0.)
+
+        # the original field stays writable, and is copied on write
+        other_field = self.field.copy(copy_data='on_write')
+        self.field.data[0, 1] = 2.
+        self.field.writable_data()[0, 2] = 3.
+        self.assertEqual(self.field.data[0, 1], 2.)
+        self.assertEqual(self.field.data[0, 2], 3.)
+        self.assertEqual(other_field.data[0, 2], 0.)
+
+        # deep copies are writable, shared data is pickled once
+        other_field.copy(copy_data=True).data[0, 0] = 4.
+        fields = pickle.loads(pickle.dumps(
+            [self.field, other_field, other_field.copy(copy_data='on_write')],
+            2))
+        self.assertIs(fields[2].data.base, fields[1].data.base)
+        with self.assertRaises(ValueError):
+            fields[2].data[0, 0] = 1.
+
+    def test_duplicate(self):
+        ext = emissions.EmissionExt('Core', eid=0,
+                                    base_emission_fields=[self.field])
+        new_field = ext.base_emission_fields.get(name='GEIA_NO').duplicate(
+            name='GEIA_NO_IND')
+        self.assertEqual([f.name for f in ext.base_emission_fields],
+                         ['GEIA_NO', 'GEIA_NO_IND'])
+        self.assertIs(new_field.data.base, self.field.data)
+        self.assertIsNot(new_field.attributes, self.field.attributes)
+
+    def test_version(self):
+        ext = emissions.EmissionExt('Core', eid=0)
+        setup = emissions.Emissions([ext])
+        events = []
+        setup.subscribe(lambda source, event, objs: events.append(
+            (source, event, objs)))
+
+        version = setup.version
+        ext.base_emission_fields.add(self.field)
+        self.field.emission_scale_factors.remove_many([self.scal])
+        self.assertEqual(events, [
+            (ext.base_emission_fields, 'add', [self.field]),
+            (self.field.emission_scale_factors, 'remove', [self.scal])])
+        self.assertEqual(setup.version, version + 2)
+        self.assertEqual(ext.version, 2)
+
+        # subscriptions follow the removed fields and extensions
+        ext.base_emission_fields.remove_many([self.field])
+        self.field.emission_scale_factors.add(self.scal)
+        setup.extensions.remove_many([ext])
+        ext.base_emission_fields.add(self.field)
+        self.assertEqual(len(events), 4)
+
+        # subscriptions are restored in copies
+        new_setup = pickle.loads(pickle.dumps(setup, 2))
+        new_ext = emissions.EmissionExt('Ext', eid=1)
+        new_setup.extensions.add(new_ext)
+        version = new_setup.version
+        new_ext.base_emission_fields.add(self.field)
+        self.assertEqual(new_setup.version, version + 1)
+
+    def test_registry(self):
+        core = emissions.EmissionExt('Core', eid=0,
+                                     base_emission_fields=[self.field])
+        ext = emissions.EmissionExt('Ext', eid=1)
+        setup = emissions.Emissions([core, ext])
+        bef = setup.base_emission_fields
+        self.assertIs(setup.base_emission_fields, bef)
+        self.assertEqual(list(setup.scale_factors), [self.scal])
+
+        # a field attached to several extensions is registered once
+        ext.base_emission_fields.add(self.field)
+        core.base_emission_fields.remove_many([self.field])
+        self.assertEqual(list(bef), [self.field])
+        mask = emissions.GCField('MASK', 'MASK', 'xy', 'unitless', 'mask.nc')
+        emissions.mask(mask, 'MASK', '2000/1/1/0', fid=2)
+        self.field.emission_scale_factors.add(mask)
+        self.assertEqual(list(setup.scale_factors), [self.scal, mask])
+        self.assertEqual(setup.get_scalIDs(), [1, 2])
+
+        setup.extensions.remove_many([ext])
+        self.assertEqual(len(bef), 0)
+        self.assertEqual(len(setup.scale_factors), 0)
+        with self.assertRaises(ValueError):
+            bef.add(self.field)
+
+        setup.extensions.add(ext)
+        new_setup = pickle.loads(pickle.dumps(setup, 2))
+        self.assertEqual([f.name for f in new_setup.scale_factors],
+                         ['TOTFUEL', 'MASK'])
+
+    def test_get_by_id(self):
+        core = emissions.EmissionExt('Core', eid=0,
+                                     base_emission_fields=[self.field])
+        setup = emissions.Emissions([core])
+        self.assertIs(setup.get_scale_factor(1), self.scal)
+        self.assertIs(setup.get_extension(0), core)
+        with self.assertRaises(KeyError):
+            setup.get_scale_factor(2)
+
+        ext = emissions.EmissionExt('Ext', eid=0)
+        setup.extensions.add(ext)
+        self.assertIs(setup.get_extension(0), core)
+        setup.resolve_id()
+        self.assertIs(setup.get_extension(1), ext)
+
+        self.scal.attributes[emissions.SF_ATTR_NAME]['fid'] = 3
+        setup.touch([self.scal])
+        self.assertIs(setup.get_scale_factor(3), self.scal)
+        self.field.emission_scale_factors.remove_many([self.scal])
+        with self.assertRaises(KeyError):
+            setup.get_scale_factor(3)
+
+    def test_extension_id_in_place(self):
+        core = emissions.EmissionExt('Core', eid=0)
+        ext = emissions.EmissionExt('Ext', eid=101)
+        setup = emissions.Emissions([core, ext])
+        self.assertIs(setup.get_extension(101), ext)
+
+        # no touch() needed
+        ext.eid = 999
+        self.assertEqual(list(setup.extensions.filter(eid=999)), [ext])
+        self.assertIs(setup.get_extension(999), ext)
+        with self.assertRaises(KeyError):
+            setup.get_extension(101)
+
+        setup.check_id()
+        core.eid = 1
+        with self.assertRaises(ValueError):
+            setup.check_id()
+        self.assertIs(setup.get_extension(1), core)
+
+    def test_resolve_id(self):
+        scals = []
+        for name, fid in (('A', 10 ** 9), ('B', None), ('C', 10 ** 9),
+                          ('D', 5), ('E', None)):
+            scal = emissions.GCField(name, 'x', 'xy', 'unitless', 's.nc')
+            emissions.scale_factor(scal, name, '2000/1/1/0', fid=fid)
+            scals.append(scal)
+        self.field.emission_scale_factors.remove_many([self.scal])
+        self.field.emission_scale_factors.extend(scals)
+        setup = emissions.Emissions([
+            emissions.EmissionExt('Core', eid=0,
+                                  base_emission_fields=[self.field]),
+            emissions.EmissionExt('Ext', eid=0)])
+
+        with self.assertRaises(ValueError) as context:
+            setup.check_id()
+        message = str(context.exception)
+        for error in ("Missing scale factor fid for B, E",
+                      "Duplicate scale factor fid 1000000000 (C)",
+                      "Duplicate extension eid 0 (Ext)"):
+            self.assertIn(error, message)
+
+        resolved = setup.resolve_id()
+        self.assertEqual([(obj.name, old, new) for obj, old, new in resolved],
+                         [('B', None, 6), ('C', 10 ** 9, 7), ('E', None, 8),
+                          ('Ext', 0, 1)])
+        self.assertEqual(setup.get_scalIDs(), [10 ** 9, 6, 7, 5, 8])
+        setup.check_id()
+        self.assertEqual(setup.resolve_id(), [])
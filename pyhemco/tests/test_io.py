@@ -0,0 +1,440 @@
+import os
+import datetime
+import shutil
+import tempfile
+import unittest
+
+from pyhemco import io
+from pyhemco import emissions
+from pyhemco.datatypes import Query
+
+
+EXAMPLE_CONFIG = os.path.join(os.path.dirname(__file__), os.pardir,
+                              os.pardir, 'examples', 'HEMCO_Config')
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+CONFIG = """\
+### HEMCO INPUT FILE ###
+
+####################################################################################
+BEGIN SECTION SETTINGS
+####################################################################################
+Logfile: HEMCO.log
+Verbose: false
+END SECTION SETTINGS
+
+####################################################################################
+BEGIN SECTION BASE EMISSIONS
+####################################################################################
+# ExtNr Name sourceFile sourceVar sourceTime SrcDim SrcUnit Species ScalIDs Cat Hier
+0 GEIA_NO  geia.nc NO  1985/1-12/1/0 xy kg/m2/s NO  1/20   1 1
+0 GEIA_CO  geia.nc CO  1985/1/1/0    xy kg/m2/s CO  1/1000 1 1
+0 EDGAR_NO -       -   -             -  -       NO  20     1 2
+0 GFED_NO  2.29e-3 -   -             xy kg/kgDM NO  -      2 1
+END SECTION BASE EMISSIONS
+
+####################################################################################
+BEGIN SECTION SCALE FACTORS
+####################################################################################
+# ScalID Name sourceFile sourceVar sourceTime SrcDim SrcUnit Oper
+1  TOTFUEL  scalar.nc NOXscalar 1985-2008/1/1/0 xy unitless 1
+20 DOW_NOX  0.8/1.1/1.1/1.1/1.1/1.1/0.9 - - xy unitless 1
+END SECTION SCALE FACTORS
+
+####################################################################################
+BEGIN SECTION MASKS
+####################################################################################
+# ScalID Name sourceFile sourceVar sourceTime SrcDim SrcUnit Oper Lon1/Lat1/Lon2/Lat2
+1000 EMEP_MASK mask.nc MASK */*/*/* xy unitless 1 -30/30/45/70
+END SECTION MASKS
+
+####################################################################################
+BEGIN SECTION EXTENSION SWITCHES
+####################################################################################
+# ExtNr ExtName on/off Species
+101 SeaFlux  : on  DMS/ACET
+102 ParaNOx  : off NO
+    --> Setting : 1.0
+END SECTION EXTENSION SWITCHES
+
+####################################################################################
+BEGIN SECTION EXTENSION DATA
+####################################################################################
+# ExtNr Name sourceFile sourceVar sourceTime SrcDim SrcUnit Species ScalIDs Cat Hier
+102 SHIP_NO  ship.nc NO  2002/1-12/1/0 xy kg/m2/s NO   1000 1 1
+101 DMS_SEA  dms.nc  DMS 1985/1-12/1/0 xy nmol/L DMS  -    1 1
+101 ACET_SEA -       -   -             -  -      ACET -    1 1
+END SECTION EXTENSION DATA
+
+### END OF HEMCO INPUT FILE ###
+"""
+
+
+class TestReadConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'HEMCO_Config')
+        with open(self.filename, 'w') as cfg_file:
+            cfg_file.write(CONFIG)
+        self.cfg_lines = [line for line in CONFIG.splitlines()
+                          if line.strip()]
+
+    def _write(self, setup):
+        """Writes setup into a new file and returns its name."""
+        filename = os.path.join(self.tmpdir,
+                                'out{0}'.format(len(os.listdir(self.tmpdir))))
+        io.write_config_file(setup, filename)
+        return filename
+
+    def _assert_same_output(self, setup1, setup2):
+        """Asserts that both setups are written into the same file."""
+        with open(self._write(setup1)) as f1, \
+                open(self._write(setup2)) as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test_index_sections(self):
+        sections = io.index_sections(self.cfg_lines)
+        self.assertEqual(sorted(sections.keys()),
+                         ['BASE EMISSIONS', 'EXTENSION DATA',
+                          'EXTENSION SWITCHES', 'MASKS', 'SCALE FACTORS',
+                          'SETTINGS'])
+        first, last = sections['SCALE FACTORS']
+        self.assertTrue(self.cfg_lines[first - 1].startswith(
+            'BEGIN SECTION SCALE FACTORS'))
+        self.assertTrue(self.cfg_lines[last].startswith(
+            'END SECTION SCALE FACTORS'))
+        self.assertEqual(
+            sections['SCALE FACTORS'],
+            io.section_span(self.cfg_lines, 'BEGIN SECTION SCALE FACTORS',
+                            'END SECTION SCALE FACTORS'))
+
+        # readers of several sections locate them with the index only
+        def find_substr_index(strings, substring):
+            raise AssertionError('section scanned: ' + substring)
+        io.find_substr_index, default = find_substr_index, io.find_substr_index
+        try:
+            setup = emissions.Emissions([emissions.EmissionExt('Core', eid=0)])
+            io.read_base_emissions(setup, self.cfg_lines,
+                                   setup.get_extension(0))
+            io.read_extensions(setup, self.cfg_lines, read_all=True)
+        finally:
+            io.find_substr_index = default
+        self.assertEqual(len(setup.base_emission_fields), 7)
+
+    def test_read_scale_factors(self):
+        scal_table = io.read_scale_factors(self.cfg_lines)
+        self.assertEqual(sorted(scal_table.keys()), [1, 20, 1000])
+        self.assertEqual(scal_table[20].name, 'DOW_NOX')
+        self.assertTrue(scal_table[1000].is_mask())
+        self.assertIs(io.get_scale_factor(self.cfg_lines, 20,
+                                          scal_table=scal_table),
+                      scal_table[20])
+        self.assertIsNone(io.get_scale_factor(self.cfg_lines, 1000,
+                                              scal_table=scal_table))
+        self.assertIs(io.get_scale_factor(self.cfg_lines, 1000, isMask=True,
+                                          scal_table=scal_table),
+                      scal_table[1000])
+
+        # a malformed row of another section doesn't matter
+        cfg_lines = [line.replace('GFED_NO', 'GFED_NO x')
+                     for line in self.cfg_lines]
+        self.assertEqual(sorted(io.read_scale_factors(cfg_lines).keys()),
+                         [1, 20, 1000])
+        self.assertEqual(io.get_scale_factor(cfg_lines, 20).name, 'DOW_NOX')
+
+        scal = io.get_scale_factor(self.cfg_lines, 20)
+        self.assertEqual(scal.name, 'DOW_NOX')
+        self.assertEqual(len(scal.data), 7)
+        self.assertEqual(io.get_scale_factor(self.cfg_lines, 1).name,
+                         'TOTFUEL')
+        self.assertIsNone(io.get_scale_factor(self.cfg_lines, 1000))
+        mask = io.get_scale_factor(self.cfg_lines, 1000, isMask=True,
+                                   start='BEGIN SECTION MASKS',
+                                   end='END SECTION MASKS')
+        self.assertTrue(mask.is_mask())
+
+    def test_read_config_file(self):
+        setup = io.read_config_file(self.filename)
+        self.assertEqual([ext.name for ext in setup.extensions],
+                         ['Core', 'SeaFlux', 'ParaNOx'])
+        core = setup.extensions.get_object(name='Core')
+        self.assertEqual(core.settings, {'Logfile': 'HEMCO.log',
+                                         'Verbose': False})
+        self.assertEqual(list(core.settings), ['Logfile', 'Verbose'])
+        self.assertEqual([f.name for f in core.base_emission_fields],
+                         ['GEIA_NO', 'GEIA_CO', 'EDGAR_NO', 'GFED_NO'])
+
+        # empty file information: use the previous field of the extension
+        edgar = core.base_emission_fields.get_object(name='EDGAR_NO')
+        self.assertEqual(edgar.filename, 'geia.nc')
+        self.assertEqual(edgar.var_name, 'CO')
+        gfed = core.base_emission_fields.get_object(name='GFED_NO')
+        self.assertEqual(list(gfed.data), [2.29e-3])
+
+        # each extension gets its own fields
+        seaflux = setup.extensions.get_object(name='SeaFlux')
+        self.assertEqual([f.name for f in seaflux.base_emission_fields],
+                         ['DMS_SEA', 'ACET_SEA'])
+        self.assertEqual(seaflux.base_emission_fields[1].filename, 'dms.nc')
+        paranox = setup.extensions.get_object(name='ParaNOx')
+        self.assertFalse(paranox.enabled)
+        self.assertEqual(paranox.settings, {'Setting': '1.0'})
+        self.assertEqual([f.name for f in paranox.base_emission_fields],
+                         ['SHIP_NO'])
+
+        # scale factors and masks are shared between base fields
+        self.assertEqual(sorted(setup.get_scalIDs()), [1, 20, 1000])
+        geia_no = core.base_emission_fields.get_object(name='GEIA_NO')
+        geia_co = core.base_emission_fields.get_object(name='GEIA_CO')
+        self.assertIs(geia_no.emission_scale_factors[0],
+                      geia_co.emission_scale_factors[0])
+        self.assertIs(geia_no.emission_scale_factors[1],
+                      edgar.emission_scale_factors[0])
+        self.assertTrue(geia_co.emission_scale_factors[1].is_mask())
+
+        # query fields by their emission attributes
+        hierarchy = emissions.EmissionAttr('hierarchy')
+        core.base_emission_fields.create_index(hierarchy, kind='sorted')
+        self.assertIs(core.base_emission_fields.get_object(
+            Query(emissions.EmissionAttr('hierarchy')) > 1), edgar)
+
+    def test_to_table(self):
+        setup = io.read_config_file(self.filename)
+        table = setup.to_table()
+        self.assertEqual(list(table['name']),
+                         ['GEIA_NO', 'GEIA_CO', 'EDGAR_NO', 'GFED_NO',
+                          'DMS_SEA', 'ACET_SEA', 'SHIP_NO',
+                          'TOTFUEL', 'DOW_NOX', 'EMEP_MASK'])
+        self.assertEqual(list(table['eid'][:7]), [0, 0, 0, 0, 101, 101, 102])
+        self.assertEqual(list(table['fid'][7:]), [1, 20, 1000])
+        sel = (table['kind'] == 'base') & (table['hierarchy'] > 1)
+        self.assertEqual([f.name for f in table['field'][sel]], ['EDGAR_NO'])
+        mask = table[table['kind'] == 'mask'][0]
+        self.assertEqual(list(mask['mask_window']), [-30., 30., 45., 70.])
+        self.assertEqual(str(table['start'][0]), '1985-01-01T00:00:00')
+
+    def test_iter_config(self):
+        events = list(io.iter_config(self.filename))
+        counts = {}
+        for event in events:
+            name = type(event).__name__
+            counts[name] = counts.get(name, 0) + 1
+        self.assertEqual(counts, {'SettingEvent': 2, 'BaseFieldEvent': 7,
+                                  'ScaleFactorEvent': 2, 'MaskEvent': 1,
+                                  'ExtSwitchEvent': 2, 'ExtSettingEvent': 1})
+
+        edgar = events[4]
+        self.assertEqual((edgar.lineno, edgar.name, edgar.srcfile,
+                          edgar.scalIDs, edgar.hierarchy),
+                         (16, 'EDGAR_NO', 'geia.nc', [20], 2))
+        ext_setting = [e for e in events
+                       if isinstance(e, io.ExtSettingEvent)][0]
+        self.assertEqual((ext_setting.eid, ext_setting.name), (102, 'Setting'))
+
+        # early stop
+        no_files = []
+        for event in io.iter_config(self.filename):
+            if isinstance(event, io.ScaleFactorEvent):
+                break
+            if isinstance(event, io.BaseFieldEvent) and event.species == 'NO':
+                no_files.append(event.srcfile)
+        self.assertEqual(no_files, ['geia.nc', 'geia.nc', '-'])
+
+    def _read_sections(self, cfg_lines):
+        setup = emissions.Emissions([])
+        core = emissions.EmissionExt('Core', eid=0)
+        setup.extensions.add(core)
+        io.read_settings(core.settings, cfg_lines)
+        io.read_base_emissions(setup, cfg_lines, core)
+        io.read_extensions(setup, cfg_lines, read_all=True)
+        return setup
+
+    def test_read_sections(self):
+        self._assert_same_output(self._read_sections(self.cfg_lines),
+                                 io.read_config_file(self.filename))
+
+    def test_config_file(self):
+        with io.ConfigFile(self.filename) as cfg_file:
+            self.assertEqual(list(cfg_file), self.cfg_lines)
+            self.assertEqual(cfg_file[-1], self.cfg_lines[-1])
+            self.assertEqual(cfg_file.sections,
+                             io.index_sections(self.cfg_lines))
+            self.assertEqual(io.get_scale_factor(cfg_file, 20).name,
+                             'DOW_NOX')
+            self.assertIsNone(io.get_scale_factor(cfg_file, 1000))
+            mask = io.get_scale_factor(cfg_file, 1000, isMask=True,
+                                       start='BEGIN SECTION MASKS',
+                                       end='END SECTION MASKS')
+            self.assertTrue(mask.is_mask())
+
+            # same setup as read from the list of lines
+            self._assert_same_output(self._read_sections(cfg_file),
+                                     self._read_sections(self.cfg_lines))
+
+            # same events as read from the file, with the same line numbers
+            self.assertEqual(list(io.iter_config_lines(cfg_file)),
+                             list(io.iter_config(self.filename)))
+
+        # rows and sections of the file, as read by read_config_file
+        source = io.read_config_file(self.filename).config_source
+        self.assertEqual(sorted(row.event.lineno
+                                for row in source.rows.values()),
+                         [event.lineno
+                          for event in io.iter_config(self.filename)])
+        check = io.ConfigSource(self.filename)
+        with open(self.filename) as cfg_file:
+            check.track(cfg_file)
+        self.assertEqual(check.sections, source.sections)
+
+    def test_config_file_blank_lines(self):
+        text = 'A: 1\n  \nB: 2\n\t\n \nC: 3\r\n \nD: 4'
+        with open(self.filename, 'w') as cfg_file:
+            cfg_file.write(text)
+        with io.ConfigFile(self.filename) as cfg_file:
+            self.assertEqual(list(cfg_file),
+                             [line for line in text.splitlines()
+                              if line.strip()])
+
+    def test_write_config_file(self):
+        setup = io.read_config_file(self.filename)
+        self._assert_same_output(setup,
+                                 io.read_config_file(self._write(setup)))
+
+    def test_write_example(self):
+        out = os.path.join(self.tmpdir, 'out')
+        io.write_config_file(io.read_config_file(EXAMPLE_CONFIG), out)
+        with open(out, 'rb') as f:
+            written = f.read()
+
+        # HEMCO_Config.expected: output of the line-at-a-time writer, with
+        # settings in the order they are read (byte-for-byte)
+        with open(os.path.join(DATA_DIR, 'HEMCO_Config.expected'), 'rb') as f:
+            self.assertEqual(written, f.read())
+
+        # HEMCO_Config.baseline: output of the first writer, where settings
+        # came out in dictionary order. Only the order of the lines differs.
+        with open(os.path.join(DATA_DIR, 'HEMCO_Config.baseline'), 'rb') as f:
+            baseline = f.read()
+        self.assertEqual(sorted(written.splitlines()),
+                         sorted(baseline.splitlines()))
+
+    def test_row_filter(self):
+        row_filter = io.RowFilter(species=['NO'], categories=(1, 1))
+        setup = io.read_config_file(self.filename, read_all=False,
+                                    row_filter=row_filter)
+        core = setup.extensions.get_object(eid=0)
+        self.assertEqual([f.name for f in core.base_emission_fields],
+                         ['GEIA_NO', 'EDGAR_NO'])
+        # disabled extensions are not read
+        for ext in setup.extensions.filter(lambda ext: ext.eid != 0):
+            self.assertEqual(len(ext.base_emission_fields), 0)
+        # scale factors are created only if used
+        self.assertEqual(sorted(setup.get_scalIDs()), [1, 20])
+
+        # GEIA_CO and EDGAR_NO (1985/1/1/0), SHIP_NO (2002) are out of the
+        # time window
+        row_filter = io.RowFilter(
+            time_window=(datetime.datetime(1985, 3, 1),
+                         datetime.datetime(1986, 1, 1)))
+        setup = emissions.Emissions.load(self.filename, use_cache=False,
+                                         time_window=row_filter.time_window)
+        self.assertEqual(
+            [f.name for f in setup.base_emission_fields.sorted('name')],
+            ['ACET_SEA', 'DMS_SEA', 'GEIA_NO', 'GFED_NO'])
+
+    def test_reload_config_file(self):
+        setup = io.read_config_file(self.filename)
+        core = setup.extensions.get_object(eid=0)
+        geia_no = core.base_emission_fields.get_object(name='GEIA_NO')
+        dms_sea = setup.extensions.get_object(eid=101) \
+            .base_emission_fields.get_object(name='DMS_SEA')
+
+        new_config = (CONFIG
+                      .replace('Verbose: false', 'Verbose: true')
+                      .replace('NO  1/20   1 1', 'NO  1/20   1 3')
+                      .replace('0 GFED_NO  2.29e-3 -   -             xy '
+                               'kg/kgDM NO  -      2 1\n', ''))
+        with open(self.filename, 'w') as cfg_file:
+            cfg_file.write('\n\n' + new_config)
+
+        changes = setup.reload()
+        self.assertEqual(changes['added'], [])
+        self.assertEqual(sorted(changes['modified']),
+                         [('BASE EMISSIONS', (0, 'GEIA_NO'), 0),
+                          ('SETTINGS', 'Verbose', 0)])
+        self.assertEqual(changes['removed'],
+                         [('BASE EMISSIONS', (0, 'GFED_NO'), 0)])
+
+        # changed objects are updated in place, other objects are kept
+        self.assertIs(core.base_emission_fields.get_object(name='GEIA_NO'),
+                      geia_no)
+        self.assertEqual(geia_no.attributes[emissions.BEF_ATTR_NAME]['hierarchy'], 3)
+        self.assertIs(setup.extensions.get_object(eid=101)
+                      .base_emission_fields.get_object(name='DMS_SEA'),
+                      dms_sea)
+
+        # same result as reading the file again
+        self._assert_same_output(setup, io.read_config_file(self.filename))
+
+        # invalid scale factor: setup is not modified
+        with open(self.filename, 'w') as cfg_file:
+            cfg_file.write(new_config.replace('1/20   1 3', '1/21   1 3'))
+        with self.assertRaises(ValueError):
+            setup.reload()
+        self.assertEqual(len(geia_no.emission_scale_factors), 2)
+
+    def test_update_config_file(self):
+        setup = io.read_config_file(self.filename)
+        self.assertEqual(io.update_config_file(setup),
+                         {'added': [], 'modified': [], 'removed': []})
+
+        core = setup.extensions.get_object(eid=0)
+        core.settings['Verbose'] = True
+        geia_co = core.base_emission_fields.get_object(name='GEIA_CO')
+        geia_co.filename = 'geia_v2.nc'
+        new_field = emissions.GCField('NEW_NO', filename='new.nc',
+                                      var_name='NO', ndim=2, unit='kg/m2/s')
+        emissions.base_emission_field(new_field, 'NEW_NO', '2000/*/*/*',
+                                      'NO', 1, 1)
+        core.base_emission_fields.add(new_field, index=1)
+        core.base_emission_fields.get(name='GFED_NO').remove()
+        changes = io.update_config_file(setup)
+
+        # comments, layout and unchanged rows are kept as is
+        expected = (CONFIG
+            .replace('Verbose: false', 'Verbose: True')
+            .replace('0 GEIA_CO  geia.nc CO  1985/1/1/0    xy kg/m2/s CO  '
+                     '1/1000 1 1',
+                     '0 NEW_NO new.nc NO 2000/*/*/* xy kg/m2/s NO - 1 1\n'
+                     '0 GEIA_CO geia_v2.nc CO 1985/1/1/0 xy kg/m2/s CO '
+                     '1/1000 1 1')
+            # file information of the previous row has changed
+            .replace('0 EDGAR_NO -       -   -             -  -       NO  '
+                     '20     1 2',
+                     '0 EDGAR_NO geia.nc CO 1985/1/1/0 xy kg/m2/s NO '
+                     '20 1 2')
+            .replace('0 GFED_NO  2.29e-3 -   -             xy kg/kgDM NO  '
+                     '-      2 1\n', ''))
+        with open(self.filename) as cfg_file:
+            self.assertEqual(cfg_file.read(), expected)
+        self.assertEqual(sorted(changes['modified']),
+                         [('BASE EMISSIONS', (0, 'GEIA_CO'), 0),
+                          ('SETTINGS', 'Verbose', 0)])
+        self.assertEqual(changes['added'],
+                         [('BASE EMISSIONS', (0, 'NEW_NO'), 0)])
+        self.assertEqual(changes['removed'],
+                         [('BASE EMISSIONS', (0, 'GFED_NO'), 0)])
+
+        # same setup as the full file
+        self._assert_same_output(setup, io.read_config_file(self.filename))
+
+        # the setup is in sync with the new file
+        self.assertEqual(io.update_config_file(setup),
+                         {'added': [], 'modified': [], 'removed': []})
+        self.assertEqual(setup.reload(),
+                         {'added': [], 'modified': [], 'removed': []})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
@@ -60,6 +60,13 @@ class TestDatetimeSlicer(unittest.TestCase):
             self.assertListEqual(list(timetools.DatetimeSlicer(*dts['args'])),
                                  dts['iter'])
 
+    def test_span(self):
+        """Check overall time span."""
+        for dts in self.valid_dtslicers:
+            dts_obj = timetools.DatetimeSlicer(*dts['args'])
+            self.assertEqual(dts_obj.span(),
+                             (dts['iter'][0][0], dts['iter'][-1][1]))
+
     def test_invalid(self):
         """Check if error is returned for invalid string format."""
         for dts in self.invalid_dtslicers:
@@ -155,6 +155,20 @@ class DatetimeSlicer(object):
                     [str(e) for e in dt_elem]))
         return self._str_dt_sep.join(str_list)
     
+    def span(self):
+        """
+        Get the overall time span (start of the first slice, end of the last
+        slice), without iterating over the slices.
+        """
+        if not self.years:
+            return (datetime.min, datetime.max)
+        months = self.months or (1,)
+        days = self.days or (1,)
+        hours = self.hours or (0,)
+        from_dt = datetime(min(self.years), min(months), min(days), min(hours))
+        to_dt = datetime(max(self.years), max(months), max(days), max(hours))
+        return (from_dt, to_dt + self._interval)
+
     def __iter__(self):
         if not self.years:
             yield (datetime.min, datetime.max)
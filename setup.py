@@ -63,6 +63,7 @@ setup(
     #package_data={LIBNAME: get_package_data(os.path.join(LIBNAME, DATA_DIR),
     #                                        ('.*'))},
     scripts=[],
+    entry_points={'console_scripts': ['pyhemco = pyhemco.cli:main']},
     install_requires=["numpy>=1.7.0",
                       "python-dateutil>=1.5"]
 )